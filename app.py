@@ -4,15 +4,11 @@ from flask import Flask, redirect, url_for, flash, request, jsonify, session
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from flask_cors import CORS
 from extensions import limiter
 from email_utils import init_mail
 from dotenv import load_dotenv
-import sentry_sdk
-from sentry_sdk.integrations.flask import FlaskIntegration
-from prometheus_flask_exporter import PrometheusMetrics
 
 load_dotenv()
 
@@ -34,12 +30,16 @@ def create_app(test_config=None):
 
     if proxy_fix_enabled and not app.config.get('TESTING'):
         try:
-            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)
-            app.logger.info('Applied ProxyFix middleware (x_for=1, x_proto=1, x_host=1, x_port=1)')
+            # Number of trusted proxies in front of the app; rate limits key on
+            # the client address these report (e.g. 2 behind a CDN plus Render)
+            x_for = int(os.environ.get('PROXY_FIX_X_FOR', '1'))
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=x_for, x_proto=1, x_host=1, x_port=1)
+            app.logger.info('Applied ProxyFix middleware (x_for=%s, x_proto=1, x_host=1, x_port=1)', x_for)
         except Exception:
             app.logger.exception('Failed to apply ProxyFix middleware')
     
     # Initialize Prometheus metrics
+    from prometheus_flask_exporter import PrometheusMetrics
     metrics = PrometheusMetrics(app)
     
     # Track additional custom metrics
@@ -91,27 +91,34 @@ def create_app(test_config=None):
     
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    # Database connection pool settings
-    # Configure SQLAlchemy engine options. Skip pool sizing for SQLite (used in tests).
-    if not database_url.startswith('sqlite'):
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-            'pool_size': 10,
-            'pool_recycle': 3600,
-            'pool_pre_ping': True,  # Verify connections before using
-            'connect_args': {
-                'connect_timeout': 10,  # 10 second connection timeout
-                'options': '-c statement_timeout=30000'  # 30 second query timeout
-            }
-        }
-    else:
-        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+
+    # Database connection pool settings, sized per process type (web,
+    # worker, cli) or delegated to PgBouncer. Skipped for SQLite (tests).
+    from utils.db_pool import engine_options
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
+
+    # Optional read replicas (comma-separated). Each becomes a `replica_<n>`
+    # bind with the same pool settings; read-only requests are routed to
+    # them by utils.db_routing.
+    replica_url = app.config.get('DATABASE_REPLICA_URL') or os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        from utils.db_routing import replica_binds
+        replica_urls = [url.strip() for url in replica_url.split(',') if url.strip()]
+        app.config.setdefault('SQLALCHEMY_BINDS', {}).update({
+            key: dict(engine_options(url), url=url) for key, url in replica_binds(replica_urls).items()
+        })
+    app.config['DB_REPLICA_ROUTING'] = os.environ.get('DB_REPLICA_ROUTING', 'marked')
+    app.config['DB_REPLICA_PIN_SECONDS'] = float(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+    app.config['DB_REPLICA_MAX_LAG_SECONDS'] = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', 10))
+    app.config['DB_REPLICA_LAG_CHECK_SECONDS'] = float(os.environ.get('DB_REPLICA_LAG_CHECK_SECONDS', 15))
 
     # Initialize Sentry for error tracking (production only).
     # Do not initialize Sentry when running tests to avoid network calls/delays.
     sentry_dsn = os.environ.get('SENTRY_DSN')
     if sentry_dsn and not app.config.get('TESTING'):
         try:
+            import sentry_sdk
+            from sentry_sdk.integrations.flask import FlaskIntegration
             sentry_sdk.init(
                 dsn=sentry_dsn,
                 integrations=[FlaskIntegration()],
@@ -123,9 +130,9 @@ def create_app(test_config=None):
             # Ensure Sentry failures don't prevent app startup
             app.logger.exception('Sentry initialization failed; continuing without Sentry')
     
-    # Rate limiting storage
-    app.config.setdefault('RATELIMIT_STORAGE_URL', os.environ.get(
-        'REDIS_URL', 'redis://localhost:6379'))
+    # Rate limiting storage: Redis shared by all workers, in-memory fallback
+    from utils.rate_limit import configure_rate_limit_storage
+    configure_rate_limit_storage(app)
     
     # Session security settings
     app.config['SESSION_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'
@@ -197,12 +204,66 @@ def create_app(test_config=None):
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@unda.org')
     app.config['APP_URL'] = os.environ.get('APP_URL', 'http://127.0.0.1:5000')
+    # Queued email (tasks/email_tasks.py): invites and password emails go to
+    # the email worker (the Procfile `email` process) instead of holding the
+    # request on SMTP. On by default when a broker is configured; if it cannot
+    # be reached the email is sent in-process. The worker sends batches over
+    # one connection at EMAIL_SEND_RATE messages/second.
+    app.config['EMAIL_ASYNC'] = os.environ.get('EMAIL_ASYNC', 'True' if os.environ.get('REDIS_URL') else 'False') == 'True'
+    app.config['EMAIL_SEND_RATE'] = float(os.environ.get('EMAIL_SEND_RATE', 5))
+    app.config['EMAIL_BATCH_SIZE'] = int(os.environ.get('EMAIL_BATCH_SIZE', 50))
 
     # Feature flags (can be overridden via environment or test_config)
     app.config['USE_MEMBER_PORTAL_FOR_ADVOCATES'] = os.environ.get('USE_MEMBER_PORTAL_FOR_ADVOCATES', 'False')
     app.config['MEMBER_PORTAL_URL'] = os.environ.get('MEMBER_PORTAL_URL', '/member-portal')
     # New theme is opt-out by default now (set ENABLE_NEW_THEME=false to disable)
     app.config['ENABLE_NEW_THEME'] = os.environ.get('ENABLE_NEW_THEME', 'True') == 'True'
+
+    # Per-request SQL instrumentation (utils/sql_instrumentation.py)
+    app.config['SQL_INSTRUMENTATION_ENABLED'] = os.environ.get('SQL_INSTRUMENTATION_ENABLED', 'True') == 'True'
+    app.config['SQL_SLOW_QUERY_MS'] = float(os.environ.get('SQL_SLOW_QUERY_MS', 250))
+    app.config['SQL_SLOW_QUERY_SAMPLE_RATE'] = float(os.environ.get('SQL_SLOW_QUERY_SAMPLE_RATE', 0.1))
+
+    # Sampled request logging (utils/request_logging.py); 5xx and API
+    # 401/403 responses are always logged.
+    app.config['REQUEST_LOG_SAMPLE_RATE'] = float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', 0.01))
+    app.config['REQUEST_LOG_LEVEL'] = os.environ.get('REQUEST_LOG_LEVEL', 'INFO')
+
+    # Write-behind audit logging (utils/audit_sink.py). Tests write synchronously.
+    app.config['AUDIT_SINK_MODE'] = os.environ.get('AUDIT_SINK_MODE', 'sync' if app.config.get('TESTING') else 'async')
+    app.config['AUDIT_SINK_BACKEND'] = os.environ.get('AUDIT_SINK_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'memory')
+    app.config['AUDIT_SINK_REDIS_URL'] = os.environ.get('REDIS_URL')
+    app.config['AUDIT_SINK_BATCH_SIZE'] = int(os.environ.get('AUDIT_SINK_BATCH_SIZE', 100))
+    app.config['AUDIT_SINK_FLUSH_MS'] = int(os.environ.get('AUDIT_SINK_FLUSH_MS', 500))
+    app.config['AUDIT_SINK_QUEUE_SIZE'] = int(os.environ.get('AUDIT_SINK_QUEUE_SIZE', 10000))
+    # Failed batch inserts are requeued; rows are dropped after this many tries
+    app.config['AUDIT_SINK_MAX_ATTEMPTS'] = int(os.environ.get('AUDIT_SINK_MAX_ATTEMPTS', 5))
+
+    # Shared executor for endpoint_guard (utils/endpoint_guard.py); requests
+    # beyond workers + queue are rejected with 503.
+    app.config['ENDPOINT_GUARD_MAX_WORKERS'] = int(os.environ.get('ENDPOINT_GUARD_MAX_WORKERS', 16))
+    app.config['ENDPOINT_GUARD_MAX_QUEUE'] = int(os.environ.get('ENDPOINT_GUARD_MAX_QUEUE', 32))
+
+    # Asynchronous M-Pesa checkout (tasks/mpesa_tasks.py): queue the STK push
+    # on the payments worker and return 202 with a status URL.
+    app.config['MPESA_ASYNC_CHECKOUT'] = os.environ.get('MPESA_ASYNC_CHECKOUT', 'False') == 'True'
+    app.config['MPESA_STATUS_POLL_SECONDS'] = int(os.environ.get('MPESA_STATUS_POLL_SECONDS', 2))
+    # Pending payments older than this are re-checked with Daraja's stkpushquery
+    app.config['MPESA_STATUS_STALE_SECONDS'] = int(os.environ.get('MPESA_STATUS_STALE_SECONDS', 60))
+
+    # Affirmation fan-out (services/affirmation_delivery_service.py): champions
+    # per keyset page, and sender batches in flight per channel. With
+    # AFFIRMATION_FANOUT_ASYNC (on by default when a broker is configured) the
+    # fan-out endpoint queues the run on the `affirmations` worker; inline runs
+    # are refused above AFFIRMATION_FANOUT_INLINE_MAX champions.
+    app.config['AFFIRMATION_FANOUT_ASYNC'] = os.environ.get(
+        'AFFIRMATION_FANOUT_ASYNC', 'True' if os.environ.get('REDIS_URL') else 'False') == 'True'
+    app.config['AFFIRMATION_FANOUT_INLINE_MAX'] = int(os.environ.get('AFFIRMATION_FANOUT_INLINE_MAX', 200))
+    app.config['AFFIRMATION_FANOUT_CHUNK_SIZE'] = int(os.environ.get('AFFIRMATION_FANOUT_CHUNK_SIZE', 1000))
+    app.config['AFFIRMATION_SENDER_CONCURRENCY'] = int(os.environ.get('AFFIRMATION_SENDER_CONCURRENCY', 4))
+
+    # Maximum reports accepted by POST /api/checkin/batch
+    app.config['CHECKIN_BATCH_MAX_ITEMS'] = int(os.environ.get('CHECKIN_BATCH_MAX_ITEMS', 100))
     
     # Validate email configuration on startup
     email_config_warnings = []
@@ -223,8 +284,18 @@ def create_app(test_config=None):
     if test_config:
         app.config.update(test_config)
 
+    # The payments worker records each push on the idempotency entry that
+    # /checkout/status reads; with the per-process memory backend the web
+    # process never sees it and every checkout stays pending.
+    from utils.idempotency import backend_name
+    if app.config.get('MPESA_ASYNC_CHECKOUT') and backend_name() != 'redis' and not app.config.get('TESTING'):
+        raise RuntimeError('MPESA_ASYNC_CHECKOUT needs the redis idempotency backend; set REDIS_URL '
+                           '(and IDEMPOTENCY_BACKEND=redis if it is overridden)')
+
     # --- Initialization ---
     db.init_app(app)
+    from utils.db_pool import label_pools
+    label_pools(db, app)
     # If running with a local SQLite fallback and migrations are intentionally
     # skipped (useful for quick local development), ensure tables exist by
     # creating the schema inside the application's context. This avoids
@@ -510,14 +581,21 @@ def create_app(test_config=None):
     def ratelimit_handler(e):
         """Handle 429 Too Many Requests (rate limit exceeded)"""
         app.logger.warning('HTTP 429 rate limited: path=%s endpoint=%s', request.path, request.endpoint)
+        from utils.rate_limit import retry_after_seconds
+        retry_after = retry_after_seconds()
         if is_api_request():
-            return jsonify({
+            resp = jsonify({
                 'error': 'Too Many Requests',
                 'message': 'Rate limit exceeded. Please try again later.',
                 'status': 429
-            }), 429
-        flash('Too many requests. Please slow down and try again in a few minutes.', 'warning')
-        return redirect(request.referrer or url_for('auth.login'))
+            })
+            resp.status_code = 429
+        else:
+            flash('Too many requests. Please slow down and try again in a few minutes.', 'warning')
+            resp = redirect(request.referrer or url_for('auth.login'))
+        if retry_after:
+            resp.headers['Retry-After'] = str(retry_after)
+        return resp
     
     @app.errorhandler(500)
     def internal_error(e):
@@ -583,66 +661,25 @@ def create_app(test_config=None):
         # Prevent redirect loops - directly redirect to login without using url_for in request context
         return redirect('/auth/login')
 
-    # Diagnostic: log the endpoint and whether the view function is marked
-    # as CSRF-exempt. This will help identify why CSRFProtect still blocks
-    # certain API requests in deployed environments.
-    @app.before_request
-    def log_endpoint_csrf_status():
-        try:
-            endpoint = request.endpoint
-            vf = app.view_functions.get(endpoint) if endpoint else None
-            csrf_flag = False
-            if vf:
-                csrf_flag = bool(getattr(vf, 'csrf_exempt', False) or getattr(vf, 'exempt', False) or getattr(vf, '_csrf_exempt', False))
-            app.logger.info('Request debug: path=%s endpoint=%s csrf_exempt=%s', request.path, endpoint, csrf_flag)
-        except Exception:
-            app.logger.exception('Failed to log endpoint CSRF status')
+    # Sampled structured request logging; replaces the per-request INFO
+    # diagnostics and performs the one-time cookie-domain mismatch warning.
+    from utils.request_logging import init_request_logging
+    init_request_logging(app)
 
-    @app.before_request
-    def debug_auth_state_for_api():
-        # Lightweight diagnostics for API auth issues. Logs only presence of
-        # cookies (names) and whether Flask-Login has an authenticated user.
-        try:
-            if request.path.startswith('/api'):
-                cookie_keys = list(request.cookies.keys())
-                auth_hdr = bool(request.headers.get('Authorization'))
-                is_auth = False
-                try:
-                    from flask_login import current_user
-                    is_auth = bool(current_user and current_user.is_authenticated)
-                except Exception:
-                    is_auth = False
-                app.logger.info('Auth debug: path=%s is_api=True authenticated=%s auth_header=%s cookies=%s',
-                                request.path, is_auth, auth_hdr, cookie_keys)
-        except Exception:
-            app.logger.exception('Failed to log auth debug info')
+    # Flask-Limiter setup (Redis-backed, keyed per user/JWT sub/client IP)
+    limiter.init_app(app)
 
-    # One-time cookie-domain mismatch warning: if `SESSION_COOKIE_DOMAIN` is
-    # configured but doesn't appear to cover the incoming request host, log a
-    # warning to help triage CSRF/session issues caused by cross-domain cookies.
-    @app.before_request
-    def warn_cookie_domain_mismatch():
-        try:
-            cfg = app.config.get('SESSION_COOKIE_DOMAIN')
-            if not cfg:
-                return
-            # Only log once per process startup
-            if app.config.get('_COOKIE_DOMAIN_MISMATCH_LOGGED'):
-                return
-            host = request.host.split(':')[0] if request.host else ''
-            # Ignore expected platform host checks that don't use the primary cookie domain.
-            if host.endswith('.onrender.com'):
-                return
-            # Normalise leading dot
-            norm = cfg[1:] if cfg.startswith('.') else cfg
-            if host and not (host == norm or host.endswith('.' + norm)):
-                app.logger.warning('SESSION_COOKIE_DOMAIN is set to "%s" but request host is "%s" - this may prevent browsers from sending session cookies and cause CSRF/401 errors.', cfg, host)
-                app.config['_COOKIE_DOMAIN_MISMATCH_LOGGED'] = True
-        except Exception:
-            pass
+    # Query count, DB time and slow-query log per request
+    from utils.sql_instrumentation import init_sql_instrumentation
+    init_sql_instrumentation(app)
 
-    # Flask-Limiter setup (using Redis for persistent rate limits)
-    limiter.init_app(app)
+    # Send reads of replica-routed requests to DATABASE_REPLICA_URL
+    from utils.db_routing import init_db_routing
+    init_db_routing(app)
+
+    # Batched, write-behind audit log inserts
+    from utils.audit_sink import audit_sink
+    audit_sink.init_app(app)
     
     # Note: Event submission tracking columns are now created by Alembic migration
     # (add_event_submission_tracking.py) using conditional logic to avoid duplicates
@@ -704,6 +741,8 @@ def create_app(test_config=None):
     # M-Pesa Payment Integration
     from blueprints.mpesa import mpesa_bp
     app.register_blueprint(mpesa_bp)
+    # Safaricom posts STK results server-to-server without a CSRF token
+    csrf.exempt(app.view_functions['mpesa.mpesa_callback'])
     
     # Defensive: ensure the specific JSON API login endpoint is exempted from CSRF
     # protection. In some deployment setups the blueprint-level exemption may be
@@ -800,6 +839,14 @@ def create_app(test_config=None):
     except Exception:
         app.logger.exception('Failed to exempt api.submit_checkin')
 
+    try:
+        batch_view = app.view_functions.get('api.submit_checkin_batch')
+        if batch_view:
+            csrf.exempt(batch_view)
+            app.logger.info('CSRF exempted for endpoint api.submit_checkin_batch')
+    except Exception:
+        app.logger.exception('Failed to exempt api.submit_checkin_batch')
+
     try:
         token_submit = app.view_functions.get('api_token.token_submit_checkin')
         if token_submit:
@@ -981,8 +1028,17 @@ def create_app(test_config=None):
         }
 
     # --- Database Setup/Migration ---
-    # Initialize Flask-Migrate for database migrations
-    migrate = Migrate(app, db)
+    # Initialize Flask-Migrate for database migrations (the `flask db`
+    # commands). Alembic is slow to import and tests and Celery workers
+    # never migrate, so they skip it.
+    if not app.config.get('TESTING') and os.environ.get('APP_PROCESS_TYPE', 'web').lower() != 'worker':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Compile per-endpoint CSRF/auth/role metadata now that every blueprint
+    # and exemption is registered; request hooks read it with one lookup.
+    from utils.endpoint_registry import build_endpoint_registry
+    build_endpoint_registry(app, csrf)
 
     return app, limiter
 
@@ -996,17 +1052,22 @@ def flask_app_factory():
     app, _ = create_app()
     return app
 
-# Expose `app` as the Flask CLI entrypoint (it is a factory callable).
-# For production WSGI servers that import `app:app`, expose the actual
-# Flask application instance (not the factory) so the server receives a
-# WSGI callable. This calls the factory at import time which is acceptable
-# in production; tests can continue to call `create_app()` directly.
-try:
-    app = flask_app_factory()
-except Exception:
-    # Fall back to exposing the factory callable if initialization fails
-    # (keeps behavior stable for test environments or incomplete config).
-    app = flask_app_factory
+
+# WSGI servers importing `app:app` and scripts doing `from app import app`
+# get an application built on first access. Importing this module does not
+# build one, so tests, Celery workers and CLI commands that only need
+# `create_app` don't pay for (or connect to) a second app.
+_app_instance = None
+
+
+def __getattr__(name):
+    global _app_instance
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app_instance is None:
+        _app_instance = flask_app_factory()
+    return _app_instance
+
 
 if __name__ == '__main__':
     _app, limiter = create_app()
@@ -0,0 +1,74 @@
+"""Time an affirmation fan-out over many champions.
+
+Usage: python3 benchmarks/affirmation_fanout_bench.py [champions] [chunk_size]
+
+Seeds `champions` active champions (default 50000; half with an email
+address, the rest reachable by SMS) into a throwaway SQLite file, or into
+BENCH_DATABASE_URL, then runs `fan_out_affirmation` once and prints the
+rows/second and the summary. The email sender is replaced with one that
+only counts messages, so the figure covers paging, the bulk inserts and the
+sender pool rather than SMTP or the broker.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app  # noqa: E402
+from models import Champion, DailyAffirmation, db  # noqa: E402
+from services import affirmation_delivery_service as fanout  # noqa: E402
+
+
+class CountingEmailSender(fanout.EmailSender):
+    def send(self, affirmation, champions):
+        return len(champions)
+
+
+def _seed(count):
+    table = Champion.__table__
+    batch = []
+    for i in range(count):
+        batch.append({
+            'full_name': f'Bench Champion {i}', 'gender': 'Female', 'phone_number': f'07{i:08d}',
+            'assigned_champion_code': f'BENCH-{i:06d}', 'champion_status': 'Active',
+            'email': f'bench{i}@example.com' if i % 2 == 0 else None,
+        })
+        if len(batch) == 5000:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    affirmation = DailyAffirmation(content='You are enough', theme='Bench', times_sent=0)
+    db.session.add(affirmation)
+    db.session.commit()
+    return affirmation.affirmation_id
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fanout-bench-'), 'bench.db')
+    app, _ = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': url, 'SQL_INSTRUMENTATION_ENABLED': False})
+    fanout.CHANNEL_SENDERS['email'] = CountingEmailSender()
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        affirmation_id = _seed(count)
+        print(f'Seeded {count} champions in {time.perf_counter() - started:.1f}s ({url})')
+
+        summary = fanout.fan_out_affirmation(affirmation_id, chunk_size=chunk_size)
+        seconds = summary['duration_seconds']
+        print(f"Fan-out: {summary['recorded']} deliveries in {seconds:.2f}s "
+              f"({summary['recorded'] / max(seconds, 1e-9):,.0f} rows/s, chunk {chunk_size})")
+        print(summary)
+        if not os.environ.get('BENCH_DATABASE_URL'):
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
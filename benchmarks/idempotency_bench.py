@@ -0,0 +1,89 @@
+"""Throughput of idempotency reserve/update under contention.
+
+Each of --threads workers loops over a shared pool of --keys keys: reserve,
+then update with a meta field unique to the worker. With fewer keys than
+threads most reservations collide, like double-clicked checkouts. Reports
+operations per second, reservation wins, and lost updates (meta fields
+missing afterwards, which a read-merge-write update can drop).
+
+Usage: python3 benchmarks/idempotency_bench.py [--backend memory|redis|both] [--threads 16] [--keys 8] [--ops 2000]
+  The redis backend uses REDIS_URL (default redis://localhost:6379/0).
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import idempotency
+
+
+def run(backend, threads, keys, ops):
+    idempotency.set_backend(backend)
+    run_id = uuid.uuid4().hex[:8]
+    pool = [f'bench-{run_id}-{i}' for i in range(keys)]
+    wins = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(ops):
+            key = pool[(i + n) % keys]
+            if idempotency.reserve_key(key, meta={'worker': n}, ttl=300):
+                wins[n] += 1
+            idempotency.update_key(key, status='success', response={'i': i}, meta={f'w{n}': i}, ttl=300)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    # Every worker touched every key when ops >= keys
+    lost = 0
+    for key, entry in idempotency.get_keys(pool).items():
+        meta = entry.get('meta') or {}
+        lost += sum(1 for n in range(threads) if f'w{n}' not in meta)
+    total_ops = threads * ops * 2
+    return {
+        'ops_per_sec': total_ops / elapsed,
+        'elapsed': elapsed,
+        'reserved': sum(wins),
+        'lost_updates': lost,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Idempotency store benchmark')
+    parser.add_argument('--backend', choices=['memory', 'redis', 'both'], default='both')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--keys', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=2000, help='reserve+update pairs per thread')
+    args = parser.parse_args()
+
+    backends = {'memory': idempotency.MemoryBackend}
+    if args.backend in ('redis', 'both'):
+        backend = idempotency.RedisBackend()
+        try:
+            backend._redis().ping()
+            backends['redis'] = lambda: backend
+        except Exception as e:
+            print(f'Skipping redis backend ({e})')
+    if args.backend == 'redis':
+        backends.pop('memory')
+
+    print(f'{args.threads} threads x {args.ops} reserve+update pairs over {args.keys} keys')
+    for name, factory in backends.items():
+        result = run(factory(), args.threads, args.keys, args.ops)
+        print(f"  {name:<7} {result['ops_per_sec']:>10.0f} ops/s  {result['elapsed']:.2f}s  "
+              f"reserved={result['reserved']}  lost_updates={result['lost_updates']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Measure per-request overhead of request logging.
+
+Usage: python3 benchmarks/request_logging_bench.py [requests]
+
+Runs the same no-op request through the Flask test client with:
+  off      REQUEST_LOG_SAMPLE_RATE=0
+  sampled  REQUEST_LOG_SAMPLE_RATE=0.05
+  full     REQUEST_LOG_SAMPLE_RATE=1.0
+  legacy   the former per-request INFO hooks (f-string auth/CSRF diagnostics)
+
+Records go to a handler writing to os.devnull, so formatting and I/O costs
+are included. Prints the best-of-5 mean time per request and the overhead
+over `off`.
+"""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app  # noqa: E402
+from utils.request_logging import request_logger  # noqa: E402
+
+MODES = {
+    'off': 0.0,
+    'sampled': 0.05,
+    'full': 1.0,
+    'legacy': 0.0,
+}
+
+ROUNDS = 5
+
+
+def _install_legacy_hooks(app):
+    from flask import request
+    from flask_login import current_user
+
+    @app.before_request
+    def legacy_request_debug():
+        endpoint = request.endpoint
+        view = app.view_functions.get(endpoint) if endpoint else None
+        app.logger.info(f"Request debug: path={request.path} endpoint={endpoint} csrf_exempt={bool(getattr(view, 'csrf_exempt', False))}")
+        app.logger.info(
+            f"Auth debug: path={request.path} authenticated={current_user.is_authenticated} "
+            f"auth_header={bool(request.headers.get('Authorization'))} cookies={list(request.cookies.keys())}"
+        )
+
+
+def _make_app(mode, sink):
+    app, _ = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RATELIMIT_ENABLED': False,
+        'SQL_INSTRUMENTATION_ENABLED': False,
+        'REQUEST_LOG_SAMPLE_RATE': MODES[mode],
+    })
+    app.logger.handlers = [sink]
+    app.logger.setLevel(logging.INFO)
+    if mode == 'legacy':
+        _install_legacy_hooks(app)
+
+    @app.route('/_bench/noop')
+    def bench_noop():
+        return 'ok'
+
+    return app
+
+
+def run(total):
+    sink = logging.StreamHandler(open(os.devnull, 'w'))
+    request_logger.handlers = [sink]
+    request_logger.propagate = False
+    request_logger.setLevel(logging.INFO)
+
+    results = {}
+    for mode in MODES:
+        app = _make_app(mode, sink)
+        client = app.test_client()
+        client.set_cookie('session_hint', 'x')
+        for _ in range(min(200, total)):
+            client.get('/_bench/noop')
+        # Best of several rounds to damp scheduler noise
+        rounds = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            for _ in range(total):
+                client.get('/_bench/noop')
+            rounds.append((time.perf_counter() - start) / total * 1e6)
+        results[mode] = min(rounds)
+
+    baseline = results['off']
+    print(f'{"mode":<10}{"us/request":>12}{"overhead":>12}')
+    for mode, micros in results.items():
+        print(f'{mode:<10}{micros:>12.1f}{micros - baseline:>+12.1f}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
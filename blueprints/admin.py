@@ -16,6 +16,7 @@ import json
 from services.admin_metrics import get_dashboard_metrics
 from dataclasses import asdict
 from extensions import limiter
+from utils.query_options import with_load_options
 import json
 import re
 
@@ -74,17 +75,6 @@ def flash(message, category='message'):
     return flask_flash(message, category)
 
 
-@admin_bp.before_app_request
-def _debug_auth_state():
-    # Verbose per-request auth state logging for triage
-    try:
-        current_app.logger.info(
-            f"admin.before_app_request: endpoint={request.endpoint} path={request.path} method={request.method} "
-            + f"authenticated={getattr(current_user,'is_authenticated',False)} username={getattr(current_user,'username',None)} role={getattr(current_user,'role',None)} cookies={list(request.cookies.keys())}"
-        )
-    except Exception:
-        pass
-
 # Pages we track for personalization (id, display name, endpoint)
 TRACKABLE_ADMIN_PAGES = {
     'admin.podcasts': ('podcasts', 'Manage Podcasts'),
@@ -2080,7 +2070,7 @@ def workstream_events():
     program_filter = request.args.get('program', 'all')
     status_filter = request.args.get('status', 'all')
 
-    base_query = Event.query
+    base_query = with_load_options(Event.query, 'admin.workstream_events')
     if program_filter != 'all':
         allowed_types = WORKSTREAM_EVENT_TYPE_MAP.get(program_filter, [])
         if allowed_types:
@@ -2286,7 +2276,7 @@ def podcasts():
     status_filter = request.args.get('status', 'all')
     category_filter = request.args.get('category', 'all')
     
-    query = Podcast.query
+    query = with_load_options(Podcast.query, 'admin.podcasts')
     
     # Filter by status
     if status_filter == 'published':
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_login import login_required, current_user
 from models import db, DailyAffirmation, AffirmationDelivery, Champion
 from decorators import supervisor_required, admin_required
@@ -214,6 +214,13 @@ def create_delivery():
             'success': False,
             'message': 'Affirmation or Champion not found'
         }), 404
+
+    if AffirmationDelivery.query.filter_by(affirmation_id=data['affirmation_id'],
+                                           champion_id=data['champion_id']).first():
+        return jsonify({
+            'success': False,
+            'message': 'Affirmation already delivered to this champion'
+        }), 409
     
     delivery = AffirmationDelivery(
         affirmation_id=data['affirmation_id'],
@@ -234,6 +241,47 @@ def create_delivery():
     }), 201
 
 
+@affirmations_bp.route('/<int:affirmation_id>/fan-out', methods=['POST'])
+@login_required
+@admin_required
+def fan_out(affirmation_id):
+    """Deliver an affirmation to every active champion not yet reached."""
+    from services.affirmation_delivery_service import fan_out_affirmation, pending_champion_count
+
+    data = request.get_json(silent=True) or {}
+    channels = data.get('channels')
+    if channels is not None and not isinstance(channels, list):
+        return jsonify({'success': False, 'message': 'channels must be a list'}), 400
+
+    if not db.session.get(DailyAffirmation, affirmation_id):
+        return jsonify({'success': False, 'message': 'Affirmation not found'}), 404
+
+    if current_app.config.get('AFFIRMATION_FANOUT_ASYNC'):
+        from tasks.affirmation_tasks import enqueue_fan_out
+        try:
+            enqueue_fan_out(affirmation_id, channels)
+        except Exception:
+            current_app.logger.exception('Failed to enqueue affirmation fan-out')
+            return jsonify({'success': False, 'message': 'Delivery queue temporarily unavailable'}), 503
+        return jsonify({'success': True, 'message': 'Affirmation delivery queued'}), 202
+
+    # Inline runs send in this request; a full roster belongs on the worker
+    inline_max = current_app.config.get('AFFIRMATION_FANOUT_INLINE_MAX', 200)
+    if pending_champion_count(affirmation_id) > inline_max:
+        return jsonify({
+            'success': False,
+            'message': f'More than {inline_max} champions to reach; enable AFFIRMATION_FANOUT_ASYNC '
+                       'to run this fan-out on the worker',
+        }), 409
+
+    try:
+        summary = fan_out_affirmation(affirmation_id, channels)
+    except ValueError as e:
+        status = 404 if 'not found' in str(e) else 400
+        return jsonify({'success': False, 'message': str(e)}), status
+    return jsonify({'success': True, 'message': 'Affirmation delivered', 'summary': summary}), 200
+
+
 @affirmations_bp.route('/deliveries/<int:delivery_id>/engagement', methods=['PUT'])
 @login_required
 def update_engagement(delivery_id):
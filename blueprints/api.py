@@ -2,6 +2,14 @@ from flask import Blueprint, jsonify, request, g, current_app
 from flask import make_response
 from models import db, Champion, YouthSupport, User, RefferalPathway, TrainingRecord, Event, BlogPost
 from sqlalchemy import func
+from services.checkin_service import (
+    checkin_values, parse_reporting_period,
+    submit_checkin as submit_checkin_report, submit_checkins as submit_checkin_reports,
+)
+from utils.idempotency import get_keys, update_key
+from utils.db_routing import use_replica
+from utils.endpoint_registry import mark_auth
+from extensions import limiter, LOGIN_LIMIT
 from datetime import datetime, date, timezone
 from flask import request
 from flask_login import login_required, current_user
@@ -77,12 +85,13 @@ def api_auth_optional(f):
         if _check_api_token():
             return f(*args, **kwargs)
         return jsonify({'error': 'Unauthorized'}), 401
-    return wrapper
+    return mark_auth(wrapper, 'token')
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 
 @api_bp.route('/auth/login', methods=['POST'])
+@limiter.limit(LOGIN_LIMIT)
 def api_auth_login():
     if not request.is_json:
         return jsonify({'error': 'Expected application/json'}), 400
@@ -425,6 +434,7 @@ def api_auth_me_avatar():
 
 
 @api_bp.route('/impact-stats', methods=['GET'])
+@use_replica
 def impact_stats():
     """
     Comprehensive impact statistics endpoint for UNDA Youth Network.
@@ -613,6 +623,7 @@ def impact_stats():
 
 
 @api_bp.route('/impact-stats/summary', methods=['GET'])
+@use_replica
 def impact_stats_summary():
     """
     Quick summary of key impact metrics.
@@ -811,50 +822,147 @@ def submit_checkin():
         return jsonify({'error': 'Champion profile not found for current user'}), 404
 
     # Parse reporting_period
-    rp = data.get('reporting_period')
-    if not rp:
-        reporting_period = date.today()
-    else:
-        try:
-            reporting_period = datetime.strptime(rp, '%Y-%m-%d').date()
-        except Exception:
-            return jsonify({'error': 'Invalid reporting_period format. Use YYYY-MM-DD'}), 400
+    try:
+        reporting_period = parse_reporting_period(data.get('reporting_period'))
+    except ValueError:
+        return jsonify({'error': 'Invalid reporting_period format. Use YYYY-MM-DD'}), 400
 
     # Token-based checkins are handled by the token-only blueprint (api_token_bp)
     # which enforces stricter token + JSON checks. For authenticated session users
     # we keep the ability to submit via the same URL but only if logged in.
     try:
-        # Find existing or create new record (session-auth flow)
-        report = YouthSupport.query.filter_by(champion_id=champion.champion_id, reporting_period=reporting_period).first()
-        if not report:
-            report = YouthSupport(champion_id=champion.champion_id, reporting_period=reporting_period)
-
-        if 'number_of_youth_under_support' in data:
-            report.number_of_youth_under_support = int(data.get('number_of_youth_under_support') or 0)
-        if 'weekly_check_in_completion_rate' in data:
-            report.weekly_check_in_completion_rate = float(data.get('weekly_check_in_completion_rate') or 0)
-        if 'monthly_mini_screenings_delivered' in data:
-            report.monthly_mini_screenings_delivered = int(data.get('monthly_mini_screenings_delivered') or 0)
-        if 'referrals_initiated' in data:
-            report.referrals_initiated = int(data.get('referrals_initiated') or 0)
-        if 'flags_and_concerns_logged' in data:
-            report.flags_and_concerns_logged = data.get('flags_and_concerns_logged')
-
-        # Red-flag logic remains the same
-        try:
-            if report.weekly_check_in_completion_rate is not None and float(report.weekly_check_in_completion_rate) < 50:
-                report.flag_timestamp = datetime.now(timezone.utc)
-            if report.flags_and_concerns_logged:
-                report.flag_timestamp = datetime.now(timezone.utc)
-        except Exception:
-            pass
-
-        db.session.add(report)
-        db.session.commit()
+        # Single INSERT ... ON CONFLICT DO UPDATE keyed by (champion, period)
+        report_id, flagged = submit_checkin_report(champion.champion_id, reporting_period, data)
 
-        return jsonify({'success': True, 'report_id': report.support_id, 'flagged': bool(report.flag_timestamp)}), 201
+        return jsonify({'success': True, 'report_id': report_id, 'flagged': flagged}), 201
 
     except Exception as e:
         db.session.rollback()
         current_app.logger.exception('Error submitting check-in')
         return jsonify({'error': str(e)}), 500
+
+
+def _checkin_idempotency_key(champion_id, key):
+    return f'checkin:{champion_id}:{key}'
+
+
+def _load_checkin_replays(keys):
+    """Return stored batch results for already-applied idempotency keys.
+
+    Returns None when the idempotency store is unreachable. The upsert is
+    itself idempotent per (champion, period), so items are then re-applied.
+    """
+    try:
+        entries = get_keys(keys)
+    except Exception:
+        current_app.logger.warning('Idempotency store unavailable; re-applying batch check-ins')
+        return None
+    return {key: entry.get('response') for key, entry in entries.items() if entry.get('status') == 'success'}
+
+
+@api_bp.route('/checkin/batch', methods=['POST'])
+@api_auth_optional
+def submit_checkin_batch():
+    """Submit many weekly check-ins in one request (offline field sync).
+
+    Expected JSON: { 'reports': [ { 'reporting_period': 'YYYY-MM-DD', 'champion_id': int (token
+    automation only), 'idempotency_key': str (optional), ...check-in fields } ] }
+
+    Items are validated in one pass; valid items are upserted in a single
+    transaction. The response lists a result per item in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    reports = data.get('reports')
+    if not isinstance(reports, list) or not reports:
+        return jsonify({'error': 'reports must be a non-empty list'}), 400
+    max_items = int(current_app.config.get('CHECKIN_BATCH_MAX_ITEMS', 100))
+    if len(reports) > max_items:
+        return jsonify({'error': f'At most {max_items} reports per batch'}), 413
+
+    # Session users and JWT users may only submit for their own champion
+    # profile. Only the automation token (API_SMOKE_TOKEN) and admin or
+    # supervisor JWTs may name the champion on each item.
+    own_champion_id = None
+    if current_user and current_user.is_authenticated:
+        own_champion_id = current_user.champion_id
+        if not own_champion_id:
+            return jsonify({'error': 'Champion profile not found for current user'}), 404
+    elif getattr(g, 'jwt_payload', None):
+        try:
+            user = db.session.get(User, int(g.jwt_payload.get('sub')))
+        except (TypeError, ValueError):
+            user = None
+        if not user:
+            return jsonify({'error': 'Forbidden'}), 403
+        if user.role not in (User.ROLE_ADMIN, User.ROLE_SUPERVISOR):
+            own_champion_id = user.champion_id
+            if not own_champion_id:
+                return jsonify({'error': 'Only champions can submit their own check-ins'}), 403
+
+    results = [None] * len(reports)
+    pending = []  # (index, champion_id, reporting_period, values, idempotency key)
+    for index, item in enumerate(reports):
+        if not isinstance(item, dict):
+            results[index] = {'index': index, 'status': 'error', 'error': 'Report must be an object'}
+            continue
+        try:
+            champion_id = item.get('champion_id', data.get('champion_id'))
+            champion_id = int(champion_id) if champion_id is not None else own_champion_id
+            if champion_id is None:
+                raise ValueError('Missing champion_id')
+            if own_champion_id is not None and champion_id != own_champion_id:
+                raise ValueError('Cannot submit check-ins for another champion')
+            try:
+                reporting_period = parse_reporting_period(item.get('reporting_period'))
+            except ValueError:
+                raise ValueError('Invalid reporting_period format. Use YYYY-MM-DD')
+            values = checkin_values(item)
+        except (TypeError, ValueError) as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+            continue
+        key = item.get('idempotency_key')
+        pending.append((index, champion_id, reporting_period, values,
+                        _checkin_idempotency_key(champion_id, key) if key else None))
+
+    # One query to confirm every referenced champion exists
+    champion_ids = {champion_id for _, champion_id, _, _, _ in pending}
+    known = {cid for (cid,) in db.session.query(Champion.champion_id).filter(Champion.champion_id.in_(champion_ids))} if champion_ids else set()
+    keys = [key for *_, key in pending if key]
+    replays = _load_checkin_replays(keys) if keys else {}
+    record_keys = replays is not None
+    replays = replays or {}
+
+    to_write = []
+    for entry in pending:
+        index, champion_id, reporting_period, values, key = entry
+        if champion_id not in known:
+            results[index] = {'index': index, 'status': 'error', 'error': 'Champion profile not found'}
+        elif key in replays:
+            results[index] = dict(replays[key], index=index, replayed=True)
+        else:
+            to_write.append(entry)
+
+    if to_write:
+        try:
+            written = submit_checkin_reports([(cid, period, values) for _, cid, period, values, _ in to_write])
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Error submitting check-in batch')
+            return jsonify({'error': str(e)}), 500
+
+        for index, champion_id, reporting_period, _, key in to_write:
+            report_id, flagged = written[(champion_id, reporting_period)]
+            results[index] = {'index': index, 'status': 'ok', 'report_id': report_id, 'flagged': flagged}
+            if key and record_keys:
+                try:
+                    update_key(key, status='success', response={'status': 'ok', 'report_id': report_id, 'flagged': flagged})
+                except Exception:
+                    current_app.logger.warning('Failed to record idempotency key for batch check-in')
+
+    accepted = sum(1 for r in results if r['status'] == 'ok')
+    return jsonify({
+        'success': accepted == len(results),
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results,
+    }), 200
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime, date, timezone
-from models import db, Champion, YouthSupport, User
+from models import db, Champion, User
 from blueprints.api import _check_api_token
+from services.checkin_service import parse_reporting_period, submit_checkin as submit_checkin_report
 
 api_token_bp = Blueprint('api_token', __name__, url_prefix='/api')
 
@@ -50,43 +50,16 @@ def token_submit_checkin():
         return jsonify({'error': 'Champion profile not found'}), 404
 
     # Parse reporting_period
-    rp = data.get('reporting_period')
-    if not rp:
-        reporting_period = date.today()
-    else:
-        try:
-            reporting_period = datetime.strptime(rp, '%Y-%m-%d').date()
-        except Exception:
-            return jsonify({'error': 'Invalid reporting_period format. Use YYYY-MM-DD'}), 400
-
     try:
-        report = YouthSupport.query.filter_by(champion_id=champion.champion_id, reporting_period=reporting_period).first()
-        if not report:
-            report = YouthSupport(champion_id=champion.champion_id, reporting_period=reporting_period)
-
-        if 'number_of_youth_under_support' in data:
-            report.number_of_youth_under_support = int(data.get('number_of_youth_under_support') or 0)
-        if 'weekly_check_in_completion_rate' in data:
-            report.weekly_check_in_completion_rate = float(data.get('weekly_check_in_completion_rate') or 0)
-        if 'monthly_mini_screenings_delivered' in data:
-            report.monthly_mini_screenings_delivered = int(data.get('monthly_mini_screenings_delivered') or 0)
-        if 'referrals_initiated' in data:
-            report.referrals_initiated = int(data.get('referrals_initiated') or 0)
-        if 'flags_and_concerns_logged' in data:
-            report.flags_and_concerns_logged = data.get('flags_and_concerns_logged')
+        reporting_period = parse_reporting_period(data.get('reporting_period'))
+    except ValueError:
+        return jsonify({'error': 'Invalid reporting_period format. Use YYYY-MM-DD'}), 400
 
-        try:
-            if report.weekly_check_in_completion_rate is not None and float(report.weekly_check_in_completion_rate) < 50:
-                report.flag_timestamp = datetime.now(timezone.utc)
-            if report.flags_and_concerns_logged:
-                report.flag_timestamp = datetime.now(timezone.utc)
-        except Exception:
-            pass
-
-        db.session.add(report)
-        db.session.commit()
+    try:
+        # Single INSERT ... ON CONFLICT DO UPDATE keyed by (champion, period)
+        report_id, flagged = submit_checkin_report(champion.champion_id, reporting_period, data)
 
-        return jsonify({'success': True, 'report_id': report.support_id, 'flagged': bool(report.flag_timestamp)}), 201
+        return jsonify({'success': True, 'report_id': report_id, 'flagged': flagged}), 201
 
     except Exception as e:
         db.session.rollback()
@@ -3,10 +3,11 @@ from flask_login import login_user, logout_user, current_user, login_required
 from models import db, User, Champion, MemberRegistration
 from models import RefreshToken
 from decorators import admin_required, supervisor_required, champion_required
-from extensions import limiter
+from extensions import limiter, LOGIN_LIMIT
 from password_validator import validate_password_strength
 from datetime import datetime, timezone
 from metrics import track_login_attempt
+from services.registration_service import next_available_username
 import os
 import jwt
 import hashlib
@@ -35,11 +36,7 @@ def register():
 
         # Auto-generate a username base from the first name
         base = ''.join(ch for ch in (full_name.split()[0] if full_name else 'user').lower() if ch.isalnum()) or 'user'
-        username_candidate = base
-        idx = 1
-        while User.query.filter_by(username=username_candidate).first() or MemberRegistration.query.filter_by(username=username_candidate).first():
-            idx += 1
-            username_candidate = f"{base}{idx}"
+        username_candidate = next_available_username(base)
 
         registration = MemberRegistration(
             full_name=full_name,
@@ -95,7 +92,7 @@ def register():
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
-@limiter.limit("10 per minute", methods=["POST"], exempt_when=lambda: False)
+@limiter.limit(LOGIN_LIMIT, methods=["POST"], exempt_when=lambda: False)
 def login():
     if current_user.is_authenticated:
         # Redirect authenticated users directly to their role dashboard
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from models import db, BlogPost
+from utils.query_options import with_load_options
+from utils.db_routing import use_replica
 from decorators import admin_required, supervisor_required
 from datetime import datetime, timezone
 import re
@@ -18,13 +20,14 @@ def generate_slug(title):
 
 
 @blog_bp.route('/', methods=['GET'])
+@use_replica
 def list_posts():
     """Get all blog posts with optional filtering."""
     category = request.args.get('category')
     published_only = request.args.get('published', 'true').lower() == 'true'
     limit = request.args.get('limit', type=int)
     
-    query = BlogPost.query
+    query = with_load_options(BlogPost.query, 'blog.list_posts')
     
     if published_only:
         query = query.filter_by(published=True)
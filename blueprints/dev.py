@@ -9,6 +9,7 @@ import sys
 from datetime import datetime, timezone
 from models import db, User, Champion, Event, BlogPost, MentalHealthAssessment, EventParticipation
 import sqlalchemy
+from utils.endpoint_registry import mark_auth, registry_rows
 
 dev = Blueprint('dev', __name__, url_prefix='/__dev__')
 
@@ -24,7 +25,7 @@ def require_dev_key(f):
             abort(404)  # Return 404 instead of 403 to hide the route's existence
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
-    return decorated_function
+    return mark_auth(decorated_function, 'dev_key')
 
 
 @dev.route('/info')
@@ -307,7 +308,8 @@ def file_structure():
 @dev.route('/routes')
 @require_dev_key
 def list_routes():
-    """List all registered Flask routes"""
+    """List all registered Flask routes and the compiled endpoint metadata
+    (CSRF exemption, auth mode, allowed roles) used by request hooks."""
     from flask import current_app
     
     routes = []
@@ -321,7 +323,11 @@ def list_routes():
     # Sort by path
     routes.sort(key=lambda x: x['path'])
     
-    return jsonify({'routes': routes, 'count': len(routes)})
+    return jsonify({
+        'routes': routes,
+        'count': len(routes),
+        'endpoints': registry_rows(current_app),
+    })
 
 
 @dev.route('/logs')
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, Event, EventInterest
+from utils.db_routing import use_replica
 from decorators import admin_required
 from datetime import datetime, timezone
 from services.event_submission_service import EventSubmissionService
@@ -26,6 +27,7 @@ events_bp = Blueprint('events', __name__, url_prefix='/api/events')
 
 
 @events_bp.route('/', methods=['GET'])
+@use_replica
 def list_events():
     """Get all events with optional filtering."""
     status = request.args.get('status')  # Upcoming, Ongoing, Completed, Cancelled
@@ -1,15 +1,22 @@
 import base64
+import hashlib
+import hmac
+import time
 from datetime import datetime
 import requests
 from utils.http import get_session, request_with_timeout
-from utils.circuit import CircuitBreaker, circuit
+from utils.circuit import circuit, get_breaker
 from utils.endpoint_guard import endpoint_guard
+from utils.token_cache import TokenCache
 from utils.idempotency import reserve_key, get_key, update_key, make_key_from_args
-from flask import Blueprint, request, jsonify, current_app
+from metrics import track_mpesa_callback, track_payment_status_lookup
+from services import payment_service
+from flask import Blueprint, request, jsonify, current_app, url_for
 from flask_login import login_required
 from flask_login import current_user
 from models import db, Champion, User
 from decorators import supervisor_required
+from extensions import limiter, CHECKOUT_LIMIT
 import os
 
 mpesa_bp = Blueprint('mpesa', __name__, url_prefix='/api/mpesa')
@@ -29,31 +36,80 @@ BASE_URL = {
     'sandbox': 'https://sandbox.safaricom.co.ke',
     'production': 'https://api.safaricom.co.ke'
 }
+# Point the client at another Daraja, e.g. tools/daraja_emulator.py for load tests
+if os.environ.get('MPESA_BASE_URL'):
+    BASE_URL[ENVIRONMENT] = os.environ['MPESA_BASE_URL'].rstrip('/')
 
 # Shared session with retries
 _session = get_session()
 
-# Circuit breaker for external M-Pesa calls
-_mpesa_cb = CircuitBreaker(fail_max=4, reset_timeout=30)
+# Circuit breaker for external M-Pesa calls, shared by web and Celery workers
+_mpesa_cb = get_breaker('mpesa', fail_max=4, reset_timeout=30)
 
+# OAuth tokens are valid for about an hour; share one across web and Celery
+# processes and refresh it MPESA_TOKEN_REFRESH_MARGIN seconds before expiry.
+_token_cache = TokenCache(
+    prefix='mpesa:oauth',
+    refresh_margin=int(os.environ.get('MPESA_TOKEN_REFRESH_MARGIN', 300)),
+)
 
-def get_access_token():
-    """Get OAuth access token from M-Pesa API."""
-    if MPESA_MOCK:
-        return 'fake-access-token'
-    if not CONSUMER_KEY or not CONSUMER_SECRET:
-        raise ValueError("M-Pesa credentials not configured. Set MPESA_CONSUMER_KEY and MPESA_CONSUMER_SECRET.")
+
+def callback_token():
+    """Secret path segment of the CallBackURL given to Daraja.
+
+    Set MPESA_CALLBACK_TOKEN (and rotate it like any secret); otherwise it is
+    derived from SECRET_KEY. Callbacks posted without it are rejected.
+    """
+    token = os.environ.get('MPESA_CALLBACK_TOKEN')
+    if token:
+        return token
+    secret = os.environ.get('SECRET_KEY') or current_app.config.get('SECRET_KEY') or ''
+    return hmac.new(secret.encode(), b'mpesa-callback', hashlib.sha256).hexdigest()[:32]
+
+
+def callback_url():
+    base = os.environ.get('BACKEND_URL', 'https://unda-youth-network-backend.onrender.com')
+    return f"{base}/api/mpesa/callback/{callback_token()}"
+
+
+def _token_name():
+    # Separate entries per environment and app credentials
+    return f"{ENVIRONMENT}:{hashlib.sha256((CONSUMER_KEY or '').encode()).hexdigest()[:16]}"
+
+
+def _fetch_access_token():
     api_url = f"{BASE_URL[ENVIRONMENT]}/oauth/v1/generate?grant_type=client_credentials"
     try:
         resp = request_with_timeout(_session, 'GET', api_url, timeout=10, auth=(CONSUMER_KEY, CONSUMER_SECRET))
         resp.raise_for_status()
-        return resp.json().get('access_token')
+        body = resp.json()
     except Exception as e:
         current_app.logger.exception('Failed to get M-Pesa access token')
         raise Exception(f"Failed to get M-Pesa access token: {str(e)}")
+    return body.get('access_token'), int(body.get('expires_in') or 3599)
+
+
+def get_access_token():
+    """Get an OAuth access token for the M-Pesa API, from the shared cache when possible."""
+    if MPESA_MOCK:
+        return 'fake-access-token'
+    if not CONSUMER_KEY or not CONSUMER_SECRET:
+        raise ValueError("M-Pesa credentials not configured. Set MPESA_CONSUMER_KEY and MPESA_CONSUMER_SECRET.")
+    return _token_cache.get(_token_name(), _fetch_access_token)
+
+
+def _raise_for_status(resp):
+    try:
+        resp.raise_for_status()
+    except requests.exceptions.HTTPError:
+        # A rejected token is dropped so the next call fetches a new one
+        if resp.status_code == 401:
+            _token_cache.invalidate(_token_name())
+        raise
 
 
 @mpesa_bp.route('/checkout', methods=['POST'])
+@limiter.limit(CHECKOUT_LIMIT)
 @login_required
 @endpoint_guard(cb=_mpesa_cb, timeout=12)
 def initiate_stk_push():
@@ -103,10 +159,11 @@ def initiate_stk_push():
     
     # Idempotency handling: prefer client-provided Idempotency-Key header
     idem_key = request.headers.get('Idempotency-Key') or data.get('idempotencyKey')
+    account_ref = data.get('accountReference', 'UNDA Youth Network')
+    transaction_desc = data.get('transactionDesc', 'Merchandise/Membership Payment')
     if not idem_key:
         # Fallback deterministic key so repeated clicks produce same key
         user_id = getattr(current_user, 'id', 'anon')
-        account_ref = data.get('accountReference', 'UNDA Youth Network')
         idem_key = make_key_from_args(user_id, phone_number, amount, account_ref)
 
     # If a record already exists and succeeded, return the stored response
@@ -116,212 +173,280 @@ def initiate_stk_push():
         if status == 'success':
             return jsonify({'success': True, 'message': 'STK Push already processed', 'data': existing.get('response')}), 200
         if status == 'pending':
-            return jsonify({'success': False, 'message': 'Payment is already being processed'}), 202
+            return _pending_response(idem_key, 'Payment is already being processed')
+        if status == 'unknown':
+            return _unknown_response()
         # if failed, fall through and allow retry which will attempt to reserve again
 
     # Try to reserve the idempotency key — only one process will win
-    reserved = reserve_key(idem_key, meta={'phone': phone_number, 'amount': amount})
+    reserved = reserve_key(idem_key, meta={'phone': phone_number, 'amount': amount, 'user_id': current_user.get_id()})
     if not reserved:
         # Another worker/process reserved it; return pending
-        return jsonify({'success': False, 'message': 'Payment is already being processed'}), 202
-
-    try:
-        # Get access token
-        access_token = get_access_token()
-        
-        # Generate password and timestamp
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        password_string = f"{SHORTCODE}{PASSKEY}{timestamp}"
-        password = base64.b64encode(password_string.encode()).decode()
-        
-        # Prepare request headers
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # Prepare STK Push payload
-        payload = {
-            "BusinessShortCode": SHORTCODE,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": amount,
-            "PartyA": phone_number,
-            "PartyB": SHORTCODE,
-            "PhoneNumber": phone_number,
-            "CallBackURL": f"{os.environ.get('BACKEND_URL', 'https://unda-youth-network-backend.onrender.com')}/api/mpesa/callback",
-            "AccountReference": data.get('accountReference', 'UNDA Youth Network'),
-            "TransactionDesc": data.get('transactionDesc', 'Merchandise/Membership Payment')
-        }
-        
-        # Make STK Push request with circuit breaker protection
-        @circuit(_mpesa_cb)
-        def do_request():
-            # If MPESA_MOCK is enabled, return a fake successful response
-            if MPESA_MOCK:
-                return {
-                    'ResponseCode': '0',
-                    'CheckoutRequestID': 'MOCK_CHECKOUT_123',
-                    'ResponseDescription': 'Mock STK Push accepted'
-                }
-            api_url = f"{BASE_URL[ENVIRONMENT]}/mpesa/stkpush/v1/processrequest"
-            resp = request_with_timeout(_session, 'POST', api_url, timeout=10, json=payload, headers=headers)
-            resp.raise_for_status()
-            return resp.json()
+        return _pending_response(idem_key, 'Payment is already being processed')
 
+    if current_app.config.get('MPESA_ASYNC_CHECKOUT'):
+        # Hand the push to the payments worker and free this web worker now
+        from tasks.mpesa_tasks import enqueue_stk_push
         try:
-            response_data = do_request()
-        except RuntimeError:
-            # Mark pending -> failed temporarily so clients can retry later
-            update_key(idem_key, status='failed', response={'error': 'service_unavailable'})
+            enqueue_stk_push(idem_key, phone_number, amount, account_ref, transaction_desc)
+        except Exception:
+            current_app.logger.exception('Failed to enqueue STK push')
+            update_key(idem_key, status='failed', response={'error': 'queue_unavailable'})
             return jsonify({'success': False, 'message': 'M-Pesa service temporarily unavailable.'}), 503
-        except Exception as e:
-            current_app.logger.exception('STK push request failed')
-            update_key(idem_key, status='failed', response={'error': str(e)})
-            return jsonify({'success': False, 'message': f'M-Pesa API request failed: {str(e)}'}), 500
+        return _pending_response(idem_key, 'Payment request queued', success=True)
 
-        # Persist success response into idempotency store so replays are safe
-        if response_data.get('ResponseCode') == '0':
-            update_key(idem_key, status='success', response=response_data, meta={'checkout_request_id': response_data.get('CheckoutRequestID')})
-            return jsonify({'success': True, 'message': 'STK Push sent successfully', 'data': response_data}), 200
-
-        update_key(idem_key, status='failed', response=response_data)
-        return jsonify({'success': False, 'message': response_data.get('ResponseDescription', 'STK Push failed'), 'data': response_data}), 400
-            
-    except requests.exceptions.RequestException as e:
-        current_app.logger.exception('STK push API request exception')
-        return jsonify({
-            'success': False,
-            'message': f'M-Pesa API request failed: {str(e)}'
-        }), 500
+    try:
+        response_data = send_stk_push(phone_number, amount, account_ref, transaction_desc)
     except Exception as e:
-        current_app.logger.exception('STK push unexpected error')
-        return jsonify({
-            'success': False,
-            'message': f'An error occurred: {str(e)}'
-        }), 500
+        from tasks.mpesa_tasks import classify_push_failure, record_push_failure
+        kind = classify_push_failure(e)
+        record_push_failure(idem_key, e, kind)
+        if kind == 'retry':
+            # Never reached Daraja; the client may retry later
+            return jsonify({'success': False, 'message': 'M-Pesa service temporarily unavailable.'}), 503
+        current_app.logger.exception('STK push request failed')
+        if kind == 'unknown':
+            return _unknown_response()
+        return jsonify({'success': False, 'message': f'M-Pesa API request failed: {str(e)}'}), 500
 
+    if record_stk_response(idem_key, response_data, phone_number, amount, account_ref, current_user.get_id()):
+        return jsonify({'success': True, 'message': 'STK Push sent successfully', 'data': response_data}), 200
+    return jsonify({'success': False, 'message': response_data.get('ResponseDescription', 'STK Push failed'), 'data': response_data}), 400
+
+
+def _pending_response(idem_key, message, success=False):
+    status_url = url_for('mpesa.checkout_status', idem_key=idem_key)
+    response = jsonify({
+        'success': success,
+        'status': 'pending',
+        'message': message,
+        'idempotencyKey': idem_key,
+        'statusUrl': status_url,
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+
+def _unknown_response():
+    # Daraja may have taken the push; a second one could charge twice
+    return jsonify({
+        'success': False,
+        'status': 'unknown',
+        'message': 'The payment request may have reached your phone. Check M-Pesa before trying again.',
+    }), 502
+
+
+def send_stk_push(phone_number, amount, account_reference, transaction_desc):
+    """Send an STK push through Daraja and return its JSON response.
+
+    Raises CircuitOpenError while the circuit breaker is open and the
+    underlying exception for token, transport or HTTP errors.
+    """
+    # Get access token
+    access_token = get_access_token()
+
+    # Generate password and timestamp
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    password_string = f"{SHORTCODE}{PASSKEY}{timestamp}"
+    password = base64.b64encode(password_string.encode()).decode()
+
+    # Prepare request headers
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+    # Prepare STK Push payload
+    payload = {
+        "BusinessShortCode": SHORTCODE,
+        "Password": password,
+        "Timestamp": timestamp,
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": amount,
+        "PartyA": phone_number,
+        "PartyB": SHORTCODE,
+        "PhoneNumber": phone_number,
+        "CallBackURL": callback_url(),
+        "AccountReference": account_reference,
+        "TransactionDesc": transaction_desc
+    }
+
+    # Make STK Push request with circuit breaker protection
+    @circuit(_mpesa_cb)
+    def do_request():
+        # If MPESA_MOCK is enabled, return a fake successful response
+        if MPESA_MOCK:
+            return {
+                'ResponseCode': '0',
+                'CheckoutRequestID': 'MOCK_CHECKOUT_123',
+                'ResponseDescription': 'Mock STK Push accepted'
+            }
+        api_url = f"{BASE_URL[ENVIRONMENT]}/mpesa/stkpush/v1/processrequest"
+        resp = request_with_timeout(_session, 'POST', api_url, timeout=10, json=payload, headers=headers)
+        _raise_for_status(resp)
+        return resp.json()
+
+    return do_request()
+
+
+def record_stk_response(idem_key, response_data, phone_number=None, amount=None, account_reference=None, user_id=None):
+    """Store the Daraja response for `idem_key`. Returns True if the push was accepted.
+
+    Accepted pushes are also written to the payments ledger as pending.
+    """
+    checkout_request_id = response_data.get('CheckoutRequestID')
+    if response_data.get('ResponseCode') == '0':
+        # Persist success response into idempotency store so replays are safe
+        update_key(idem_key, status='success', response=response_data, meta={'checkout_request_id': checkout_request_id})
+        if checkout_request_id:
+            try:
+                payment_service.record_checkout(
+                    checkout_request_id,
+                    merchant_request_id=response_data.get('MerchantRequestID'),
+                    idempotency_key=idem_key,
+                    user_id=user_id,
+                    phone_number=phone_number,
+                    amount=amount,
+                    account_reference=account_reference,
+                )
+            except Exception:
+                # The push already went out; checkout_status's stkpushquery creates the row
+                db.session.rollback()
+                current_app.logger.exception('Failed to record payment %s', checkout_request_id)
+        return True
+    update_key(idem_key, status='failed', response=response_data)
+    return False
+
+
+@mpesa_bp.route('/checkout/status/<path:idem_key>', methods=['GET'])
+@login_required
+def checkout_status(idem_key):
+    """Report the state of a checkout from the idempotency cache and payments ledger.
+
+    Polled by clients after an asynchronous checkout. Daraja (stkpushquery)
+    is only asked about payments missing from the ledger or pending longer
+    than MPESA_STATUS_STALE_SECONDS, e.g. after a lost callback.
+    """
+    entry = get_key(idem_key)
+    meta = (entry or {}).get('meta') or {}
+    if not entry or str(meta.get('user_id')) != str(current_user.get_id()):
+        return jsonify({'success': False, 'message': 'Unknown checkout'}), 404
+
+    status = entry.get('status')
+    checkout_request_id = meta.get('checkout_request_id')
+    payment = None
+    if checkout_request_id:
+        payment, source = payment_service.get_payment_status(
+            checkout_request_id,
+            query=query_stk_push,
+            stale_after=current_app.config.get('MPESA_STATUS_STALE_SECONDS'),
+        )
+        track_payment_status_lookup(source)
+    payment_status = payment['status'] if payment and payment['status'] != 'pending' else None
+
+    response = jsonify({
+        'success': status not in ('failed', 'unknown') and payment_status in (None, 'paid'),
+        'status': status,
+        'paymentStatus': payment_status,
+        'checkoutRequestId': checkout_request_id,
+        'receipt': payment.get('mpesa_receipt') if payment else None,
+        'data': entry.get('response'),
+        'updatedAt': (payment or {}).get('updated_at') or entry.get('updated_at'),
+    })
+    response.headers['Cache-Control'] = 'private, no-store'
+    if status == 'pending' or (status == 'success' and not payment_status):
+        response.headers['Retry-After'] = str(current_app.config.get('MPESA_STATUS_POLL_SECONDS', 2))
+    return response, 200
+
+
+@mpesa_bp.route('/callback/<token>', methods=['POST'])
+def mpesa_callback(token):
+    """Handle M-Pesa callback after STK Push.
+
+    Only requests carrying the secret token from our CallBackURL are
+    accepted. The result settles the payment's pending ledger row in one
+    statement; repeated deliveries and unknown checkouts are acknowledged
+    and ignored.
+    """
+    started = time.perf_counter()
+    if not hmac.compare_digest(token.encode(), callback_token().encode()):
+        current_app.logger.warning('Rejected M-Pesa callback with a bad token from %s', request.remote_addr)
+        track_mpesa_callback('forbidden', time.perf_counter() - started)
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Forbidden'}), 403
+
+    data = request.get_json(silent=True) or {}
 
-@mpesa_bp.route('/callback', methods=['POST'])
-def mpesa_callback():
-    """Handle M-Pesa callback after STK Push."""
-    data = request.json
-    
-    # Log the callback for debugging
-    print("M-Pesa Callback received:", data)
-    
     try:
-        # Extract callback data
-        result_code = data['Body']['stkCallback']['ResultCode']
-        result_desc = data['Body']['stkCallback'].get('ResultDesc', 'Unknown')
-        merchant_request_id = data['Body']['stkCallback'].get('MerchantRequestID')
-        checkout_request_id = data['Body']['stkCallback'].get('CheckoutRequestID')
-        
-        if result_code == 0:
-            # Payment Successful
-            callback_metadata = data['Body']['stkCallback']['CallbackMetadata']['Item']
-            
-            # Extract details to save to your DB
-            receipt = next(item['Value'] for item in callback_metadata if item['Name'] == 'MpesaReceiptNumber')
-            amount = next(item['Value'] for item in callback_metadata if item['Name'] == 'Amount')
-            transaction_date = next((item['Value'] for item in callback_metadata if item['Name'] == 'TransactionDate'), None)
-            phone_number = next((item['Value'] for item in callback_metadata if item['Name'] == 'PhoneNumber'), None)
-            
-            print(f"Payment Verified! Receipt: {receipt}, Amount: {amount}")
-            print(f"Transaction Date: {transaction_date}, Phone: {phone_number}")
-            
-            # TODO: Update your Database: set order status to 'PAID'
-            # Example:
-            # payment = Payment.query.filter_by(checkout_request_id=checkout_request_id).first()
-            # if payment:
-            #     payment.status = 'PAID'
-            #     payment.mpesa_receipt = receipt
-            #     payment.transaction_date = transaction_date
-            #     db.session.commit()
-            
-            return jsonify({
-                'ResultCode': 0,
-                'ResultDesc': 'Accepted'
-            }), 200
-        else:
-            # Payment Failed or Cancelled by User
-            print(f"Payment Failed. Result Code: {result_code}")
-            print(f"Result Description: {result_desc}")
-            
-            # TODO: Update database to mark transaction as failed
-            # payment = Payment.query.filter_by(checkout_request_id=checkout_request_id).first()
-            # if payment:
-            #     payment.status = 'FAILED'
-            #     payment.failure_reason = result_desc
-            #     db.session.commit()
-            
-            return jsonify({
-                'ResultCode': 0,
-                'ResultDesc': 'Accepted'
-            }), 200
-            
-    except KeyError as e:
-        current_app.logger.exception('Missing key in M-Pesa callback')
-        print(f"Missing key in callback data: {str(e)}")
-        print(f"Callback data: {data}")
+        outcome = payment_service.apply_callback(data)
+    except (KeyError, TypeError, ValueError):
+        current_app.logger.exception('Invalid M-Pesa callback payload')
+        track_mpesa_callback('invalid', time.perf_counter() - started)
         return jsonify({
             'ResultCode': 1,
             'ResultDesc': 'Failed to process callback'
         }), 500
-    except Exception as e:
+    except Exception:
+        db.session.rollback()
         current_app.logger.exception('Error processing M-Pesa callback')
-        print(f"Error processing callback: {str(e)}")
+        track_mpesa_callback('error', time.perf_counter() - started)
         return jsonify({
             'ResultCode': 1,
             'ResultDesc': 'Failed to process callback'
         }), 500
 
+    track_mpesa_callback(outcome, time.perf_counter() - started)
+    return jsonify({
+        'ResultCode': 0,
+        'ResultDesc': 'Accepted'
+    }), 200
+
+
+def query_stk_push(checkout_request_id):
+    """Ask Daraja (stkpushquery) for the state of an STK push and return its JSON."""
+    # Get access token
+    access_token = get_access_token()
+
+    # Generate password and timestamp
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    password_string = f"{SHORTCODE}{PASSKEY}{timestamp}"
+    password = base64.b64encode(password_string.encode()).decode()
+
+    # Prepare request headers
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+    # Prepare query payload
+    payload = {
+        "BusinessShortCode": SHORTCODE,
+        "Password": password,
+        "Timestamp": timestamp,
+        "CheckoutRequestID": checkout_request_id
+    }
+
+    api_url = f"{BASE_URL[ENVIRONMENT]}/mpesa/stkpushquery/v1/query"
+    response = request_with_timeout(_session, 'POST', api_url, timeout=10, json=payload, headers=headers)
+    _raise_for_status(response)
+    return response.json()
+
 
 @mpesa_bp.route('/query/<checkout_request_id>', methods=['GET'])
 @login_required
 @supervisor_required
 def query_stk_status(checkout_request_id):
-    """Query the status of an STK Push transaction."""
+    """Query the status of an STK Push transaction.
+
+    Answered from the payments ledger (via a short Redis cache); Daraja is
+    only queried for unknown payments or ones pending longer than
+    MPESA_STATUS_STALE_SECONDS.
+    """
     try:
-        # Get access token
-        access_token = get_access_token()
-        
-        # Generate password and timestamp
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        password_string = f"{SHORTCODE}{PASSKEY}{timestamp}"
-        password = base64.b64encode(password_string.encode()).decode()
-        
-        # Prepare request headers
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # Prepare query payload
-        payload = {
-            "BusinessShortCode": SHORTCODE,
-            "Password": password,
-            "Timestamp": timestamp,
-            "CheckoutRequestID": checkout_request_id
-        }
-        
-        # Make query request
-        api_url = f"{BASE_URL[ENVIRONMENT]}/mpesa/stkpushquery/v1/query"
-        response = requests.post(api_url, json=payload, headers=headers, timeout=30)
-        response.raise_for_status()
-        
-        return jsonify({
-            'success': True,
-            'data': response.json()
-        }), 200
-        
-    except requests.exceptions.RequestException as e:
-        current_app.logger.exception('STK query request exception')
-        return jsonify({
-            'success': False,
-            'message': f'Query failed: {str(e)}'
-        }), 500
+        payment, source = payment_service.get_payment_status(
+            checkout_request_id,
+            query=query_stk_push,
+            stale_after=current_app.config.get('MPESA_STATUS_STALE_SECONDS'),
+        )
     except Exception as e:
         current_app.logger.exception('STK query unexpected error')
         return jsonify({
@@ -329,6 +454,11 @@ def query_stk_status(checkout_request_id):
             'message': f'An error occurred: {str(e)}'
         }), 500
 
+    track_payment_status_lookup(source)
+    if payment is None:
+        return jsonify({'success': False, 'message': 'Unknown checkout request'}), 404
+    return jsonify({'success': True, 'source': source, 'data': payment}), 200
+
 
 @mpesa_bp.route('/config', methods=['GET'])
 @login_required
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, EventParticipation, Event, Champion
 from decorators import supervisor_required
+from utils.query_options import with_load_options
 from datetime import datetime, timezone
 import traceback
 
@@ -17,7 +18,7 @@ def list_participations():
     champion_id = request.args.get('champion_id', type=int)
     status = request.args.get('status')  # registered, confirmed, attended, cancelled
     
-    query = EventParticipation.query
+    query = with_load_options(EventParticipation.query, 'participation.list_participations')
     
     if event_id:
         query = query.filter_by(event_id=event_id)
@@ -396,9 +397,9 @@ def get_champion_participation_history(champion_id):
                 'message': 'Unauthorized'
             }), 403
     
-    participations = EventParticipation.query.filter_by(
-        champion_id=champion_id
-    ).order_by(EventParticipation.registered_at.desc()).all()
+    participations = with_load_options(
+        EventParticipation.query, 'participation.get_champion_participation_history'
+    ).filter_by(champion_id=champion_id).order_by(EventParticipation.registered_at.desc()).all()
     
     return jsonify({
         'success': True,
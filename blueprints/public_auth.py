@@ -18,11 +18,13 @@ from models import (
     DailyAffirmation, SymbolicItem, MentalHealthAssessment, generate_champion_code
 )
 from decorators import admin_required
-from utils.media import normalize_gallery_items
+from extensions import limiter, LOGIN_LIMIT, REGISTER_LIMIT
 from password_validator import validate_password_strength
 from datetime import datetime, date, timezone
 import re
 import sqlalchemy as sa
+from utils.query_options import with_load_options
+from services.registration_service import find_registration_conflict, next_available_username
 import uuid
 import os
 import secrets
@@ -161,6 +163,7 @@ def complete_invite():
 
 
 @public_auth_bp.route('/api/auth/register', methods=['POST'])
+@limiter.limit(REGISTER_LIMIT)
 def register_member():
     """Public endpoint for member registration"""
     try:
@@ -193,44 +196,18 @@ def register_member():
         # ensure uniqueness across users and pending registrations.
         if not data.get('username'):
             base = ''.join(ch for ch in (data.get('full_name').split()[0] if data.get('full_name') else 'user').lower() if ch.isalnum()) or 'user'
-            username_candidate = base
-            idx = 1
-            while User.query.filter_by(username=username_candidate).first() or MemberRegistration.query.filter_by(username=username_candidate).first():
-                idx += 1
-                username_candidate = f"{base}{idx}"
-            data['username'] = username_candidate
+            data['username'] = next_available_username(base)
 
         # Server-side authoritative checks for existing users/registrations
-        # Prevent bypass of frontend guards by direct API calls. We block when
-        # there is an existing registration in an in-progress state (e.g.
-        # Pending/Submitted/Under_Review). Re-submission is allowed when the
-        # previous registration was rejected/denied.
-        blocking_statuses = {'pending', 'submitted', 'under_review'}
-
-        # Existing user account with same username blocks registration
-        if User.query.filter_by(username=data['username']).first():
-            return _error_response('Username already exists', field='username', status=409)
-
-        # Existing champion with same email or phone blocks registration
-        if data.get('email') and Champion.query.filter_by(email=data['email']).first():
-            return _error_response('Email already registered', field='email', status=409)
-
-        if Champion.query.filter_by(phone_number=normalized_phone).first():
-            return _error_response('Phone number already registered', field='phone_number', status=409)
-
-        # Look for prior registrations matching username, phone or email
-        filters = [MemberRegistration.username == data['username'], MemberRegistration.phone_number == normalized_phone]
-        if data.get('email'):
-            filters.append(MemberRegistration.email == data['email'])
-
-        existing_regs = MemberRegistration.query.filter(sa.or_(*filters)).all()
-        for reg in existing_regs:
-            if reg and getattr(reg, 'status', None) and reg.status.lower() in blocking_statuses:
-                return _error_response(
-                    f'Existing registration (id={reg.registration_id}) with status "{reg.status}" is already in progress',
-                    field='registration',
-                    status=409
-                )
+        # Prevent bypass of frontend guards by direct API calls: an existing
+        # user with the username, a champion with the email or phone, or an
+        # in-progress (Pending/Submitted/Under_Review) registration matching
+        # any of them blocks signup. Re-submission is allowed when the
+        # previous registration was rejected/denied. One UNION query covers
+        # all of these.
+        conflict = find_registration_conflict(data['username'], normalized_phone, data.get('email'))
+        if conflict:
+            return _error_response(conflict['message'], field=conflict['field'], status=409)
 
         # Parse date of birth if provided
         date_of_birth = None
@@ -391,6 +368,7 @@ def verify_certificate():
 
 
 @public_auth_bp.route('/api/auth/login', methods=['POST'])
+@limiter.limit(LOGIN_LIMIT)
 @exempt_csrf
 def api_login():
     """API endpoint for member/admin login using JSON. Returns JSON and sets session cookie."""
@@ -509,6 +487,7 @@ except Exception:
 # may be applied to browser-form flows. Frontends should POST to
 # `/api/auth/login-public` when performing API logins from separate origins.
 @public_auth_bp.route('/api/auth/login-public', methods=['POST'])
+@limiter.limit(LOGIN_LIMIT)
 @exempt_csrf
 def api_login_public():
     try:
@@ -573,6 +552,7 @@ except Exception:
 
 # Token-based login endpoint for API clients (returns JWT access_token)
 @public_auth_bp.route('/api/auth/login-token', methods=['POST'])
+@limiter.limit(LOGIN_LIMIT)
 @exempt_csrf
 def api_login_token():
     """Return a JWT access token for API clients when given JSON credentials.
@@ -1207,15 +1187,14 @@ def api_list_assessments():
 @public_auth_bp.route('/api/media-galleries', methods=['GET'])
 def api_list_media_galleries():
     try:
-        galleries = MediaGallery.query.filter_by(published=True).order_by(
+        # Items carry a precomputed `src`, so to_dict() output needs no re-normalisation
+        galleries = with_load_options(
+            MediaGallery.query, 'public_auth.api_list_media_galleries'
+        ).filter_by(published=True).order_by(
             MediaGallery.published_at.desc().nullslast(),
             MediaGallery.created_at.desc()
         ).all()
-        result = []
-        for g in galleries:
-            d = g.to_dict()
-            d['media_items'] = normalize_gallery_items(d.get('media_items'))
-            result.append(d)
+        result = [g.to_dict() for g in galleries]
         return jsonify({'galleries': result}), 200
     except Exception as e:
         current_app.logger.exception('Error fetching media galleries')
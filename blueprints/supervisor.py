@@ -5,6 +5,7 @@ from models import db, Champion, YouthSupport, RefferalPathway, AccessAuditLog
 from decorators import supervisor_required
 from sqlalchemy import func, or_
 from services import user_service
+from utils.audit_sink import audit_sink
 
 supervisor_bp = Blueprint('supervisor', __name__, url_prefix='/supervisor', template_folder='templates')
 
@@ -206,16 +207,17 @@ def review_champion(champion_id):
     abort(403, 'Unauthorized access')
 
 
-  # AUDIT LOG: Record sensitive data access
-  audit_entry = AccessAuditLog(
+  # AUDIT LOG: Record sensitive data access (written behind the request)
+  audit_sink.record(
+    AccessAuditLog,
     user_id=current_user.user_id,
     champion_id=champion_id,
     action='viewed_champion_profile',
     ip_address=request.remote_addr,
     details='Supervisor accessed champion detail page'
   )
-  db.session.add(audit_entry)
-  db.session.commit()
+  if audit_sink.sync:
+    db.session.commit()
 
   # Fetch history to monitor program impact
   history = (
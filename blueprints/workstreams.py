@@ -20,8 +20,9 @@ from models import (
     InstitutionalToolkitItem, Event, Podcast
 )
 from decorators import admin_required
-from utils.media import infer_type_from_path, normalize_media_src, normalize_gallery_items
 from datetime import datetime, timezone
+from utils.query_options import load_options, with_load_options
+from utils.db_routing import use_replica
 import re
 
 
@@ -63,6 +64,7 @@ def normalize_input(payload: dict) -> dict:
 # ============================================================================
 
 @workstreams_bp.route('/api/workstreams/programs', methods=['GET'])
+@use_replica
 def get_programs():
     """List all published programs/workstreams."""
     try:
@@ -78,6 +80,7 @@ def get_programs():
 
 
 @workstreams_bp.route('/api/workstreams/programs/featured', methods=['GET'])
+@use_replica
 def get_featured_programs():
     """Get featured programs for homepage."""
     try:
@@ -118,6 +121,7 @@ def get_program(id_or_slug):
 # ============================================================================
 
 @workstreams_bp.route('/api/workstreams/pillars', methods=['GET'])
+@use_replica
 def get_pillars():
     """Get impact pillars (Awareness, Access, Advocacy)."""
     try:
@@ -137,6 +141,7 @@ def get_pillars():
 # ============================================================================
 
 @workstreams_bp.route('/api/workstreams/resources', methods=['GET'])
+@use_replica
 def get_resources():
     """List resources with optional category filter."""
     try:
@@ -179,6 +184,7 @@ def get_resources():
 
 
 @workstreams_bp.route('/api/workstreams/<workstream_type>/resources', methods=['GET'])
+@use_replica
 def get_workstream_resources(workstream_type):
     """List resources for a specific workstream type."""
     try:
@@ -252,6 +258,7 @@ def get_resource(resource_id):
 # ============================================================================
 
 @workstreams_bp.route('/api/workstreams/stories', methods=['GET'])
+@use_replica
 def get_stories():
     """List stories with optional filters. Uses BlogPost model."""
     try:
@@ -260,7 +267,7 @@ def get_stories():
         featured = request.args.get('featured')
         category = request.args.get('category')
         
-        query = BlogPost.query.filter_by(published=True)
+        query = with_load_options(BlogPost.query, 'workstreams.get_stories').filter_by(published=True)
         
         if category:
             query = query.filter_by(category=category)
@@ -358,41 +365,36 @@ def get_gallery():
         category = request.args.get('category')
         featured = request.args.get('featured')
         
-        query = MediaGallery.query.filter_by(published=True)
+        query = with_load_options(MediaGallery.query, 'workstreams.get_gallery').filter_by(published=True)
         
         galleries = query.order_by(MediaGallery.created_at.desc()).all()
 
-        # Flatten media_items from galleries into individual items
+        # Flatten media items from galleries into individual items.
+        # src/type are resolved when items are written, so no per-item normalisation here.
         result = []
         for g in galleries:
-            if g.media_items:
-                for idx, item in enumerate(g.media_items):
-                    src = normalize_media_src(item)
-                    if not src:
-                        continue
-                    inferred_type = infer_type_from_path(item.get('filename') or src, fallback=item.get('type', 'photo'))
-                    item_data = {
-                        'id': f"{g.gallery_id}_{idx}",
-                        'galleryId': g.gallery_id,
-                        'galleryTitle': g.title,
-                        'type': inferred_type,
-                        'title': item.get('caption', g.title),
-                        'src': src,
-                        'thumbnail': item.get('thumbnail') or src,
-                        'videoUrl': item.get('video_url') or item.get('videoUrl') or (src if inferred_type == 'video' else None),
-                        'alt': item.get('alt', g.title),
-                        'category': g.category or 'general'
-                    }
-
-                    # Filter by gallery category if specified
-                    if category and (g.category or 'general').lower() != category.lower():
-                        continue
-                    
-                    # Filter by type if specified
-                    if item_type and item_data['type'] != item_type:
-                        continue
-                    
-                    result.append(item_data)
+            # Filter by gallery category if specified
+            if category and (g.category or 'general').lower() != category.lower():
+                continue
+            for item in g.items:
+                if not item.src:
+                    continue
+                # Filter by type if specified
+                if item_type and item.type != item_type:
+                    continue
+                meta = item.meta or {}
+                result.append({
+                    'id': f"{g.gallery_id}_{item.position}",
+                    'galleryId': g.gallery_id,
+                    'galleryTitle': g.title,
+                    'type': item.type,
+                    'title': item.caption if item.caption is not None else g.title,
+                    'src': item.src,
+                    'thumbnail': item.thumbnail or item.src,
+                    'videoUrl': meta.get('video_url') or meta.get('videoUrl') or (item.src if item.type == 'video' else None),
+                    'alt': meta.get('alt', g.title),
+                    'category': g.category or 'general'
+                })
         
         return jsonify({
             'success': True,
@@ -408,7 +410,9 @@ def get_gallery():
 def get_gallery_categories():
     """Get published galleries grouped by user-defined category."""
     try:
-        galleries = MediaGallery.query.filter_by(published=True).order_by(MediaGallery.created_at.desc()).all()
+        galleries = with_load_options(MediaGallery.query, 'workstreams.get_gallery_categories').filter_by(
+            published=True
+        ).order_by(MediaGallery.created_at.desc()).all()
 
         grouped = {}
         for gallery in galleries:
@@ -428,7 +432,7 @@ def get_gallery_categories():
                 'category': gallery.category,
                 'featured_media': gallery.featured_media,
                 'created_at': gallery.created_at.isoformat() if gallery.created_at else None,
-                'item_count': len(gallery.media_items) if gallery.media_items else 0
+                'item_count': len(gallery.items)
             })
 
         categories = sorted(grouped.values(), key=lambda item: item['category'].lower())
@@ -457,7 +461,7 @@ def get_gallery_item(gallery_id):
             'id': gallery.gallery_id,
             'title': gallery.title,
             'description': gallery.description,
-            'items': normalize_gallery_items(gallery.media_items),
+            'items': gallery.media_items,
             'featuredMedia': gallery.featured_media,
             'published': gallery.published
         }
@@ -483,7 +487,7 @@ def get_event_galleries(event_id):
         galleries = MediaGallery.query.filter_by(
             event_id=event_id,
             published=True
-        ).order_by(MediaGallery.created_at.desc()).all()
+        ).options(*load_options('workstreams.get_event_galleries')).order_by(MediaGallery.created_at.desc()).all()
         
         if not galleries:
             return jsonify({
@@ -509,8 +513,8 @@ def get_event_galleries(event_id):
                 'title': gallery.title,
                 'description': gallery.description,
                 'featured_media': gallery.featured_media,
-                'media_items': normalize_gallery_items(gallery.media_items),
-                'item_count': len(gallery.media_items) if gallery.media_items else 0,
+                'media_items': gallery.media_items,
+                'item_count': len(gallery.items),
                 'created_at': gallery.created_at.isoformat() if gallery.created_at else None
             }
             gallery_list.append(gallery_dict)
@@ -561,9 +565,8 @@ def get_events_with_galleries():
             featured_image = None
             if featured_gallery and featured_gallery.featured_media:
                 featured_image = featured_gallery.featured_media
-            elif featured_gallery and featured_gallery.media_items:
-                first_item = featured_gallery.media_items[0]
-                featured_image = first_item.get('url') or first_item.get('filename')
+            elif featured_gallery and featured_gallery.items:
+                featured_image = featured_gallery.items[0].src
             
             event_dict = {
                 'event_id': event.event_id,
@@ -6,6 +6,15 @@ def make_celery(app=None):
     broker = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     backend = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     celery = Celery('unda', broker=broker, backend=backend)
+    # Payments run on their own queue so a slow M-Pesa API can't starve other tasks
+    task_routes = {
+        'tasks.mpesa_stk_push': {'queue': os.environ.get('MPESA_TASK_QUEUE', 'payments')},
+        # SMTP sends are slow and rate limited; keep them off the default queue too
+        'tasks.send_email': {'queue': os.environ.get('EMAIL_TASK_QUEUE', 'email')},
+        'tasks.send_email_batch': {'queue': os.environ.get('EMAIL_TASK_QUEUE', 'email')},
+        # A fan-out run holds a DB connection for its whole walk over champions
+        'tasks.fan_out_affirmation': {'queue': os.environ.get('AFFIRMATION_TASK_QUEUE', 'affirmations')},
+    }
     if app:
         celery.conf.update(app.config)
 
@@ -15,4 +24,6 @@ def make_celery(app=None):
                     return self.run(*args, **kwargs)
 
         celery.Task = ContextTask
+    # Old-style name: Flask keys such as S3_BUCKET put Celery in old-setting mode
+    celery.conf.update(CELERY_ROUTES=task_routes)
     return celery
@@ -1,3 +1,8 @@
+import os
+
+# Size the database pool for a worker rather than a web process
+os.environ.setdefault('APP_PROCESS_TYPE', 'worker')
+
 from app import create_app
 from celery_app import make_celery
 
@@ -6,7 +11,10 @@ app, _ = create_app()
 celery = make_celery(app)
 
 # Import tasks so they get registered with this Celery instance
+import tasks.email_tasks  # noqa: F401
 import tasks.media_tasks  # noqa: F401
+import tasks.mpesa_tasks  # noqa: F401
+import tasks.affirmation_tasks  # noqa: F401
 # If tasks were defined as plain functions (synchronous fallback) when the
 # tasks module was first imported, ensure they are registered on this
 # Celery instance so the worker recognizes them.
@@ -26,3 +34,17 @@ try:
 except Exception:
 	# Do not fail app import if registration fails; worker logs will show issues
 	pass
+
+# Asynchronous M-Pesa checkout; routed to the payments queue (see celery_app.py)
+celery.task(name=tasks.mpesa_tasks.STK_PUSH_TASK, bind=True,
+            max_retries=tasks.mpesa_tasks.MAX_RETRIES)(tasks.mpesa_tasks.stk_push_task)
+
+# Queued email (see tasks/email_tasks.py); routed to the email queue
+celery.task(name=tasks.email_tasks.SEND_EMAIL_TASK, bind=True,
+            max_retries=tasks.email_tasks.MAX_RETRIES)(tasks.email_tasks.send_email_task)
+celery.task(name=tasks.email_tasks.SEND_EMAIL_BATCH_TASK, bind=True,
+            max_retries=tasks.email_tasks.MAX_RETRIES)(tasks.email_tasks.send_email_batch_task)
+
+# Affirmation fan-out (see tasks/affirmation_tasks.py); routed to the affirmations queue
+celery.task(name=tasks.affirmation_tasks.FAN_OUT_TASK, bind=True,
+            max_retries=tasks.affirmation_tasks.MAX_RETRIES)(tasks.affirmation_tasks.fan_out_affirmation_task)
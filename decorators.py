@@ -2,22 +2,19 @@ from functools import wraps
 from flask import abort, redirect, url_for, flash, current_app, request
 import os
 from flask_login import current_user
+from utils.endpoint_registry import mark_auth
 
 def roles_required(*roles):
+  # Normalised once at decoration time; the per-request check is one set lookup
+  allowed = frozenset(r.strip().lower() for r in roles)
+
   def wrapper(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-      try:
-        current_app.logger.info(
-          f"roles_required ENTRY: endpoint={getattr(request,'endpoint',None)} path={getattr(request,'path',None)} method={getattr(request,'method',None)} "
-          + f"current_user={getattr(current_user,'username',None)} role={getattr(current_user,'role',None)} allowed={roles} cookies={list(request.cookies.keys())}"
-        )
-      except Exception:
-        pass
       # Require authentication
       if not current_user.is_authenticated:
         try:
-          current_app.logger.info(f"roles_required: unauthenticated request to {request.path}; cookies={list(request.cookies.keys())}")
+          current_app.logger.debug('roles_required: unauthenticated request to %s', request.path)
         except Exception:
           pass
         flash('Please log in to access this page.', 'warning')
@@ -25,15 +22,15 @@ def roles_required(*roles):
 
       # Role check (case-insensitive to avoid mismatches)
       user_role = (current_user.role or '').strip()
-      allowed = [r.strip() for r in roles]
-      
+
       # Handle legacy 'Champion' role mapping
       if user_role.lower() == 'champion':
         user_role = 'Prevention Advocate'
 
-      if user_role.lower() not in [r.lower() for r in allowed]:
+      if user_role.lower() not in allowed:
         try:
-          current_app.logger.info(f"roles_required: role mismatch - user_role={user_role} allowed={allowed} redirecting; endpoint={request.endpoint} path={request.path}")
+          current_app.logger.debug('roles_required: role mismatch - user_role=%s allowed=%s redirecting; endpoint=%s path=%s',
+                                   user_role, sorted(allowed), request.endpoint, request.path)
         except Exception:
           pass
         flash('Access denied. You do not have the required permissions.', 'danger')
@@ -64,7 +61,7 @@ def roles_required(*roles):
         else:
           return redirect(url_for('auth.login'))
       return f(*args, **kwargs)
-    return decorated_function
+    return mark_auth(decorated_function, 'roles', allowed)
   return wrapper
 
 #Convenience Decorators for clarity
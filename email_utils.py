@@ -1,9 +1,13 @@
 """
 Email utility for sending notifications
 """
-from flask_mail import Mail, Message
+from flask_mail import BadHeaderError, Mail, Message
 from flask import current_app
 import os
+import smtplib
+import time
+
+from utils.circuit import get_breaker
 
 mail = Mail()
 
@@ -11,6 +15,134 @@ def init_mail(app):
     """Initialize Flask-Mail with app configuration"""
     mail.init_app(app)
 
+
+def _emails_disabled():
+    return bool(current_app.config.get('DISABLE_EMAILS') or current_app.config.get('DISABLE_EMAIL_IN_BUILD'))
+
+
+def build_message(to, subject, body, html=None):
+    msg = Message(subject=subject, sender=current_app.config['MAIL_DEFAULT_SENDER'], recipients=[to])
+    msg.body = body
+    if html:
+        msg.html = html
+    return msg
+
+
+def _is_permanent(exc):
+    """Errors that will fail the same way on retry (bad recipient, 5xx reply)."""
+    if isinstance(exc, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 500 <= exc.smtp_code < 600
+    return isinstance(exc, (BadHeaderError, AssertionError, ValueError))
+
+
+def send_messages(messages, rate=None):
+    """Send `messages` (dicts with to/subject/body/html) over one SMTP connection.
+
+    Sends at most `rate` messages per second (EMAIL_SEND_RATE; 0 for no
+    limit). Messages the server refuses permanently are logged and dropped.
+    On a connection-level error sending stops; returns the messages that
+    were not sent so the caller can retry them.
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    rate = current_app.config.get('EMAIL_SEND_RATE', 0) if rate is None else rate
+    interval = 1.0 / rate if rate else 0
+    breaker = get_breaker('smtp')
+    done = sent = 0
+    conn = mail.connect()
+    try:
+        # Connect, STARTTLS and log in once for the whole batch
+        breaker.call(conn.__enter__)
+    except Exception as e:
+        current_app.logger.warning('Could not open SMTP connection: %s', e)
+        return messages
+    try:
+        next_at = time.monotonic()
+        for m in messages:
+            if interval:
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_at = max(next_at, time.monotonic()) + interval
+            try:
+                conn.send(build_message(m['to'], m['subject'], m['body'], m.get('html')))
+                sent += 1
+            except Exception as e:
+                if not _is_permanent(e):
+                    breaker.record_failure()
+                    current_app.logger.warning('SMTP connection failed after %d of %d emails: %s',
+                                               done, len(messages), e)
+                    return messages[done:]
+                current_app.logger.error(f"Failed to send email to {m['to']}: {str(e)}")
+            done += 1
+    finally:
+        _track_emails(sent=sent, dropped=done - sent)
+        try:
+            conn.__exit__(None, None, None)
+        except Exception:
+            pass
+    return []
+
+
+def _track_emails(**counts):
+    try:
+        from metrics import track_emails
+        for outcome, count in counts.items():
+            if count:
+                track_emails(outcome, count)
+    except Exception:
+        pass
+
+
+def queue_email(to, subject, body, html=None):
+    """Send one email via the worker queue (EMAIL_ASYNC) or in-process.
+
+    Falls back to sending in-process if the broker can't be reached.
+    Returns True once the email is queued or sent.
+    """
+    if current_app.config.get('EMAIL_ASYNC'):
+        try:
+            from tasks.email_tasks import enqueue_email
+            enqueue_email(to, subject, body, html)
+            return True
+        except Exception as e:
+            current_app.logger.warning('Could not queue email to %s (%s); sending it now', to, e)
+    return send_email(to, subject, body, html)
+
+
+def queue_bulk_email(messages):
+    """Send many emails (dicts with to/subject/body/html) in rate-limited batches.
+
+    With EMAIL_ASYNC the messages are queued in EMAIL_BATCH_SIZE batches,
+    each sent by the worker over one SMTP connection; otherwise they are
+    sent here the same way. Returns the messages that were neither queued
+    nor sent (all of them when email is not configured).
+    """
+    messages = list(messages)
+    if not messages or _emails_disabled():
+        return messages
+    size = max(int(current_app.config.get('EMAIL_BATCH_SIZE', 50)), 1)
+    batches = [messages[i:i + size] for i in range(0, len(messages), size)]
+    queued = 0
+    if current_app.config.get('EMAIL_ASYNC'):
+        try:
+            from tasks.email_tasks import enqueue_email_batch
+            for batch in batches:
+                enqueue_email_batch(batch)
+                queued += len(batch)
+            return []
+        except Exception as e:
+            current_app.logger.warning('Could not queue email batch (%s); sending the rest now', e)
+    remaining = messages[queued:]
+    unsent = []
+    for i in range(0, len(remaining), size):
+        unsent.extend(send_messages(remaining[i:i + size]))
+    return unsent
+
+
 def send_password_email(recipient_email, username, temp_password):
     """
     Send temporary password to user's email
@@ -82,33 +214,15 @@ UNDA Youth Network Team
         current_app.logger.info(f"Email disabled by configuration; not sending password email to {recipient_email}")
         return False
 
-    # Try to enqueue via Celery if available, otherwise send synchronously
-    try:
-        # Import inside function to avoid import-time circular dependencies
-        from tasks.email_tasks import send_email_async
-        # Use delay() to enqueue
-        send_email_async.delay(recipient_email, subject, body)
-        return True
-    except Exception:
-        # Fallback to synchronous send
-        try:
-            msg = Message(subject=subject, sender=current_app.config['MAIL_DEFAULT_SENDER'], recipients=[recipient_email])
-            msg.body = body
-            msg.html = html
-            mail.send(msg)
-            return True
-        except Exception as e:
-            current_app.logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
-            return False
+    # Queue for the email worker when enabled, otherwise send synchronously
+    return queue_email(recipient_email, subject, body, html)
 
 def send_email(to, subject, body, html=None):
     """Generic helper to send an email synchronously. """
     try:
-        msg = Message(subject=subject, sender=current_app.config['MAIL_DEFAULT_SENDER'], recipients=[to])
-        msg.body = body
-        if html:
-            msg.html = html
-        mail.send(msg)
+        msg = build_message(to, subject, body, html)
+        get_breaker('smtp').call(mail.send, msg)
+        _track_emails(sent=1)
         return True
     except Exception as e:
         current_app.logger.error(f"Failed to send email to {to}: {str(e)}")
@@ -161,10 +275,5 @@ def send_invite_email(recipient_email, username, invite_token, expires_at=None):
         current_app.logger.info(f"Email disabled by configuration; not sending invite email to {recipient_email}")
         return False
 
-    # Try async enqueue first
-    try:
-        from tasks.email_tasks import send_email_async
-        send_email_async.delay(recipient_email, subject, body)
-        return True
-    except Exception:
-        return send_email(recipient_email, subject, body, html)
+    # Queue for the email worker when enabled, otherwise send synchronously
+    return queue_email(recipient_email, subject, body, html)
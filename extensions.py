@@ -1,9 +1,17 @@
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 import os
 
+from utils.rate_limit import on_rate_limit_breach, rate_limit_key
+
 # Initialize Limiter here to avoid circular imports
 # More generous limits for development, stricter for production
 is_production = os.environ.get('FLASK_ENV') == 'production'
 default_limits = ["1000 per day", "200 per hour"] if is_production else ["10000 per day", "1000 per hour"]
-limiter = Limiter(key_func=get_remote_address, default_limits=default_limits, storage_uri="memory://")
\ No newline at end of file
+
+# Per-endpoint limits, keyed per user (or client IP when anonymous)
+LOGIN_LIMIT = os.environ.get('RATELIMIT_LOGIN', '10 per minute')
+REGISTER_LIMIT = os.environ.get('RATELIMIT_REGISTER', '20 per hour')
+CHECKOUT_LIMIT = os.environ.get('RATELIMIT_CHECKOUT', '10 per minute')
+
+# Storage, strategy and fallback come from app config (utils.rate_limit.configure_rate_limit_storage)
+limiter = Limiter(key_func=rate_limit_key, default_limits=default_limits, on_breach=on_rate_limit_breach)
@@ -62,6 +62,171 @@ endpoint_response_time = Histogram(
     ['endpoint', 'method']
 )
 
+# Per-request database instrumentation (see utils/sql_instrumentation.py)
+db_queries_per_request = Histogram(
+    'unda_db_queries_per_request',
+    'SQL statements issued while handling a request',
+    ['endpoint'],
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250)
+)
+
+db_time_per_request = Histogram(
+    'unda_db_time_per_request_seconds',
+    'Total time spent executing SQL while handling a request',
+    ['endpoint']
+)
+
+db_slowest_statement = Histogram(
+    'unda_db_slowest_statement_seconds',
+    'Duration of the slowest SQL statement issued by a request',
+    ['endpoint']
+)
+
+# Read-replica routing (see utils/db_routing.py)
+replica_lag_seconds = Gauge(
+    'unda_db_replica_lag_seconds',
+    'Replication lag of each read replica at the last check',
+    ['replica']
+)
+
+db_route_decisions = Counter(
+    'unda_db_route_decisions_total',
+    'Read-routed requests by where their reads were served',
+    ['target']  # replica, pinned, replica_unavailable
+)
+
+# Connection pool health (see utils/db_pool.py)
+db_pool_checked_out = Gauge(
+    'unda_db_pool_checked_out',
+    'Connections currently checked out of the pool',
+    ['pool']
+)
+
+db_pool_overflow = Gauge(
+    'unda_db_pool_overflow',
+    'Connections open beyond pool_size',
+    ['pool']
+)
+
+db_pool_wait = Histogram(
+    'unda_db_pool_wait_seconds',
+    'Time spent waiting to check a connection out of the pool',
+    ['pool'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+db_pool_timeouts = Counter(
+    'unda_db_pool_timeouts_total',
+    'Checkouts that gave up after pool_timeout',
+    ['pool']
+)
+
+# Write-behind audit sink (see utils/audit_sink.py)
+audit_queue_depth = Gauge(
+    'unda_audit_queue_depth',
+    'Audit events waiting to be written',
+    ['backend']  # memory or redis
+)
+
+audit_events_dropped = Counter(
+    'unda_audit_events_dropped_total',
+    'Audit events discarded before reaching the database',
+    ['reason']  # queue_full, write_error, unknown_table
+)
+
+audit_events_written = Counter(
+    'unda_audit_events_written_total',
+    'Audit rows written by the audit sink'
+)
+
+# Shared executor behind endpoint_guard (see utils/endpoint_guard.py)
+endpoint_guard_in_flight = Gauge(
+    'unda_endpoint_guard_in_flight',
+    'Guarded handlers currently running, including ones whose request timed out'
+)
+
+endpoint_guard_queued = Gauge(
+    'unda_endpoint_guard_queued',
+    'Guarded handlers waiting for a free worker'
+)
+
+endpoint_guard_timeouts = Counter(
+    'unda_endpoint_guard_timeouts_total',
+    'Guarded requests that returned 504 before their handler finished',
+    ['handler']
+)
+
+endpoint_guard_rejected = Counter(
+    'unda_endpoint_guard_rejected_total',
+    'Guarded requests rejected with 503 without running the handler',
+    ['handler', 'reason']  # saturated, circuit_open
+)
+
+# Circuit breakers around external services (see utils/circuit.py)
+circuit_breaker_state = Gauge(
+    'unda_circuit_breaker_state',
+    'Circuit breaker state last seen by this process (0 closed, 1 half-open, 2 open)',
+    ['name']
+)
+
+circuit_breaker_transitions = Counter(
+    'unda_circuit_breaker_transitions_total',
+    'Circuit breaker state changes made by this process',
+    ['name', 'state']  # open, closed
+)
+
+circuit_breaker_rejected = Counter(
+    'unda_circuit_breaker_rejected_total',
+    'Calls rejected by an open or half-open circuit breaker',
+    ['name']
+)
+
+# Rate limiting (see utils/rate_limit.py)
+rate_limited_requests = Counter(
+    'unda_rate_limited_total',
+    'Requests rejected with 429 by the rate limiter',
+    ['endpoint']
+)
+
+# Outgoing email (see email_utils.py and tasks/email_tasks.py)
+emails = Counter(
+    'unda_emails_total',
+    'Emails by outcome',
+    ['outcome']  # queued, sent, dropped, retried
+)
+
+# Affirmation fan-out (services/affirmation_delivery_service.py)
+affirmation_deliveries = Counter(
+    'unda_affirmation_deliveries_total',
+    'Affirmation deliveries by channel and outcome',
+    ['channel', 'outcome']  # recorded, sent, unsent, failed
+)
+
+affirmation_fanout_seconds = Histogram(
+    'unda_affirmation_fanout_seconds',
+    'Duration of an affirmation fan-out run',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 900)
+)
+
+# M-Pesa payments ledger (see services/payment_service.py)
+mpesa_callbacks = Counter(
+    'unda_mpesa_callbacks_total',
+    'M-Pesa STK callbacks received',
+    ['outcome']  # applied, duplicate, unknown, invalid, forbidden, error
+)
+
+mpesa_callback_seconds = Histogram(
+    'unda_mpesa_callback_seconds',
+    'Time spent handling an M-Pesa STK callback',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+
+payment_status_lookups = Counter(
+    'unda_payment_status_lookups_total',
+    'Payment status lookups by where the answer came from',
+    ['source']  # cache, ledger, daraja, missing
+)
+
 
 def track_role_request(endpoint_name):
     """Decorator to track requests by user role"""
@@ -113,3 +278,112 @@ def update_database_metrics(db_session):
         database_records.labels(table='referrals').set(db_session.query(RefferalPathway).count())
     except Exception:
         pass  # Ignore errors during metric updates
+
+
+def track_request_timing(endpoint, method, duration, query_count, db_time, slowest):
+    """Record endpoint latency and its database share"""
+    endpoint_response_time.labels(endpoint=endpoint, method=method).observe(duration)
+    db_queries_per_request.labels(endpoint=endpoint).observe(query_count)
+    db_time_per_request.labels(endpoint=endpoint).observe(db_time)
+    if query_count:
+        db_slowest_statement.labels(endpoint=endpoint).observe(slowest)
+
+
+def track_db_route(target):
+    """Track where a read-routed request sent its queries"""
+    db_route_decisions.labels(target=target).inc()
+
+
+def track_db_pool_usage(pool_name, pool):
+    """Update checked-out and overflow gauges for a QueuePool"""
+    db_pool_checked_out.labels(pool=pool_name).set(pool.checkedout())
+    db_pool_overflow.labels(pool=pool_name).set(max(pool.overflow(), 0))
+
+
+def track_db_pool_checkout(pool_name, wait, pool):
+    """Track a pool checkout and how long it waited"""
+    db_pool_wait.labels(pool=pool_name).observe(wait)
+    track_db_pool_usage(pool_name, pool)
+
+
+def track_db_pool_timeout(pool_name):
+    """Track a checkout that timed out waiting for a connection"""
+    db_pool_timeouts.labels(pool=pool_name).inc()
+
+
+def track_audit_queue_depth(backend, depth):
+    """Update the audit sink queue depth"""
+    audit_queue_depth.labels(backend=backend).set(depth)
+
+
+def track_audit_dropped(reason, count=1):
+    """Track audit events the sink had to discard"""
+    audit_events_dropped.labels(reason=reason).inc(count)
+
+
+def track_audit_written(count):
+    """Track audit rows written in a flush"""
+    audit_events_written.inc(count)
+
+
+def track_guard_usage(in_flight, queued):
+    """Update the endpoint guard in-flight and queued gauges"""
+    endpoint_guard_in_flight.set(in_flight)
+    endpoint_guard_queued.set(queued)
+
+
+def track_guard_timeout(handler):
+    """Track a guarded request that timed out"""
+    endpoint_guard_timeouts.labels(handler=handler).inc()
+
+
+def track_guard_rejected(handler, reason):
+    """Track a guarded request rejected before running"""
+    endpoint_guard_rejected.labels(handler=handler, reason=reason).inc()
+
+
+def track_circuit_state(name, value):
+    """Update the circuit breaker state gauge"""
+    circuit_breaker_state.labels(name=name).set(value)
+
+
+def track_circuit_transition(name, state, value):
+    """Track a circuit breaker opening or closing"""
+    circuit_breaker_transitions.labels(name=name, state=state).inc()
+    circuit_breaker_state.labels(name=name).set(value)
+
+
+def track_circuit_rejected(name):
+    """Track a call rejected by a circuit breaker"""
+    circuit_breaker_rejected.labels(name=name).inc()
+
+
+def track_mpesa_callback(outcome, duration):
+    """Track an M-Pesa callback and how long it took to apply"""
+    mpesa_callbacks.labels(outcome=outcome).inc()
+    mpesa_callback_seconds.observe(duration)
+
+
+def track_payment_status_lookup(source):
+    """Track where a payment status lookup was answered from"""
+    payment_status_lookups.labels(source=source or 'missing').inc()
+
+
+def track_rate_limited(endpoint):
+    """Track a request rejected by the rate limiter"""
+    rate_limited_requests.labels(endpoint=endpoint).inc()
+
+
+def track_emails(outcome, count=1):
+    """Track emails queued, sent, dropped (refused permanently) or retried"""
+    emails.labels(outcome=outcome).inc(count)
+
+
+def track_affirmation_deliveries(channel, outcome, count=1):
+    """Track affirmation deliveries recorded, sent, unsent or failed per channel"""
+    affirmation_deliveries.labels(channel=channel, outcome=outcome).inc(count)
+
+
+def track_affirmation_fanout(duration):
+    """Track how long an affirmation fan-out run took"""
+    affirmation_fanout_seconds.observe(duration)
@@ -0,0 +1,121 @@
+"""split media_gallery.media_items JSON into a normalized media_items table
+
+Revision ID: zzaf_add_media_items
+Revises: zzae_add_category
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from utils.media import normalize_media_src, infer_type_from_path
+
+
+# revision identifiers, used by Alembic.
+revision = 'zzaf_add_media_items'
+down_revision = 'zzae_add_category'
+branch_labels = None
+depends_on = None
+
+# Keys promoted to their own columns; everything else is kept in `metadata`.
+COLUMN_KEYS = ('type', 'src', 'thumbnail', 'variants', 'path', 'filename', 'caption')
+
+
+def _split_item(gallery_id, position, item):
+    src = normalize_media_src(item)
+    raw_type = item.get('type') or 'photo'
+    thumbnail = item.get('thumbnail') or None
+    if thumbnail == src:
+        thumbnail = None
+    return {
+        'gallery_id': gallery_id,
+        'position': position,
+        'type': infer_type_from_path(item.get('filename') or src, fallback=raw_type, item_type=raw_type),
+        'src': src,
+        'thumbnail': thumbnail,
+        'variants': item.get('variants') or None,
+        'path': item.get('path') or item.get('url') or item.get('file_url'),
+        'filename': item.get('filename'),
+        'caption': item.get('caption'),
+        'metadata': {k: v for k, v in item.items() if k not in COLUMN_KEYS} or None,
+    }
+
+
+def upgrade():
+    media_items = op.create_table(
+        'media_items',
+        sa.Column('media_item_id', sa.Integer(), nullable=False),
+        sa.Column('gallery_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('type', sa.String(length=20), nullable=False, server_default='photo'),
+        sa.Column('src', sa.String(length=1000), nullable=True),
+        sa.Column('thumbnail', sa.String(length=1000), nullable=True),
+        sa.Column('variants', sa.JSON(), nullable=True),
+        sa.Column('path', sa.String(length=1000), nullable=True),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('caption', sa.Text(), nullable=True),
+        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['gallery_id'], ['media_gallery.gallery_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('media_item_id'),
+    )
+    op.create_index('ix_media_items_gallery_position', 'media_items', ['gallery_id', 'position'], unique=False)
+
+    # Copy existing JSON arrays into rows, one gallery at a time
+    conn = op.get_bind()
+    gallery = sa.table(
+        'media_gallery',
+        sa.column('gallery_id', sa.Integer()),
+        sa.column('media_items', sa.JSON()),
+    )
+    for gallery_id, items in conn.execute(sa.select(gallery.c.gallery_id, gallery.c.media_items)):
+        rows = [
+            _split_item(gallery_id, position, item)
+            for position, item in enumerate(items or [])
+            if isinstance(item, dict)
+        ]
+        if rows:
+            op.bulk_insert(media_items, rows)
+
+    with op.batch_alter_table('media_gallery') as batch_op:
+        batch_op.drop_column('media_items')
+
+
+def downgrade():
+    op.add_column('media_gallery', sa.Column('media_items', sa.JSON(), nullable=True))
+
+    # Fold rows back into the JSON column
+    conn = op.get_bind()
+    items = sa.table(
+        'media_items',
+        sa.column('gallery_id', sa.Integer()),
+        sa.column('position', sa.Integer()),
+        sa.column('type', sa.String()),
+        sa.column('src', sa.String()),
+        sa.column('thumbnail', sa.String()),
+        sa.column('variants', sa.JSON()),
+        sa.column('path', sa.String()),
+        sa.column('filename', sa.String()),
+        sa.column('caption', sa.Text()),
+        sa.column('metadata', sa.JSON()),
+    )
+    gallery = sa.table(
+        'media_gallery',
+        sa.column('gallery_id', sa.Integer()),
+        sa.column('media_items', sa.JSON()),
+    )
+    grouped = {}
+    for row in conn.execute(sa.select(items).order_by(items.c.gallery_id, items.c.position)):
+        data = row._mapping
+        item = dict(data['metadata'] or {})
+        for key in ('type', 'thumbnail', 'variants', 'path', 'filename', 'caption'):
+            if data[key] is not None:
+                item.setdefault(key, data[key])
+        grouped.setdefault(data['gallery_id'], []).append(item)
+    for gallery_id, gallery_items in grouped.items():
+        conn.execute(
+            gallery.update().where(gallery.c.gallery_id == gallery_id).values(media_items=gallery_items)
+        )
+
+    op.drop_index('ix_media_items_gallery_position', table_name='media_items')
+    op.drop_table('media_items')
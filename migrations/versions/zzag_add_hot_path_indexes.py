@@ -0,0 +1,71 @@
+"""add composite and partial indexes for hot filter and sort columns
+
+Revision ID: zzag_add_hot_path_indexes
+Revises: zzaf_add_media_items
+Create Date: 2026-10-19 11:00:00.000000
+
+On PostgreSQL the indexes are built CONCURRENTLY (outside the migration
+transaction) so large tables stay writable while they build. Other dialects
+create them normally.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'zzag_add_hot_path_indexes'
+down_revision = 'zzaf_add_media_items'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, partial WHERE clause or None)
+INDEXES = [
+    ('ix_champions_supervisor_status_risk', 'champions', ['supervisor_id', 'champion_status', 'risk_level'], None),
+    ('ix_champions_champion_status', 'champions', ['champion_status'], None),
+    ('ix_champions_risk_level', 'champions', ['risk_level'], None),
+    ('ix_champions_next_review_date', 'champions', ['next_review_date'], 'next_review_date IS NOT NULL'),
+    ('ix_training_records_next_refresher_due', 'training_records', ['next_refresher_due_date'], 'next_refresher_due_date IS NOT NULL'),
+    ('ix_events_type_date', 'events', ['event_type', 'event_date'], None),
+    ('ix_events_submission_status', 'events', ['submission_status'], 'submission_status IS NOT NULL'),
+    ('ix_blog_posts_published_published_at', 'blog_posts', ['published', 'published_at'], None),
+    ('ix_member_registrations_status_submitted', 'member_registrations', ['status', 'submitted_at'], None),
+    ('ix_champion_applications_status_submitted', 'champion_applications', ['status', 'submitted_at'], None),
+    ('ix_event_participations_event_id', 'event_participations', ['event_id'], None),
+    ('ix_affirmation_deliveries_champion_date', 'affirmation_deliveries', ['champion_id', 'delivery_date'], None),
+]
+
+
+def _is_postgres():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def upgrade():
+    if _is_postgres():
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with op.get_context().autocommit_block():
+            for name, table, columns, where in INDEXES:
+                op.create_index(
+                    name, table, columns, unique=False, if_not_exists=True,
+                    postgresql_concurrently=True,
+                    postgresql_where=sa.text(where) if where else None,
+                )
+        return
+
+    for name, table, columns, where in INDEXES:
+        op.create_index(
+            name, table, columns, unique=False,
+            sqlite_where=sa.text(where) if where else None,
+        )
+
+
+def downgrade():
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            for name, table, _columns, _where in reversed(INDEXES):
+                op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
+        return
+
+    for name, table, _columns, _where in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,49 @@
+"""add champion_code_counters and seed them from existing champion codes
+
+Revision ID: zzah_add_champion_code_counters
+Revises: zzag_add_hot_path_indexes
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'zzah_add_champion_code_counters'
+down_revision = 'zzag_add_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+CODE_PATTERN = re.compile(r'^UMV-(\d{4})-(\d+)$')
+
+
+def upgrade():
+    counters = op.create_table(
+        'champion_code_counters',
+        sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('last_value', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('year'),
+    )
+
+    # Seed one counter per year from the highest code already issued
+    conn = op.get_bind()
+    champions = sa.table('champions', sa.column('assigned_champion_code', sa.String()))
+    highest = {}
+    rows = conn.execute(
+        sa.select(champions.c.assigned_champion_code).where(champions.c.assigned_champion_code.like('UMV-%'))
+    )
+    for (code,) in rows:
+        match = CODE_PATTERN.match(code or '')
+        if match:
+            year, number = int(match.group(1)), int(match.group(2))
+            highest[year] = max(highest.get(year, 0), number)
+
+    if highest:
+        op.bulk_insert(counters, [{'year': year, 'last_value': value} for year, value in sorted(highest.items())])
+
+
+def downgrade():
+    op.drop_table('champion_code_counters')
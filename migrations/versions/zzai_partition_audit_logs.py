@@ -0,0 +1,171 @@
+"""partition audit log tables by month on PostgreSQL
+
+Revision ID: zzai_partition_audit_logs
+Revises: zzah_add_champion_code_counters
+Create Date: 2026-10-19 15:00:00.000000
+
+`access_audit_logs` and `clinician_audit_log` are rebuilt as tables range
+partitioned by month on their timestamp column. Partitions are created from
+the oldest existing row through three months ahead, plus a DEFAULT partition
+so an insert never fails when maintenance falls behind; rows are copied
+across and the old tables dropped. The primary keys become
+(id, timestamp) because PostgreSQL requires the partition key in them.
+
+New partitions and archival of old ones are handled by
+`scripts/maintain_audit_partitions.py`. Other dialects only get the lookup
+indexes.
+
+"""
+from datetime import date
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'zzai_partition_audit_logs'
+down_revision = 'zzah_add_champion_code_counters'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+ACCESS_COLUMNS = """
+    log_id INTEGER NOT NULL DEFAULT nextval('access_audit_logs_log_id_seq'),
+    user_id INTEGER REFERENCES users (user_id) ON DELETE SET NULL,
+    champion_id INTEGER REFERENCES champions (champion_id) ON DELETE CASCADE,
+    action VARCHAR(100) NOT NULL,
+    "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    ip_address VARCHAR(50),
+    details TEXT
+"""
+
+CLINICIAN_COLUMNS = """
+    audit_id INTEGER NOT NULL DEFAULT nextval('clinician_audit_log_audit_id_seq'),
+    clinician_id INTEGER NOT NULL REFERENCES clinician_profiles (clinician_id) ON DELETE CASCADE,
+    action VARCHAR(100) NOT NULL,
+    performed_by_user_id INTEGER REFERENCES users (user_id) ON DELETE SET NULL,
+    notes TEXT,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+"""
+
+# table -> (id column, partition column, column DDL, indexes as (name, columns))
+TABLES = {
+    'access_audit_logs': ('log_id', 'timestamp', ACCESS_COLUMNS, [
+        ('ix_access_audit_logs_champion_timestamp', ['champion_id', 'timestamp']),
+    ]),
+    'clinician_audit_log': ('audit_id', 'created_at', CLINICIAN_COLUMNS, [
+        ('ix_clinician_audit_log_clinician_created', ['clinician_id', 'created_at']),
+        ('ix_clinician_audit_log_action', ['action']),
+        ('ix_clinician_audit_log_created_at', ['created_at']),
+    ]),
+}
+
+# Indexes the tables had before this revision, restored on downgrade
+LEGACY_INDEXES = {
+    'access_audit_logs': [],
+    'clinician_audit_log': [
+        ('ix_clinician_audit_log_action', ['action']),
+        ('ix_clinician_audit_log_created_at', ['created_at']),
+    ],
+}
+
+# Indexes every dialect gets (PostgreSQL gets them on the partitioned table)
+LOOKUP_INDEXES = [
+    ('ix_access_audit_logs_champion_timestamp', 'access_audit_logs', ['champion_id', 'timestamp']),
+    ('ix_clinician_audit_log_clinician_created', 'clinician_audit_log', ['clinician_id', 'created_at']),
+]
+
+
+def _is_postgres():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _quote(name):
+    return f'"{name}"'
+
+
+def _first_month(table, column):
+    today = date.today().replace(day=1)
+    if context.is_offline_mode():
+        return today
+    oldest = op.get_bind().execute(sa.text(f'SELECT min({_quote(column)}) FROM {table}_legacy')).scalar()
+    return min(oldest.date().replace(day=1), today) if oldest else today
+
+
+def _column_list(table):
+    names = [line.split()[0] for line in TABLES[table][2].strip().splitlines()]
+    return ', '.join(names)
+
+
+def _create_indexes(table, indexes):
+    for name, index_columns in indexes:
+        op.execute(f'CREATE INDEX {name} ON {table} ({", ".join(_quote(c) for c in index_columns)})')
+
+
+def _partition(table, month):
+    name = f'{table}_y{month.year}m{month.month:02d}'
+    op.execute(
+        f"CREATE TABLE {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    )
+
+
+def upgrade():
+    if not _is_postgres():
+        for name, table, columns in LOOKUP_INDEXES:
+            op.create_index(name, table, columns)
+        return
+
+    for table, (id_column, partition_column, columns, indexes) in TABLES.items():
+        for name, _ in indexes:
+            op.execute(f'DROP INDEX IF EXISTS {name}')
+        op.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+        op.execute(f'ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey')
+
+        op.execute(
+            f'CREATE TABLE {table} ({columns}, PRIMARY KEY ({id_column}, {_quote(partition_column)})) '
+            f'PARTITION BY RANGE ({_quote(partition_column)})'
+        )
+        # Keep the id sequence when the legacy table is dropped
+        op.execute(f'ALTER SEQUENCE {table}_{id_column}_seq OWNED BY {table}.{id_column}')
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+        month = _first_month(table, partition_column)
+        last = _add_months(date.today().replace(day=1), MONTHS_AHEAD)
+        while month <= last:
+            _partition(table, month)
+            month = _add_months(month, 1)
+
+        _create_indexes(table, indexes)
+
+        columns_sql = _column_list(table)
+        op.execute(f'INSERT INTO {table} ({columns_sql}) SELECT {columns_sql} FROM {table}_legacy')
+        op.execute(f'DROP TABLE {table}_legacy')
+
+
+def downgrade():
+    if not _is_postgres():
+        for name, table, _ in reversed(LOOKUP_INDEXES):
+            op.drop_index(name, table_name=table)
+        return
+
+    for table, (id_column, partition_column, columns, indexes) in TABLES.items():
+        op.execute(f'ALTER TABLE {table} RENAME TO {table}_partitioned')
+        op.execute(f'ALTER TABLE {table}_partitioned RENAME CONSTRAINT {table}_pkey TO {table}_partitioned_pkey')
+        for name, _ in indexes:
+            op.execute(f'DROP INDEX IF EXISTS {name}')
+
+        op.execute(f'CREATE TABLE {table} ({columns}, PRIMARY KEY ({id_column}))')
+        op.execute(f'ALTER SEQUENCE {table}_{id_column}_seq OWNED BY {table}.{id_column}')
+        _create_indexes(table, LEGACY_INDEXES[table])
+
+        columns_sql = _column_list(table)
+        op.execute(f'INSERT INTO {table} ({columns_sql}) SELECT {columns_sql} FROM {table}_partitioned')
+        # Dropping the parent drops every partition with it
+        op.execute(f'DROP TABLE {table}_partitioned')
@@ -0,0 +1,49 @@
+"""add payments ledger for M-Pesa STK push
+
+Revision ID: zzaj_add_payments_table
+Revises: zzai_partition_audit_logs
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'zzaj_add_payments_table'
+down_revision = 'zzai_partition_audit_logs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'payments',
+        sa.Column('checkout_request_id', sa.String(length=100), nullable=False),
+        sa.Column('merchant_request_id', sa.String(length=100), nullable=True),
+        sa.Column('idempotency_key', sa.String(length=128), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('phone_number', sa.String(length=20), nullable=True),
+        sa.Column('amount', sa.Integer(), nullable=True),
+        sa.Column('account_reference', sa.String(length=100), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('result_code', sa.Integer(), nullable=True),
+        sa.Column('result_desc', sa.String(length=255), nullable=True),
+        sa.Column('mpesa_receipt', sa.String(length=50), nullable=True),
+        sa.Column('transaction_date', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('checkout_request_id'),
+    )
+    op.create_index('ix_payments_idempotency_key', 'payments', ['idempotency_key'])
+    op.create_index('ix_payments_user_id', 'payments', ['user_id'])
+    op.create_index('ix_payments_status_created', 'payments', ['status', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_payments_status_created', table_name='payments')
+    op.drop_index('ix_payments_user_id', table_name='payments')
+    op.drop_index('ix_payments_idempotency_key', table_name='payments')
+    op.drop_table('payments')
@@ -0,0 +1,68 @@
+"""add unique (affirmation_id, champion_id) index for affirmation fan-out
+
+Revision ID: zzak_add_affirmation_delivery_index
+Revises: zzaj_add_payments_table
+Create Date: 2026-10-19 20:00:00.000000
+
+The fan-out job claims champions with INSERT ... ON CONFLICT DO NOTHING on
+this index and pages through champions with a NOT EXISTS check against it;
+it also serves the per-affirmation delivery stats. Duplicate deliveries from
+earlier manual sends are merged first: the oldest row is kept and takes the
+engagement (viewed, viewed_at, liked) of its duplicates. Built CONCURRENTLY
+on PostgreSQL.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'zzak_add_affirmation_delivery_index'
+down_revision = 'zzaj_add_payments_table'
+branch_labels = None
+depends_on = None
+
+INDEX = 'uq_affirmation_deliveries_affirmation_champion'
+TABLE = 'affirmation_deliveries'
+
+_SAME_PAIR = (f'FROM {TABLE} d WHERE d.affirmation_id = {TABLE}.affirmation_id '
+              f'AND d.champion_id = {TABLE}.champion_id')
+_KEPT_ROWS = (f'SELECT MIN(delivery_id) FROM {TABLE} '
+              f'GROUP BY affirmation_id, champion_id HAVING COUNT(*) > 1')
+
+
+def _is_postgres():
+    return op.get_bind().dialect.name == 'postgresql'
+
+
+def _merge_duplicates():
+    op.execute(sa.text(
+        f'UPDATE {TABLE} SET '
+        f'viewed = EXISTS (SELECT 1 {_SAME_PAIR} AND d.viewed), '
+        f'viewed_at = (SELECT MIN(d.viewed_at) {_SAME_PAIR}), '
+        f'liked = EXISTS (SELECT 1 {_SAME_PAIR} AND d.liked) '
+        f'WHERE delivery_id IN ({_KEPT_ROWS})'
+    ))
+    op.execute(sa.text(
+        f'DELETE FROM {TABLE} WHERE delivery_id NOT IN ('
+        f'SELECT MIN(delivery_id) FROM {TABLE} GROUP BY affirmation_id, champion_id)'
+    ))
+
+
+def upgrade():
+    _merge_duplicates()
+    if _is_postgres():
+        # Commits the merge; CREATE INDEX CONCURRENTLY cannot run in a transaction
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX, TABLE, ['affirmation_id', 'champion_id'], unique=True,
+                            if_not_exists=True, postgresql_concurrently=True)
+        return
+    op.create_index(INDEX, TABLE, ['affirmation_id', 'champion_id'], unique=True)
+
+
+def downgrade():
+    if _is_postgres():
+        with op.get_context().autocommit_block():
+            op.drop_index(INDEX, table_name=TABLE, if_exists=True, postgresql_concurrently=True)
+        return
+    op.drop_index(INDEX, table_name=TABLE)
@@ -3,9 +3,11 @@ from flask_login import UserMixin
 from datetime import datetime, date, timezone
 from bcrypt import hashpw, gensalt, checkpw
 import re
+from utils.db_routing import RoutingSession
 
 
-db = SQLAlchemy()
+# RoutingSession sends reads of replica-routed requests to DATABASE_REPLICA_URL
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 #Helper function for password hashing
 def hash_password(password):
@@ -313,6 +315,19 @@ class Champion(db.Model):
     cascade='all, delete-orphan',
     passive_deletes=True,
   )
+
+  __table_args__ = (
+    # Supervisor caseload filters: supervisor_id, then status and risk
+    db.Index('ix_champions_supervisor_status_risk', 'supervisor_id', 'champion_status', 'risk_level'),
+    db.Index('ix_champions_champion_status', 'champion_status'),
+    db.Index('ix_champions_risk_level', 'risk_level'),
+    # Overdue review lookups only ever consider champions with a scheduled review
+    db.Index(
+      'ix_champions_next_review_date', 'next_review_date',
+      postgresql_where=db.text('next_review_date IS NOT NULL'),
+      sqlite_where=db.text('next_review_date IS NOT NULL'),
+    ),
+  )
   
   @property
   def age(self):
@@ -346,7 +361,14 @@ class TrainingRecord(db.Model):
   symbolic_item_type = db.Column(db.String(100))  # Badge, Kit, Certificate, etc.
   symbolic_item_date = db.Column(db.Date)
 
-  __table_args__ = (db.UniqueConstraint('champion_id', 'training_module', name='_champion_module_uc'),)
+  __table_args__ = (
+    db.UniqueConstraint('champion_id', 'training_module', name='_champion_module_uc'),
+    db.Index(
+      'ix_training_records_next_refresher_due', 'next_refresher_due_date',
+      postgresql_where=db.text('next_refresher_due_date IS NOT NULL'),
+      sqlite_where=db.text('next_refresher_due_date IS NOT NULL'),
+    ),
+  )
 
 
 class YouthSupport(db.Model):
@@ -406,7 +428,12 @@ class RefferalPathway(db.Model):
 
 
 class AccessAuditLog(db.Model):
-  """Tracks who accessed sensitive champion data for privacy compliance."""
+  """Tracks who accessed sensitive champion data for privacy compliance.
+
+  On PostgreSQL the table is range partitioned by month on `timestamp`
+  (see services/audit_partition_service.py); bound lookups by timestamp so
+  only recent partitions are scanned.
+  """
   __tablename__ = 'access_audit_logs'
   log_id = db.Column(db.Integer, primary_key=True)
   user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='SET NULL'))
@@ -416,6 +443,61 @@ class AccessAuditLog(db.Model):
   ip_address = db.Column(db.String(50))
   details = db.Column(db.Text)  # additional context
 
+  __table_args__ = (
+    db.Index('ix_access_audit_logs_champion_timestamp', 'champion_id', 'timestamp'),
+  )
+
+
+
+class Payment(db.Model):
+  """M-Pesa STK push payments, one row per Daraja CheckoutRequestID.
+
+  Written as `pending` when Daraja accepts the push and settled by the
+  callback (see services/payment_service.py). Status is one of `pending`,
+  `paid`, `failed` or `cancelled`.
+  """
+  __tablename__ = 'payments'
+
+  checkout_request_id = db.Column(db.String(100), primary_key=True)
+  merchant_request_id = db.Column(db.String(100))
+  idempotency_key = db.Column(db.String(128), index=True)
+  user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='SET NULL'), index=True)
+  phone_number = db.Column(db.String(20))
+  amount = db.Column(db.Integer)
+  account_reference = db.Column(db.String(100))
+
+  status = db.Column(db.String(20), nullable=False, default='pending')
+  result_code = db.Column(db.Integer)
+  result_desc = db.Column(db.String(255))
+  mpesa_receipt = db.Column(db.String(50))
+  transaction_date = db.Column(db.DateTime)
+
+  created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  completed_at = db.Column(db.DateTime)
+
+  __table_args__ = (
+    # Stale pending payments are re-checked with stkpushquery
+    db.Index('ix_payments_status_created', 'status', 'created_at'),
+  )
+
+  def to_dict(self):
+    return {
+      'checkout_request_id': self.checkout_request_id,
+      'merchant_request_id': self.merchant_request_id,
+      'user_id': self.user_id,
+      'phone_number': self.phone_number,
+      'amount': self.amount,
+      'account_reference': self.account_reference,
+      'status': self.status,
+      'result_code': self.result_code,
+      'result_desc': self.result_desc,
+      'mpesa_receipt': self.mpesa_receipt,
+      'transaction_date': self.transaction_date.isoformat() if self.transaction_date else None,
+      'created_at': self.created_at.isoformat() if self.created_at else None,
+      'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+      'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+    }
 
 def get_champions_needing_refresher(days_ahead=30):
   """Return champions whose next_refresher_due_date is within `days_ahead` days."""
@@ -564,31 +646,78 @@ def map_gad7_to_risk_category(score):
     }
 
 
+class ChampionCodeCounter(db.Model):
+  """Last champion code number issued per year (see generate_champion_code)."""
+  __tablename__ = 'champion_code_counters'
+
+  year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+  last_value = db.Column(db.Integer, nullable=False, default=0)
+
+
+def _max_issued_champion_number(prefix):
+  """Highest NNNNNN already used with `prefix`; scanned once per year at most."""
+  codes = db.session.query(Champion.assigned_champion_code)\
+    .filter(Champion.assigned_champion_code.like(f"{prefix}%"))
+  numbers = [int(code.split('-')[-1]) for (code,) in codes if code and code.split('-')[-1].isdigit()]
+  return max(numbers, default=0)
+
+
+def allocate_champion_number(year):
+  """Atomically reserve the next champion number for `year`.
+
+  The per-year row in `champion_code_counters` is incremented with a single
+  upsert, which holds the row lock until the caller's transaction ends, so
+  concurrent approvals never receive the same number and a rolled-back
+  approval releases its number.
+  """
+  table = ChampionCodeCounter.__table__
+  dialect_name = db.session.get_bind().dialect.name
+
+  if dialect_name in ('postgresql', 'sqlite'):
+    if dialect_name == 'postgresql':
+      from sqlalchemy.dialects.postgresql import insert
+    else:
+      from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table).values(year=year, last_value=1).on_conflict_do_update(
+      index_elements=[table.c.year],
+      set_={'last_value': table.c.last_value + 1},
+    ).returning(table.c.last_value)
+    value = db.session.execute(stmt).scalar_one()
+  else:
+    row = db.session.execute(
+      db.select(table.c.last_value).where(table.c.year == year).with_for_update()
+    ).first()
+    if row is None:
+      db.session.execute(table.insert().values(year=year, last_value=1))
+      value = 1
+    else:
+      value = row.last_value + 1
+      db.session.execute(table.update().where(table.c.year == year).values(last_value=value))
+
+  if value == 1:
+    # First number of the year: continue after any codes issued before the
+    # counter row existed (e.g. rows created before the counters migration).
+    issued = _max_issued_champion_number(f"UMV-{year}-")
+    if issued:
+      value = issued + 1
+      db.session.execute(table.update().where(table.c.year == year).values(last_value=value))
+
+  return value
+
+
 def generate_champion_code():
   """
   Generate unique champion code in format: UMV-YYYY-NNNNNN
   Example: UMV-2026-000001
+
+  Allocation is O(1) via `allocate_champion_number`; the number is only
+  consumed if the caller's transaction commits.
   """
-  from datetime import datetime
-  import random
-  
   year = datetime.now().year
-  
-  # Find the highest existing code for this year
-  prefix = f"UMV-{year}-"
-  existing_codes = db.session.query(Champion.assigned_champion_code)\
-    .filter(Champion.assigned_champion_code.like(f"{prefix}%"))\
-    .all()
-  
-  if existing_codes:
-    # Extract numbers and find max
-    numbers = [int(code[0].split('-')[-1]) for code in existing_codes if code[0]]
-    next_number = max(numbers) + 1 if numbers else 1
-  else:
-    next_number = 1
-  
+  next_number = allocate_champion_number(year)
+
   # Format with 6 digits, zero-padded
-  return f"{prefix}{next_number:06d}"
+  return f"UMV-{year}-{next_number:06d}"
 
 
 # ============================================================================
@@ -625,6 +754,16 @@ class Event(db.Model):
   published = db.Column(db.Boolean, default=False)  # Whether event is visible on public page
   published_at = db.Column(db.DateTime)  # When event was published
 
+  __table_args__ = (
+    db.Index('ix_events_type_date', 'event_type', 'event_date'),
+    # Only member submissions carry a submission_status; admin-created events are NULL
+    db.Index(
+      'ix_events_submission_status', 'submission_status',
+      postgresql_where=db.text('submission_status IS NOT NULL'),
+      sqlite_where=db.text('submission_status IS NOT NULL'),
+    ),
+  )
+
   def to_dict(self):
     return {
       # Snake case for Python/backend compatibility
@@ -691,6 +830,8 @@ class BlogPost(db.Model):
   # Relationships
   author = db.relationship('User', backref='blog_posts', foreign_keys=[author_id])
 
+  __table_args__ = (db.Index('ix_blog_posts_published_published_at', 'published', 'published_at'),)
+
   def to_dict(self):
     return {
       # Snake case for Python/backend compatibility
@@ -821,6 +962,12 @@ class AffirmationDelivery(db.Model):
   affirmation = db.relationship('DailyAffirmation', backref='deliveries')
   champion = db.relationship('Champion', backref='affirmation_deliveries')
 
+  __table_args__ = (
+    db.Index('ix_affirmation_deliveries_champion_date', 'champion_id', 'delivery_date'),
+    # One delivery per champion per affirmation; fan-out claims champions with it
+    db.Index('uq_affirmation_deliveries_affirmation_champion', 'affirmation_id', 'champion_id', unique=True),
+  )
+
 
 class EventParticipation(db.Model):
   """Tracks champion participation in events (especially quarterly pillar events)."""
@@ -851,6 +998,8 @@ class EventParticipation(db.Model):
   )
   champion = db.relationship('Champion', backref='event_participations')
 
+  __table_args__ = (db.Index('ix_event_participations_event_id', 'event_id'),)
+
 
 class SymbolicItem(db.Model):
   """Inventory and distribution of symbolic items (badges, kits, certificates)."""
@@ -909,7 +1058,6 @@ class MediaGallery(db.Model):
   title = db.Column(db.String(255), nullable=False)
   description = db.Column(db.Text)
   category = db.Column(db.String(100), nullable=True)
-  media_items = db.Column(db.JSON)  # list of {url, type, caption, metadata}
   featured_media = db.Column(db.String(500))
   
   # Event association - link gallery to an event
@@ -922,6 +1070,27 @@ class MediaGallery(db.Model):
   created_at = db.Column(db.DateTime, default=datetime.utcnow)
   updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+  # Individual media rows (see MediaItem). Read paths should load these with
+  # `selectinload(MediaGallery.items)` so a whole page of galleries costs a
+  # single extra query.
+  items = db.relationship(
+    'MediaItem',
+    backref='gallery',
+    order_by='MediaItem.position',
+    cascade='all, delete-orphan',
+    passive_deletes=True,
+  )
+
+  @property
+  def media_items(self):
+    """Normalised item dicts in display order (compatible with the old JSON column)."""
+    return [item.to_dict() for item in self.items]
+
+  @media_items.setter
+  def media_items(self, raw_items):
+    """Replace all items from a list of dicts, normalising `src`/`type` once at write time."""
+    self.items = [MediaItem.from_dict(item, position=idx) for idx, item in enumerate(raw_items or []) if isinstance(item, dict)]
+
   def to_dict(self):
     # Helper to convert local file paths to public media API URLs
     def normalize_url(url_or_path):
@@ -966,6 +1135,70 @@ class MediaGallery(db.Model):
     }
 
 
+class MediaItem(db.Model):
+  """A single photo/video/embed belonging to a MediaGallery.
+
+  `src` and `type` are resolved when the row is written so read paths can
+  serialise items without re-normalising them on every request.
+  """
+  __tablename__ = 'media_items'
+
+  # Keys stored in dedicated columns; everything else lands in `meta`.
+  COLUMN_KEYS = ('type', 'src', 'thumbnail', 'variants', 'path', 'filename', 'caption')
+
+  media_item_id = db.Column(db.Integer, primary_key=True)
+  gallery_id = db.Column(db.Integer, db.ForeignKey('media_gallery.gallery_id', ondelete='CASCADE'), nullable=False)
+  position = db.Column(db.Integer, nullable=False, default=0)
+  type = db.Column(db.String(20), nullable=False, default='photo')  # photo, video, youtube
+  src = db.Column(db.String(1000))  # public URL, e.g. /api/media/media_galleries/x.jpg
+  thumbnail = db.Column(db.String(1000))
+  variants = db.Column(db.JSON)  # optional {name: url} renditions
+  path = db.Column(db.String(1000))  # original upload path or URL, used to match thumbnail jobs
+  filename = db.Column(db.String(255))
+  caption = db.Column(db.Text)
+  meta = db.Column('metadata', db.JSON)  # remaining keys from the submitted item dict
+  created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+  __table_args__ = (db.Index('ix_media_items_gallery_position', 'gallery_id', 'position'),)
+
+  @classmethod
+  def from_dict(cls, item, position=0):
+    """Build a row from a submitted/legacy item dict."""
+    from utils.media import normalize_media_src, infer_type_from_path
+    src = normalize_media_src(item)
+    raw_type = item.get('type') or 'photo'
+    # Serialised items fall back to `src` for the thumbnail; don't persist that echo
+    thumbnail = item.get('thumbnail')
+    if thumbnail == src:
+      thumbnail = None
+    return cls(
+      position=position,
+      type=infer_type_from_path(item.get('filename') or src, fallback=raw_type, item_type=raw_type),
+      src=src,
+      thumbnail=thumbnail or None,
+      variants=item.get('variants') or None,
+      path=item.get('path') or item.get('url') or item.get('file_url'),
+      filename=item.get('filename'),
+      caption=item.get('caption'),
+      meta={k: v for k, v in item.items() if k not in cls.COLUMN_KEYS} or None,
+    )
+
+  def to_dict(self):
+    out = dict(self.meta or {})
+    if self.path and not (out.get('url') or out.get('file_url')):
+      out['path'] = self.path
+    if self.filename:
+      out['filename'] = self.filename
+    if self.caption is not None:
+      out['caption'] = self.caption
+    if self.variants:
+      out['variants'] = self.variants
+    out['type'] = self.type
+    out['src'] = self.src
+    out['thumbnail'] = self.thumbnail or self.src
+    return out
+
+
 class InstitutionalToolkitItem(db.Model):
   """Items for the institutional toolkit: guides, templates, checklists."""
   __tablename__ = 'institutional_toolkit'
@@ -1109,6 +1342,8 @@ class MemberRegistration(db.Model):
   
   # Token to allow a registrant to cancel their pending registration
   cancellation_token = db.Column(db.String(64), nullable=True, unique=True)
+
+  __table_args__ = (db.Index('ix_member_registrations_status_submitted', 'status', 'submitted_at'),)
   
   def set_password(self, password):
     self.password_hash = hash_password(password)
@@ -1177,6 +1412,8 @@ class ChampionApplication(db.Model):
   # Relationships
   user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('champion_applications', passive_deletes=True))
 
+  __table_args__ = (db.Index('ix_champion_applications_status_submitted', 'status', 'submitted_at'),)
+
 
 class SeedFundingApplication(db.Model):
   """Model for tracking seed funding applications from members under Campus Edition"""
@@ -1769,7 +2006,8 @@ class ClinicianAuditLog(db.Model):
   """Immutable audit trail for all clinician actions.
   
   Tracks: registration, verification, rejection, suspension, license renewal, etc.
-  Used for compliance and legal liability tracking.
+  Used for compliance and legal liability tracking. Range partitioned by
+  month on `created_at` on PostgreSQL.
   """
   __tablename__ = 'clinician_audit_log'
   
@@ -1783,6 +2021,10 @@ class ClinicianAuditLog(db.Model):
   # RELATIONSHIPS
   performed_by_user = db.relationship('User', foreign_keys=[performed_by_user_id])
 
+  __table_args__ = (
+    db.Index('ix_clinician_audit_log_clinician_created', 'clinician_id', 'created_at'),
+  )
+
 
 class YouthClinicianReferral(db.Model):
   """Tracks referrals from Prevention Advocates to Clinicians.
@@ -0,0 +1,61 @@
+"""Create upcoming audit log partitions and archive expired ones.
+
+Creates monthly partitions of `access_audit_logs` and `clinician_audit_log`
+for the coming months, then archives partitions older than the retention
+window to gzip-compressed NDJSON files and drops them. A no-op on
+databases other than PostgreSQL. Run it daily (cron or a scheduled job).
+
+Usage:
+  # Create partitions and archive anything past 24 months (defaults)
+  python scripts/maintain_audit_partitions.py
+
+  # Custom retention and archive location
+  python scripts/maintain_audit_partitions.py --retention-months 12 --archive-dir /var/backups/audit
+
+  # Only create partitions
+  python scripts/maintain_audit_partitions.py --skip-archive
+
+Defaults come from AUDIT_LOG_RETENTION_MONTHS and AUDIT_LOG_ARCHIVE_DIR.
+"""
+
+import argparse
+import os
+
+from app import create_app
+from services.audit_partition_service import archive_partitions, ensure_partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--months-ahead', type=int, default=3,
+                        help='Months of partitions to create beyond the current one (default: 3)')
+    parser.add_argument('--retention-months', type=int,
+                        default=int(os.environ.get('AUDIT_LOG_RETENTION_MONTHS', 24)),
+                        help='Archive partitions that ended more than this many months ago')
+    parser.add_argument('--archive-dir', default=os.environ.get('AUDIT_LOG_ARCHIVE_DIR'),
+                        help='Directory for archive files (default: <instance>/audit_archive)')
+    parser.add_argument('--skip-archive', action='store_true', help='Only create partitions')
+    args = parser.parse_args()
+
+    os.environ.setdefault('APP_PROCESS_TYPE', 'cli')
+    app, _ = create_app()
+    with app.app_context():
+        created = ensure_partitions(months_ahead=args.months_ahead)
+        print(f'Created {len(created)} partition(s)')
+        for name in created:
+            print(f'  + {name}')
+
+        if args.skip_archive:
+            return
+
+        archive_dir = args.archive_dir or os.path.join(app.instance_path, 'audit_archive')
+        reports = archive_partitions(args.retention_months, archive_dir)
+        for report in reports:
+            print(f"  archived {report['partition']}: {report['rows']} rows, {report['bytes']} bytes -> {report['path']}")
+        total_rows = sum(report['rows'] for report in reports)
+        total_bytes = sum(report['bytes'] for report in reports)
+        print(f'Archived {len(reports)} partition(s): {total_rows} rows, {total_bytes} bytes')
+
+
+if __name__ == '__main__':
+    main()
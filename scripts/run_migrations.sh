@@ -21,7 +21,7 @@ echo "Running migrations (flask db upgrade)..."
 LOGFILE=${MIGRATION_LOGFILE:-/tmp/migration.log}
 rm -f "$LOGFILE"
 set -o pipefail
-if ! (flask db upgrade 2>&1 | tee "$LOGFILE"); then
+if ! (APP_PROCESS_TYPE=cli flask db upgrade 2>&1 | tee "$LOGFILE"); then
   echo "MIGRATIONS FAILED" >&2
   if [ -n "${SENTRY_DSN:-}" ]; then
     # Send last part of the log to Sentry to provide context
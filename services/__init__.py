@@ -19,6 +19,7 @@ from . import story_service
 from . import symbolic_item_service
 from . import podcast_service
 from . import affirmation_service
+from . import affirmation_delivery_service
 from . import umv_service
 from . import file_utils
 from . import admin_metrics
@@ -43,6 +44,7 @@ __all__ = [
     'symbolic_item_service',
     'podcast_service',
     'affirmation_service',
+    'affirmation_delivery_service',
     'umv_service',
     'file_utils',
     'admin_metrics',
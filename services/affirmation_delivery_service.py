@@ -0,0 +1,325 @@
+"""Fan an affirmation out to every active champion.
+
+`fan_out_affirmation` walks active champions in `champion_id` order one
+keyset page at a time (`champion_id > :last ORDER BY champion_id LIMIT n`),
+so every page is an index range scan however deep into the table it is.
+For each page it:
+
+1. picks a channel per champion: the first of `channels` the champion can
+   be reached on (email address, phone number, or app account for push);
+2. writes the page's `AffirmationDelivery` rows with one executemany
+   INSERT ... ON CONFLICT DO NOTHING RETURNING champion_id and commits. The
+   unique (affirmation_id, champion_id) index makes the insert a claim:
+   champions another run got to first are dropped from the page;
+3. hands each channel's claimed recipients to that channel's sender on a
+   thread pool, with at most AFFIRMATION_SENDER_CONCURRENCY batches in
+   flight per channel. While a channel is saturated the next page waits, so
+   memory stays bounded by page size x concurrency.
+
+Champions who already have a delivery of the affirmation are skipped, so a
+run that dies part way can be started again. Champions a sender could not
+reach (a batch that raised, or emails left unsent when SMTP is down) have
+their rows deleted again so the next run retries them. `times_sent` is set
+once, at the end, from the affirmation's delivery rows.
+
+Email goes through `email_utils.queue_bulk_email` (the email worker with
+EMAIL_ASYNC, otherwise rate-limited SMTP in-process). No SMS or push
+provider is integrated yet; those senders log and report nothing sent, and
+the delivery rows still surface the affirmation in the app.
+"""
+import concurrent.futures
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+
+from flask import current_app
+from sqlalchemy import delete, exists, func, select, update
+
+from models import db, AffirmationDelivery, Champion, DailyAffirmation
+
+DEFAULT_CHANNELS = ('email', 'sms')
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_SENDER_CONCURRENCY = 4
+
+
+class UndeliveredError(Exception):
+    """Raised by a sender when some champions in its batch were not reached."""
+
+    def __init__(self, champions: list):
+        super().__init__(f'{len(champions)} champions not reached')
+        self.champions = champions
+
+
+class EmailSender:
+    method = 'Email'
+
+    def reachable(self, champion) -> bool:
+        return bool(champion.email)
+
+    def send(self, affirmation: dict, champions: list) -> int:
+        from email_utils import queue_bulk_email
+        subject = 'Your daily affirmation'
+        unsent = queue_bulk_email({
+            'to': c.email,
+            'subject': subject,
+            'body': f"Hello {c.full_name},\n\n{affirmation['content']}\n\nUNDA Youth Network Team\n",
+        } for c in champions)
+        if unsent:
+            # SMTP down (sent in-process) or email not configured
+            unsent_to = {m['to'] for m in unsent}
+            raise UndeliveredError([c for c in champions if c.email in unsent_to])
+        return len(champions)
+
+
+class SmsSender:
+    method = 'SMS'
+
+    def reachable(self, champion) -> bool:
+        return bool(champion.phone_number)
+
+    def send(self, affirmation: dict, champions: list) -> int:
+        current_app.logger.info('No SMS provider configured; %d affirmation SMS not sent', len(champions))
+        return 0
+
+
+class PushSender:
+    method = 'App Push'
+
+    def reachable(self, champion) -> bool:
+        return champion.user_id is not None
+
+    def send(self, affirmation: dict, champions: list) -> int:
+        current_app.logger.info('No push provider configured; %d affirmation pushes not sent', len(champions))
+        return 0
+
+
+CHANNEL_SENDERS = {
+    'email': EmailSender(),
+    'sms': SmsSender(),
+    'push': PushSender(),
+}
+
+
+def _track(channel, outcome, count):
+    if not count:
+        return
+    try:
+        from metrics import track_affirmation_deliveries
+        track_affirmation_deliveries(channel, outcome, count)
+    except Exception:
+        pass
+
+
+def _not_yet_reached(affirmation_id: int):
+    """Filter for active champions without a delivery of this affirmation."""
+    already_delivered = exists().where(
+        AffirmationDelivery.affirmation_id == affirmation_id,
+        AffirmationDelivery.champion_id == Champion.champion_id,
+    )
+    return (Champion.champion_status == 'Active') & ~already_delivered
+
+
+def pending_champion_count(affirmation_id: int) -> int:
+    """Active champions a fan-out of this affirmation would still reach."""
+    return db.session.execute(
+        select(func.count()).select_from(Champion).where(_not_yet_reached(affirmation_id))
+    ).scalar_one()
+
+
+def _target_pages(affirmation_id: int, chunk_size: int):
+    """Yield pages of active champions without a delivery of this affirmation."""
+    last_id = 0
+    while True:
+        page = db.session.execute(
+            select(Champion.champion_id, Champion.full_name, Champion.email,
+                   Champion.phone_number, Champion.user_id)
+            .where(Champion.champion_id > last_id, _not_yet_reached(affirmation_id))
+            .order_by(Champion.champion_id)
+            .limit(chunk_size)
+        ).all()
+        if not page:
+            return
+        yield page
+        last_id = page[-1].champion_id
+
+
+def _claim(table, rows: list) -> set:
+    """Insert delivery rows, skipping champions that already have one.
+
+    Returns the champion ids actually inserted. The unique
+    (affirmation_id, champion_id) index makes the insert the claim, so two
+    runs of the same affirmation never both send to a champion.
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        db.session.execute(table.insert(), rows)
+        return {row['champion_id'] for row in rows}
+    stmt = (insert(table)
+            .on_conflict_do_nothing(index_elements=[table.c.affirmation_id, table.c.champion_id])
+            .returning(table.c.champion_id))
+    return set(db.session.execute(stmt, rows).scalars())
+
+
+class _ChannelPool:
+    """Thread pool that bounds in-flight sender batches per channel."""
+
+    def __init__(self, app, channels: Iterable[str], concurrency: int):
+        self.app = app
+        self.slots = {channel: threading.BoundedSemaphore(concurrency) for channel in channels}
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(self.slots) * concurrency, 1), thread_name_prefix='affirmation-fanout')
+        self.lock = threading.Lock()
+        self.counts = {channel: {'sent': 0, 'unsent': 0, 'failed': 0} for channel in channels}
+        self.failed_ids = []
+
+    def submit(self, channel: str, affirmation: dict, champions: list):
+        # Blocks while the channel is saturated, which holds back the next page
+        self.slots[channel].acquire()
+        try:
+            future = self.pool.submit(self._run, channel, affirmation, champions)
+        except BaseException:
+            self.slots[channel].release()
+            raise
+        future.add_done_callback(lambda _f: self.slots[channel].release())
+
+    def _run(self, channel, affirmation, champions):
+        with self.app.app_context():
+            failed = []
+            try:
+                sent = min(CHANNEL_SENDERS[channel].send(affirmation, champions) or 0, len(champions))
+                outcomes = {'sent': sent, 'unsent': len(champions) - sent}
+            except UndeliveredError as e:
+                failed = e.champions
+                current_app.logger.warning('Affirmation %s fan-out: %d of %d %s sends failed',
+                                           affirmation['affirmation_id'], len(failed), len(champions), channel)
+                outcomes = {'sent': len(champions) - len(failed), 'failed': len(failed)}
+            except Exception:
+                failed = champions
+                current_app.logger.exception('Affirmation %s fan-out: %s batch of %d failed',
+                                             affirmation['affirmation_id'], channel, len(champions))
+                outcomes = {'failed': len(champions)}
+        with self.lock:
+            self.failed_ids.extend(c.champion_id for c in failed)
+            for outcome, count in outcomes.items():
+                self.counts[channel][outcome] += count
+        for outcome, count in outcomes.items():
+            _track(channel, outcome, count)
+
+    def take_failed(self) -> list:
+        """Champion ids from failed batches since the last call."""
+        with self.lock:
+            failed, self.failed_ids = self.failed_ids, []
+        return failed
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+def _release(table, affirmation_id: int, champion_ids: list) -> int:
+    """Delete the delivery rows of champions whose send failed."""
+    for start in range(0, len(champion_ids), DEFAULT_CHUNK_SIZE):
+        db.session.execute(delete(table).where(
+            table.c.affirmation_id == affirmation_id,
+            table.c.champion_id.in_(champion_ids[start:start + DEFAULT_CHUNK_SIZE]),
+        ))
+    if champion_ids:
+        db.session.commit()
+    return len(champion_ids)
+
+
+def fan_out_affirmation(affirmation_id: int, channels: Optional[Iterable[str]] = None,
+                        chunk_size: Optional[int] = None, concurrency: Optional[int] = None) -> dict:
+    """Deliver an affirmation to every active champion not yet reached.
+
+    Raises ValueError for a missing or inactive affirmation or an unknown
+    channel. Returns a summary with the rows recorded and, per channel, the
+    champions sent, not sent (no provider) and failed.
+    """
+    channels = tuple(channels or DEFAULT_CHANNELS)
+    unknown = [c for c in channels if c not in CHANNEL_SENDERS]
+    if unknown:
+        raise ValueError(f"Unknown delivery channel(s): {', '.join(unknown)}")
+    config = current_app.config
+    chunk_size = max(int(chunk_size or config.get('AFFIRMATION_FANOUT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)), 1)
+    concurrency = max(int(concurrency or config.get('AFFIRMATION_SENDER_CONCURRENCY', DEFAULT_SENDER_CONCURRENCY)), 1)
+
+    affirmation = db.session.get(DailyAffirmation, affirmation_id)
+    if not affirmation:
+        raise ValueError('Affirmation not found')
+    if not affirmation.active:
+        raise ValueError('Affirmation is not active')
+    # Plain values for the sender threads; the ORM object belongs to this session
+    payload = {'affirmation_id': affirmation.affirmation_id, 'content': affirmation.content,
+               'theme': affirmation.theme}
+
+    started = time.perf_counter()
+    table = AffirmationDelivery.__table__
+    recorded = unreachable = pages = 0
+    pool = _ChannelPool(current_app._get_current_object(), channels, concurrency)
+    try:
+        for page in _target_pages(affirmation_id, chunk_size):
+            pages += 1
+            now = datetime.utcnow()
+            by_channel = {channel: [] for channel in channels}
+            rows = []
+            for champion in page:
+                channel = next((c for c in channels if CHANNEL_SENDERS[c].reachable(champion)), None)
+                if channel is None:
+                    unreachable += 1
+                    continue
+                by_channel[channel].append(champion)
+                rows.append({'affirmation_id': affirmation_id, 'champion_id': champion.champion_id,
+                             'delivery_date': now, 'delivery_method': CHANNEL_SENDERS[channel].method,
+                             'viewed': False, 'liked': False})
+            if rows:
+                # A concurrent run may have claimed some of these champions;
+                # send only to the rows this run inserted
+                claimed = _claim(table, rows)
+                db.session.commit()
+                recorded += len(claimed)
+                if len(claimed) < len(rows):
+                    by_channel = {channel: [c for c in champions if c.champion_id in claimed]
+                                  for channel, champions in by_channel.items()}
+            for channel, champions in by_channel.items():
+                _track(channel, 'recorded', len(champions))
+                if champions:
+                    pool.submit(channel, payload, champions)
+            recorded -= _release(table, affirmation_id, pool.take_failed())
+            current_app.logger.info('Affirmation %s fan-out: page %d, %d deliveries recorded',
+                                    affirmation_id, pages, recorded)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        pool.shutdown()
+        # Give failed champions back so a rerun reaches them
+        recorded -= _release(table, affirmation_id, pool.take_failed())
+
+    # Counted from the rows so a resumed run (or manual deliveries) stays accurate
+    delivered = select(func.count()).select_from(table).where(
+        table.c.affirmation_id == affirmation_id).scalar_subquery()
+    db.session.execute(update(DailyAffirmation)
+                       .where(DailyAffirmation.affirmation_id == affirmation_id)
+                       .values(times_sent=delivered))
+    db.session.commit()
+
+    duration = time.perf_counter() - started
+    try:
+        from metrics import track_affirmation_fanout
+        track_affirmation_fanout(duration)
+    except Exception:
+        pass
+    current_app.logger.info('Affirmation %s fan-out done: %d deliveries recorded in %.1fs',
+                            affirmation_id, recorded, duration)
+    return {
+        'affirmation_id': affirmation_id,
+        'recorded': recorded,
+        'unreachable': unreachable,
+        'channels': pool.counts,
+        'duration_seconds': round(duration, 3),
+    }
@@ -0,0 +1,206 @@
+"""Monthly partition maintenance for the append-only audit log tables.
+
+On PostgreSQL `access_audit_logs` and `clinician_audit_log` are range
+partitioned by month on their timestamp column (migration
+`zzai_partition_audit_logs`), with a DEFAULT partition catching rows no
+monthly partition covers. This module keeps upcoming months' partitions
+created and archives old ones: a partition past the retention window is
+streamed to a gzip-compressed NDJSON file, then detached and dropped.
+If a run was missed and rows for a new month already sit in the DEFAULT
+partition, they are moved into the month's partition when it is created.
+
+Other dialects keep ordinary tables and every operation is a no-op.
+Run it through `scripts/maintain_audit_partitions.py`.
+"""
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# table -> partition (timestamp) column
+AUDIT_TABLES = {
+    'access_audit_logs': 'timestamp',
+    'clinician_audit_log': 'created_at',
+}
+
+_PARTITION_SUFFIX = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def default_partition_name(table: str) -> str:
+    return f'{table}_default'
+
+
+def _is_postgres() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _quote(name: str) -> str:
+    return db.engine.dialect.identifier_preparer.quote(name)
+
+
+def list_partitions(table: str) -> List[Tuple[str, date]]:
+    """Return `(name, month)` for each monthly partition of `table`, oldest first."""
+    rows = db.session.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'WHERE parent.relname = :table'
+    ), {'table': table})
+    partitions = []
+    for (name,) in rows:
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def ensure_partitions(months_ahead: int = 3, today: Optional[date] = None) -> List[str]:
+    """Create any missing partitions from this month through `months_ahead`.
+
+    Returns the names of the partitions created.
+    """
+    if not _is_postgres():
+        return []
+
+    current = month_start(today or date.today())
+    created = []
+    for table in AUDIT_TABLES:
+        existing = {name for name, _ in list_partitions(table)}
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(table, month)
+            if name in existing:
+                continue
+            moved = _create_partition(table, name, month)
+            if moved:
+                logger.warning('Moved %d rows from %s into new partition %s',
+                               moved, default_partition_name(table), name)
+            created.append(name)
+    db.session.commit()
+    return created
+
+
+def _create_partition(table: str, name: str, month: date) -> int:
+    """Create the partition of `table` for `month` in its own transaction.
+
+    CREATE ... PARTITION OF fails when the DEFAULT partition already holds
+    rows for the new range (e.g. the maintenance run was missed). In that
+    case the DEFAULT partition is detached, the rows are moved into the new
+    partition and it is attached again. Returns the number of rows moved.
+    """
+    column = _quote(AUDIT_TABLES[table])
+    default = default_partition_name(table)
+    bounds = {'start': month.isoformat(), 'end': add_months(month, 1).isoformat()}
+    create = text(
+        f'CREATE TABLE {name} PARTITION OF {table} '
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    )
+    in_range = f'{column} >= :start AND {column} < :end'
+
+    if db.session.execute(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': default}).scalar():
+        # Hold off inserts routed to DEFAULT so no row lands there after the check
+        db.session.execute(text(f'LOCK TABLE {default} IN EXCLUSIVE MODE'))
+        stranded = db.session.execute(
+            text(f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})'), bounds).scalar()
+        if stranded:
+            db.session.execute(text(f'ALTER TABLE {table} DETACH PARTITION {default}'))
+            db.session.execute(create)
+            moved = db.session.execute(
+                text(f'INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}'), bounds).rowcount
+            db.session.execute(text(f'DELETE FROM {default} WHERE {in_range}'), bounds)
+            db.session.execute(text(f'ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT'))
+            db.session.commit()
+            return moved
+    db.session.execute(create)
+    db.session.commit()
+    return 0
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def write_ndjson(rows, path: str) -> Tuple[int, int]:
+    """Write mapping rows to a gzip-compressed NDJSON file at `path`.
+
+    The file is written under a temporary name and renamed into place, so a
+    file at `path` is always complete. Returns `(rows, bytes_written)`.
+    """
+    partial = f'{path}.partial'
+    count = 0
+    with gzip.open(partial, 'wt', encoding='utf-8') as handle:
+        for row in rows:
+            handle.write(json.dumps(dict(row), default=_json_default, separators=(',', ':')))
+            handle.write('\n')
+            count += 1
+    os.replace(partial, path)
+    return count, os.path.getsize(path)
+
+
+def _archive_partition(table: str, name: str, archive_dir: str, batch_size: int) -> dict:
+    path = os.path.join(archive_dir, f'{name}.ndjson.gz')
+    order_column = _quote(AUDIT_TABLES[table])
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            text(f'SELECT * FROM {name} ORDER BY {order_column}')
+        )
+        rows, size = write_ndjson(result.mappings(), path)
+
+    # Detach and drop in one transaction, refusing if rows arrived after the export
+    with db.engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION {name}'))
+        remaining = conn.execute(text(f'SELECT count(*) FROM {name}')).scalar()
+        if remaining != rows:
+            raise RuntimeError(f'{name} changed during archival ({rows} archived, {remaining} present)')
+        conn.execute(text(f'DROP TABLE {name}'))
+
+    return {'table': table, 'partition': name, 'rows': rows, 'bytes': size, 'path': path}
+
+
+def archive_partitions(retention_months: int, archive_dir: str, today: Optional[date] = None,
+                       batch_size: int = 5000) -> List[dict]:
+    """Archive and drop partitions that ended more than `retention_months` ago.
+
+    Returns one report per archived partition with its row count, the
+    compressed size in bytes and the archive path.
+    """
+    if not _is_postgres():
+        return []
+
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    expired = [
+        (table, name)
+        for table in AUDIT_TABLES
+        for name, month in list_partitions(table)
+        if add_months(month, 1) <= cutoff
+    ]
+    # Release the session's connection; archival uses its own transactions
+    db.session.commit()
+
+    os.makedirs(archive_dir, exist_ok=True)
+    return [_archive_partition(table, name, archive_dir, batch_size) for table, name in expired]
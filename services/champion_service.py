@@ -3,7 +3,7 @@ import secrets
 from typing import Optional
 import re
 from flask_bcrypt import Bcrypt
-from models import db, Champion, User
+from models import db, Champion, User, generate_champion_code
 from services.mailer import send_invite
 from flask import current_app
 
@@ -101,17 +101,8 @@ def create_champion(username: Optional[str],
         db.session.add(new_user)
         db.session.flush()
 
-        existing_count = 0
-        try:
-            existing_count = Champion.query.count()
-        except Exception:
-            # In some unit tests Champion.query may be a simple stub
-            try:
-                existing_count = 0
-            except Exception:
-                existing_count = 0
-
-        champion_code = f"CH-{str(existing_count + 1).zfill(3)}"
+        # Same UMV-YYYY-NNNNNN allocator as registration/application approvals
+        champion_code = generate_champion_code()
 
         new_champion = Champion(
             user_id=new_user.user_id,
@@ -0,0 +1,160 @@
+"""Weekly check-in submission shared by the session and token check-in APIs.
+
+A check-in is keyed by `(champion_id, reporting_period)` (unique constraint
+`_champion_period_uc` on `youth_supports`). Submissions are written with a
+single `INSERT ... ON CONFLICT DO UPDATE` so concurrent retries of the same
+check-in converge on one row, and the red-flag rule is evaluated inside the
+statement against the merged values.
+"""
+from datetime import date, datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import and_, case, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, YouthSupport
+
+# Payload keys accepted by the check-in endpoints and how each is coerced.
+CHECKIN_FIELDS = {
+    'number_of_youth_under_support': lambda v: int(v or 0),
+    'weekly_check_in_completion_rate': lambda v: float(v or 0),
+    'monthly_mini_screenings_delivered': lambda v: int(v or 0),
+    'referrals_initiated': lambda v: int(v or 0),
+    'flags_and_concerns_logged': lambda v: v,
+}
+
+# Completion rates below this percentage flag the report for follow-up
+LOW_COMPLETION_RATE = 50
+
+
+def parse_reporting_period(value: Optional[str]) -> date:
+    """Parse a `YYYY-MM-DD` reporting period, defaulting to today.
+
+    Raises ValueError for malformed dates.
+    """
+    if not value:
+        return date.today()
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def checkin_values(data: dict) -> dict:
+    """Coerce the check-in fields present in `data`.
+
+    Raises ValueError when a numeric field cannot be converted.
+    """
+    values = {}
+    for key, coerce in CHECKIN_FIELDS.items():
+        if key not in data:
+            continue
+        try:
+            values[key] = coerce(data.get(key))
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {key}')
+    return values
+
+
+def _is_flagged(rate, flags) -> bool:
+    return (rate is not None and float(rate) < LOW_COMPLETION_RATE) or bool(flags)
+
+
+def _upsert_statement(dialect_name: str, rows: list, columns: tuple, now: datetime):
+    """Build one multi-row upsert for `rows` that all submit the same `columns`."""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    table = YouthSupport.__table__
+    insert_rows = []
+    for champion_id, reporting_period, values in rows:
+        flagged = _is_flagged(values.get('weekly_check_in_completion_rate'), values.get('flags_and_concerns_logged'))
+        insert_rows.append(dict(
+            values, champion_id=champion_id, reporting_period=reporting_period,
+            flag_timestamp=now if flagged else None,
+        ))
+    stmt = insert(table).values(insert_rows)
+
+    # On conflict only the submitted columns change; the red-flag rule sees the
+    # submitted value where present and the stored value otherwise.
+    def merged(column):
+        return stmt.excluded[column] if column in columns else table.c[column]
+
+    rate = merged('weekly_check_in_completion_rate')
+    flags = merged('flags_and_concerns_logged')
+    flagged = or_(
+        and_(rate.isnot(None), rate < LOW_COMPLETION_RATE),
+        and_(flags.isnot(None), flags != ''),
+    )
+    update_values = {column: stmt.excluded[column] for column in columns}
+    update_values['flag_timestamp'] = case((flagged, now), else_=table.c.flag_timestamp)
+
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.champion_id, table.c.reporting_period],
+        set_=update_values,
+    ).returning(table.c.champion_id, table.c.reporting_period, table.c.support_id, table.c.flag_timestamp)
+
+
+def _select_then_write(champion_id: int, reporting_period: date, values: dict, now: datetime) -> Tuple[int, bool]:
+    """Portable fallback for dialects without ON CONFLICT support."""
+    for attempt in range(2):
+        report = YouthSupport.query.filter_by(champion_id=champion_id, reporting_period=reporting_period).first()
+        if not report:
+            report = YouthSupport(champion_id=champion_id, reporting_period=reporting_period)
+        for key, value in values.items():
+            setattr(report, key, value)
+        if _is_flagged(report.weekly_check_in_completion_rate, report.flags_and_concerns_logged):
+            report.flag_timestamp = now
+        db.session.add(report)
+        try:
+            db.session.flush()
+            return report.support_id, bool(report.flag_timestamp)
+        except IntegrityError:
+            # A concurrent submit inserted the row first; retry as an update
+            db.session.rollback()
+            if attempt:
+                raise
+
+
+def submit_checkins(reports: list, commit: bool = True) -> Dict[Tuple[int, date], Tuple[int, bool]]:
+    """Upsert many check-ins in one transaction.
+
+    `reports` is a list of `(champion_id, reporting_period, values)` with
+    values already coerced by `checkin_values`. Reports for the same
+    champion and period are merged in order (later fields win) because one
+    statement cannot update a row twice. Reports submitting the same set of
+    fields share one multi-row statement.
+
+    Returns `{(champion_id, reporting_period): (support_id, flagged)}`.
+    """
+    merged = {}
+    for champion_id, reporting_period, values in reports:
+        merged.setdefault((champion_id, reporting_period), {}).update(values)
+
+    now = datetime.now(timezone.utc)
+    dialect_name = db.session.get_bind().dialect.name
+    results = {}
+
+    if dialect_name in ('postgresql', 'sqlite'):
+        groups = {}
+        for (champion_id, reporting_period), values in merged.items():
+            groups.setdefault(tuple(sorted(values)), []).append((champion_id, reporting_period, values))
+        for columns, rows in groups.items():
+            stmt = _upsert_statement(dialect_name, rows, columns, now)
+            for champion_id, reporting_period, support_id, flag_timestamp in db.session.execute(stmt):
+                results[(champion_id, reporting_period)] = (support_id, bool(flag_timestamp))
+    else:
+        for (champion_id, reporting_period), values in merged.items():
+            results[(champion_id, reporting_period)] = _select_then_write(champion_id, reporting_period, values, now)
+
+    if commit:
+        db.session.commit()
+    return results
+
+
+def submit_checkin(champion_id: int, reporting_period: date, data: dict, commit: bool = True) -> Tuple[int, bool]:
+    """Create or update the check-in for `champion_id` and `reporting_period`.
+
+    Only fields present in `data` are written. Returns `(support_id, flagged)`.
+    """
+    results = submit_checkins([(champion_id, reporting_period, checkin_values(data))], commit=commit)
+    return results[(champion_id, reporting_period)]
@@ -3,6 +3,8 @@
 from flask import current_app
 import logging
 
+from utils.circuit import get_breaker
+
 logger = logging.getLogger(__name__)
 
 
@@ -62,7 +64,7 @@ def delete_cloudinary_file(url: str) -> bool:
         elif '/raw/upload/' in url:
             resource_type = 'raw'
         
-        result = cloudinary.uploader.destroy(public_id, resource_type=resource_type)
+        result = get_breaker('cloudinary').call(cloudinary.uploader.destroy, public_id, resource_type=resource_type)
         
         if result.get('result') == 'ok':
             logger.info('Successfully deleted Cloudinary file: %s', public_id)
@@ -151,7 +153,7 @@ def _delete_s3_file(url: str) -> bool:
                           aws_secret_access_key=current_app.config.get('S3_SECRET_KEY'),
                           region_name=current_app.config.get('S3_REGION'))
         
-        s3.delete_object(Bucket=bucket, Key=key)
+        get_breaker('s3').call(s3.delete_object, Bucket=bucket, Key=key)
         logger.info('Deleted S3 file: s3://%s/%s', bucket, key)
         return True
         
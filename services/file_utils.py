@@ -2,7 +2,8 @@ import os
 from datetime import datetime, timezone
 from flask import current_app
 from werkzeug.utils import secure_filename
-from PIL import Image
+
+from utils.circuit import get_breaker
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'docx', 'pptx', 'mp4', 'mov', 'webm', 'mkv', 'ogg', 'avi'}
 
@@ -120,7 +121,8 @@ def save_file(fileobj, subdir='uploads') -> str:
                 resource_type = 'video'
             
             # Upload to Cloudinary
-            upload_result = cloudinary.uploader.upload(
+            upload_result = get_breaker('cloudinary').call(
+                cloudinary.uploader.upload,
                 data,
                 resource_type=resource_type,
                 public_id=public_id,
@@ -166,7 +168,8 @@ def save_file(fileobj, subdir='uploads') -> str:
         if content_type:
             extra_args['ContentType'] = content_type
 
-        s3.put_object(Bucket=current_app.config.get('S3_BUCKET'), Key=key, Body=data, **extra_args)
+        get_breaker('s3').call(s3.put_object, Bucket=current_app.config.get('S3_BUCKET'), Key=key, Body=data,
+                               **extra_args)
 
         region = current_app.config.get('S3_REGION')
         if region:
@@ -200,6 +203,9 @@ def generate_thumbnail(rel_path: str, size=(300, 300)) -> str:
       - Local thumbnail path (for local files)
     """
     try:
+        # Pillow is only needed here; keep it out of app startup
+        from PIL import Image
+
         # If path is an HTTP URL and Cloudinary is enabled, use Cloudinary transformations
         if rel_path.startswith('http') and current_app.config.get('USE_CLOUDINARY'):
             try:
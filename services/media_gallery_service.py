@@ -3,6 +3,7 @@ from datetime import datetime, timezone
 from models import db, MediaGallery, Event
 from services.file_utils import save_file
 from flask import current_app
+from sqlalchemy.orm import selectinload
 from tasks.media_tasks import generate_and_store_thumbnail
 
 
@@ -129,13 +130,12 @@ def update_media_gallery(gallery_id: int, data: dict) -> MediaGallery:
     db.session.commit()
     # Queue thumbnail generation for any newly saved image files
     try:
-        items = gallery.media_items or []
-        for it in items:
-            if isinstance(it, dict) and it.get('type') == 'file' and not it.get('thumbnail'):
-                fn = it.get('filename','').lower()
+        for it in gallery.items:
+            if it.path and not it.thumbnail:
+                fn = (it.filename or '').lower()
                 if any(fn.endswith(ext) for ext in ('.png','.jpg','.jpeg','.gif')):
                     try:
-                        generate_and_store_thumbnail.delay(gallery.id, it.get('path'))
+                        generate_and_store_thumbnail.delay(gallery.gallery_id, it.path)
                     except Exception:
                         current_app.logger.exception('Failed to enqueue thumbnail task')
     except Exception:
@@ -177,7 +177,7 @@ def toggle_publish_gallery(gallery_id: int) -> MediaGallery:
 
 
 def list_media_galleries(published_only: bool = False):
-    q = db.session.query(MediaGallery)
+    q = db.session.query(MediaGallery).options(selectinload(MediaGallery.items))
     if published_only:
         q = q.filter_by(published=True).order_by(MediaGallery.published_at.desc())
     else:
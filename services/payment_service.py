@@ -0,0 +1,319 @@
+"""M-Pesa payments ledger.
+
+A `payments` row is written as `pending` when Daraja accepts an STK push
+(`record_checkout`) and settled by the callback (`apply_callback`). The
+callback is applied with a single UPDATE guarded by `status = 'pending'`, so
+Safaricom's duplicate deliveries are no-ops. A callback never creates a
+row: only a push this app recorded can be settled that way, and a push
+whose row is missing is settled from Daraja's `stkpushquery` answer
+instead. The handler does no other database work, which keeps it in the
+low milliseconds.
+
+`get_payment_status` serves lookups from a short-lived Redis copy, then the
+ledger, and calls `stkpushquery` (through the `query` callable) only for
+payments still pending after `MPESA_STATUS_STALE_SECONDS`.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+from models import db, Payment
+from utils.redis_client import LazyRedis
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'payments:status:'
+PENDING_CACHE_SECONDS = 30
+SETTLED_CACHE_SECONDS = 60 * 60 * 24
+
+# Daraja ResultCode 1032: request cancelled by the user
+CANCELLED_RESULT_CODES = {1032}
+
+_redis = LazyRedis('Payment status cache')
+
+# Checkout ids Daraja had no answer for: Redis keys under MISS_PREFIX, or
+# this per-process dict of id -> monotonic expiry without Redis
+MISS_PREFIX = 'payments:status-miss:'
+MAX_LOCAL_MISSES = 10000
+_misses = {}
+
+
+def status_for_result(result_code: int) -> str:
+    if result_code == 0:
+        return 'paid'
+    if result_code in CANCELLED_RESULT_CODES:
+        return 'cancelled'
+    return 'failed'
+
+
+def record_checkout(checkout_request_id: str, merchant_request_id: Optional[str] = None,
+                    idempotency_key: Optional[str] = None, user_id: Optional[int] = None,
+                    phone_number: Optional[str] = None, amount: Optional[int] = None,
+                    account_reference: Optional[str] = None) -> None:
+    """Add a pending payment for an accepted STK push; a no-op if the row exists."""
+    now = datetime.utcnow()
+    values = {
+        'checkout_request_id': checkout_request_id,
+        'merchant_request_id': merchant_request_id,
+        'idempotency_key': idempotency_key,
+        'user_id': int(user_id) if user_id else None,
+        'phone_number': phone_number,
+        'amount': amount,
+        'account_reference': account_reference,
+        'status': 'pending',
+        'created_at': now,
+        'updated_at': now,
+    }
+    insert = _dialect_insert()
+    if insert is not None:
+        db.session.execute(insert(Payment.__table__).values(**values).on_conflict_do_nothing(
+            index_elements=[Payment.__table__.c.checkout_request_id],
+        ))
+    elif db.session.get(Payment, checkout_request_id) is None:
+        db.session.add(Payment(**values))
+    db.session.commit()
+
+
+def parse_callback(body: dict) -> dict:
+    """Flatten a Daraja stkCallback body into ledger column values.
+
+    Raises KeyError when required fields are missing.
+    """
+    callback = body['Body']['stkCallback']
+    result_code = int(callback['ResultCode'])
+    values = {
+        'checkout_request_id': callback['CheckoutRequestID'],
+        'merchant_request_id': callback.get('MerchantRequestID'),
+        'result_code': result_code,
+        'result_desc': (callback.get('ResultDesc') or '')[:255] or None,
+    }
+    if result_code == 0:
+        items = {item['Name']: item.get('Value') for item in callback['CallbackMetadata']['Item']}
+        values['mpesa_receipt'] = items['MpesaReceiptNumber']
+        values['amount'] = int(items['Amount']) if items.get('Amount') is not None else None
+        values['phone_number'] = str(items['PhoneNumber']) if items.get('PhoneNumber') else None
+        values['transaction_date'] = _parse_transaction_date(items.get('TransactionDate'))
+    return values
+
+
+def apply_callback(body: dict) -> str:
+    """Apply a Daraja callback to its pending payment.
+
+    Returns 'applied', 'duplicate' (already settled) or 'unknown' (no
+    payment recorded for that CheckoutRequestID).
+    """
+    values = parse_callback(body)
+    if _settle(values, insert_missing=False):
+        _cache_delete(values['checkout_request_id'])
+        return 'applied'
+    if db.session.get(Payment, values['checkout_request_id']) is None:
+        logger.warning('M-Pesa callback for unknown checkout %s ignored', values['checkout_request_id'])
+        return 'unknown'
+    return 'duplicate'
+
+
+def apply_query_result(checkout_request_id: str, response: dict) -> bool:
+    """Settle a payment from an stkpushquery response that carries a ResultCode."""
+    if response.get('ResultCode') in (None, ''):
+        return False
+    applied = _settle({
+        'checkout_request_id': checkout_request_id,
+        'merchant_request_id': response.get('MerchantRequestID'),
+        'result_code': int(response['ResultCode']),
+        'result_desc': (response.get('ResultDesc') or '')[:255] or None,
+    })
+    _cache_delete(checkout_request_id)
+    return applied
+
+
+def get_payment_status(checkout_request_id: str, query: Optional[Callable[[str], dict]] = None,
+                       stale_after: Optional[int] = None) -> Tuple[Optional[dict], Optional[str]]:
+    """Return `(payment, source)` where source is 'cache', 'ledger' or 'daraja'.
+
+    With `query`, payments missing from the ledger or pending for longer
+    than `stale_after` seconds are checked against Daraja and settled if it
+    reports a result. A missing payment Daraja has no result for is not
+    queried again for `stale_after` seconds.
+    """
+    payment, source = _cache_get(checkout_request_id), 'cache'
+    if payment is None:
+        row = db.session.get(Payment, checkout_request_id, populate_existing=True)
+        payment, source = (row.to_dict(), 'ledger') if row else (None, None)
+        if payment is not None:
+            _cache_set(payment)
+
+    if stale_after is None:
+        stale_after = int(os.environ.get('MPESA_STATUS_STALE_SECONDS', 60))
+    if query is None or not _needs_query(payment, stale_after):
+        return payment, source
+    if payment is None and _miss_cached(checkout_request_id):
+        # Daraja was asked recently and had nothing to settle
+        return None, None
+
+    try:
+        response = query(checkout_request_id)
+    except Exception:
+        logger.warning('stkpushquery failed for %s', checkout_request_id, exc_info=True)
+        response = None
+
+    if response is None or not apply_query_result(checkout_request_id, response):
+        if payment is None:
+            _cache_miss(checkout_request_id, stale_after)
+        else:
+            # Still processing; don't query again until it is stale once more
+            payment['last_checked_at'] = time.time()
+            _cache_set(payment)
+        return payment, source
+
+    row = db.session.get(Payment, checkout_request_id, populate_existing=True)
+    payment, source = row.to_dict(), 'daraja'
+    _cache_set(payment)
+    return payment, source
+
+
+# -- ledger writes -----------------------------------------------------------
+
+def _settle(values: dict, insert_missing: bool = True) -> bool:
+    """Move a pending payment to its final status in one statement.
+
+    With `insert_missing` (trusted stkpushquery answers) a missing payment
+    is inserted already settled; otherwise only an existing pending row
+    changes.
+    """
+    table = Payment.__table__
+    now = datetime.utcnow()
+    values = dict(values, status=status_for_result(values['result_code']), updated_at=now, completed_at=now)
+    settle_columns = ['status', 'result_code', 'result_desc', 'mpesa_receipt', 'transaction_date',
+                      'updated_at', 'completed_at']
+
+    if not insert_missing:
+        applied = db.session.execute(
+            table.update()
+            .where(table.c.checkout_request_id == values['checkout_request_id'], table.c.status == 'pending')
+            .values({name: values[name] for name in settle_columns if name in values})
+        ).rowcount > 0
+        db.session.commit()
+        return applied
+
+    insert = _dialect_insert()
+    if insert is not None:
+        stmt = insert(table).values(created_at=now, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.checkout_request_id],
+            set_={name: stmt.excluded[name] for name in settle_columns if name in values},
+            where=table.c.status == 'pending',
+        )
+        applied = db.session.execute(stmt).rowcount > 0
+        db.session.commit()
+        return applied
+
+    row = db.session.execute(
+        db.select(Payment).where(Payment.checkout_request_id == values['checkout_request_id']).with_for_update()
+    ).scalar_one_or_none()
+    if row is None:
+        db.session.add(Payment(created_at=now, **values))
+    elif row.status != 'pending':
+        db.session.rollback()
+        return False
+    else:
+        for name in settle_columns:
+            if name in values:
+                setattr(row, name, values[name])
+    db.session.commit()
+    return True
+
+
+def _dialect_insert():
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def _parse_transaction_date(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value), '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+
+
+def _needs_query(payment: Optional[dict], stale_after: int) -> bool:
+    if payment is None:
+        return True
+    if payment.get('status') != 'pending':
+        return False
+    created = datetime.fromisoformat(payment['created_at']) if payment.get('created_at') else None
+    age = (datetime.utcnow() - created).total_seconds() if created else stale_after
+    since_check = time.time() - payment.get('last_checked_at', 0)
+    return age >= stale_after and since_check >= stale_after
+
+
+# -- status cache ------------------------------------------------------------
+
+def _cache_get(checkout_request_id: str) -> Optional[dict]:
+    client = _redis.get()
+    if client is None:
+        return None
+    try:
+        raw = client.get(CACHE_PREFIX + checkout_request_id)
+    except Exception:
+        _redis.mark_down()
+        return None
+    return json.loads(raw) if raw else None
+
+
+def _cache_set(payment: dict) -> None:
+    client = _redis.get()
+    if client is None:
+        return
+    ttl = PENDING_CACHE_SECONDS if payment.get('status') == 'pending' else SETTLED_CACHE_SECONDS
+    try:
+        client.set(CACHE_PREFIX + payment['checkout_request_id'], json.dumps(payment), ex=ttl)
+    except Exception:
+        _redis.mark_down()
+
+
+def _miss_cached(checkout_request_id: str) -> bool:
+    client = _redis.get()
+    if client is not None:
+        try:
+            return bool(client.exists(MISS_PREFIX + checkout_request_id))
+        except Exception:
+            _redis.mark_down()
+    return _misses.get(checkout_request_id, 0) > time.monotonic()
+
+
+def _cache_miss(checkout_request_id: str, ttl: int) -> None:
+    """Remember that Daraja had no result, so lookups skip it for `ttl` seconds."""
+    ttl = max(int(ttl), 1)
+    client = _redis.get()
+    if client is not None:
+        try:
+            client.set(MISS_PREFIX + checkout_request_id, '1', ex=ttl)
+            return
+        except Exception:
+            _redis.mark_down()
+    now = time.monotonic()
+    if len(_misses) >= MAX_LOCAL_MISSES:
+        for key in [k for k, until in _misses.items() if until <= now] or list(_misses):
+            del _misses[key]
+    _misses[checkout_request_id] = now + ttl
+
+
+def _cache_delete(checkout_request_id: str) -> None:
+    client = _redis.get()
+    if client is None:
+        return
+    try:
+        client.delete(CACHE_PREFIX + checkout_request_id)
+    except Exception:
+        _redis.mark_down()
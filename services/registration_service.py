@@ -1,4 +1,6 @@
 from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import String, func, literal, or_, select, union, union_all
 from models import db, MemberRegistration, User, Champion, Certificate, generate_champion_code
 from flask import current_app
 import hmac
@@ -117,3 +119,90 @@ def reject_registration(registration_id: int, reviewer_id: int, reason: str) ->
         db.session.rollback()
         current_app.logger.exception('Error rejecting registration')
         raise
+
+
+# Registrations in these states block a new signup with the same username,
+# phone or email; rejected/cancelled registrations may re-apply.
+BLOCKING_REGISTRATION_STATUSES = ('pending', 'submitted', 'under_review')
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def next_available_username(base: str) -> str:
+    """Return `base`, or `base<N>` with the smallest free N >= 2.
+
+    Usernames are unique across users and member registrations. Rather than
+    probing `base`, `base2`, `base3`... one query at a time, both tables are
+    scanned once for names starting with `base` and the suffixes are parsed.
+    """
+    pattern = _escape_like(base) + '%'
+    taken_query = union(
+        select(User.username).where(User.username.like(pattern, escape='\\')),
+        select(MemberRegistration.username).where(MemberRegistration.username.like(pattern, escape='\\')),
+    )
+    taken = set()
+    for (name,) in db.session.execute(taken_query):
+        # LIKE may be case-insensitive (SQLite); only exact-prefix names count
+        if not name or not name.startswith(base):
+            continue
+        suffix = name[len(base):]
+        if suffix == '':
+            taken.add(1)
+        elif suffix.isdigit() and not suffix.startswith('0') and int(suffix) >= 2:
+            taken.add(int(suffix))
+
+    # `1` stands for the bare base name; generated suffixes start at 2
+    if 1 not in taken:
+        return base
+    idx = 2
+    while idx in taken:
+        idx += 1
+    return f"{base}{idx}"
+
+
+def find_registration_conflict(username: str, phone_number: str, email: Optional[str] = None) -> Optional[dict]:
+    """Return the first uniqueness conflict for a new registration, or None.
+
+    Checks existing usernames, champion email/phone and in-progress
+    registrations in a single UNION ALL query. The result is
+    `{'field': ..., 'message': ...}` using the same precedence and messages
+    the registration endpoint has always returned.
+    """
+    no_status = literal(None, type_=String)
+    queries = [
+        select(literal('username').label('kind'), User.user_id.label('id'), no_status.label('status'))
+        .where(User.username == username),
+        select(literal('phone_number'), Champion.champion_id, no_status)
+        .where(Champion.phone_number == phone_number),
+    ]
+    registration_match = [MemberRegistration.username == username, MemberRegistration.phone_number == phone_number]
+    if email:
+        queries.append(
+            select(literal('email'), Champion.champion_id, no_status).where(Champion.email == email)
+        )
+        registration_match.append(MemberRegistration.email == email)
+    queries.append(
+        select(literal('registration'), MemberRegistration.registration_id, MemberRegistration.status)
+        .where(or_(*registration_match))
+        .where(func.lower(MemberRegistration.status).in_(BLOCKING_REGISTRATION_STATUSES))
+    )
+
+    found = {}
+    for kind, row_id, status in db.session.execute(union_all(*queries)):
+        found.setdefault(kind, (row_id, status))
+
+    if 'username' in found:
+        return {'field': 'username', 'message': 'Username already exists'}
+    if 'email' in found:
+        return {'field': 'email', 'message': 'Email already registered'}
+    if 'phone_number' in found:
+        return {'field': 'phone_number', 'message': 'Phone number already registered'}
+    if 'registration' in found:
+        registration_id, status = found['registration']
+        return {
+            'field': 'registration',
+            'message': f'Existing registration (id={registration_id}) with status "{status}" is already in progress',
+        }
+    return None
@@ -0,0 +1,64 @@
+"""Affirmation fan-out task for the Celery worker.
+
+With `AFFIRMATION_FANOUT_ASYNC` enabled, `POST /api/affirmations/<id>/fan-out`
+sends this task by name and returns 202. The worker runs
+`affirmation_delivery_service.fan_out_affirmation`, which pages through the
+champions and queues the emails itself, so the run can also be scheduled
+daily (e.g. from celery beat) with the day's affirmation id:
+
+  celery -A celery_worker.celery worker -Q affirmations --concurrency 1
+
+A run that fails part way, or whose sender batches failed, is retried;
+champions already reached are skipped. As with the other task modules, the
+worker registers the task on its own Celery instance (see
+`celery_worker.py`).
+"""
+import os
+
+from flask import current_app
+
+FAN_OUT_TASK = 'tasks.fan_out_affirmation'
+AFFIRMATION_QUEUE = os.environ.get('AFFIRMATION_TASK_QUEUE', 'affirmations')
+MAX_RETRIES = int(os.environ.get('AFFIRMATION_TASK_MAX_RETRIES', 3))
+
+# Publishing gives up quickly so the endpoint can report the broker is down
+_PUBLISH_RETRY = {'max_retries': 2, 'interval_start': 0, 'interval_step': 0.2, 'interval_max': 0.5}
+
+celery = None
+_client = None
+
+
+def _celery_client():
+    global _client
+    if _client is None:
+        from celery_app import make_celery
+        _client = make_celery()
+    return _client
+
+
+def enqueue_fan_out(affirmation_id, channels=None):
+    """Queue a fan-out run. Raises if the broker is unreachable."""
+    _celery_client().send_task(FAN_OUT_TASK, kwargs={'affirmation_id': affirmation_id, 'channels': channels},
+                               retry_policy=_PUBLISH_RETRY)
+
+
+def fan_out_affirmation_task(self, affirmation_id, channels=None):
+    """Celery entry point; registered with bind=True by the worker."""
+    from services.affirmation_delivery_service import fan_out_affirmation
+
+    try:
+        summary = fan_out_affirmation(affirmation_id, channels)
+    except ValueError:
+        # Missing/inactive affirmation or bad channel: retrying won't help
+        current_app.logger.exception('Affirmation %s fan-out rejected', affirmation_id)
+        raise
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            raise
+        raise self.retry(exc=exc, countdown=min(60 * 2 ** self.request.retries, 600))
+    failed = sum(counts['failed'] for counts in summary['channels'].values())
+    if failed and self.request.retries < self.max_retries:
+        # Failed batches were released; the retry sends to just those champions
+        current_app.logger.warning('Affirmation %s fan-out: %d sends failed, retrying', affirmation_id, failed)
+        raise self.retry(countdown=min(60 * 2 ** self.request.retries, 600))
+    return summary
@@ -1,36 +1,91 @@
-"""Email task with optional Celery integration.
+"""Email queue for the Celery worker.
 
-This module provides `send_email_async`. If Celery is available the
-function is registered as a Celery task; otherwise a synchronous
-fallback is exposed so the application can run without Celery installed.
+With `EMAIL_ASYNC` enabled, `email_utils.queue_email` and
+`queue_bulk_email` send these tasks by name and return without waiting on
+SMTP. A worker on the `email` queue (`EMAIL_TASK_QUEUE`) sends each batch
+over one SMTP connection at `EMAIL_SEND_RATE` messages per second and
+retries messages that hit connection errors with exponential backoff:
+
+  celery -A celery_worker.celery worker -Q email --concurrency 2
+
+As with the other task modules, the worker registers the tasks on its own
+Celery instance (see `celery_worker.py`); the web process only sends them
+by name.
 """
 import os
-try:
-    from .celery_app import make_celery
-    from app import create_app
-    app, _ = create_app()
-    celery = make_celery(app)
-except Exception:
-    celery = None
-
-
-def _send_email(to, subject, body):
-    from email_utils import send_email
-    return send_email(to=to, subject=subject, body=body)
-
-
-if celery:
-    @celery.task(name='tasks.send_email')
-    def send_email_async(to, subject, body):
-        try:
-            return _send_email(to, subject, body)
-        except Exception:
-            # Allow Celery to handle retries/logging
-            raise
-else:
-    # Fallback: call synchronously
-    def send_email_async(to, subject, body):
-        try:
-            return _send_email(to, subject, body)
-        except Exception:
-            raise
+
+from flask import current_app
+
+SEND_EMAIL_TASK = 'tasks.send_email'
+SEND_EMAIL_BATCH_TASK = 'tasks.send_email_batch'
+EMAIL_QUEUE = os.environ.get('EMAIL_TASK_QUEUE', 'email')
+MAX_RETRIES = int(os.environ.get('EMAIL_TASK_MAX_RETRIES', 5))
+
+# Publishing gives up quickly so callers can fall back to sending in-process
+_PUBLISH_RETRY = {'max_retries': 2, 'interval_start': 0, 'interval_step': 0.2, 'interval_max': 0.5}
+
+celery = None
+_client = None
+
+
+def _celery_client():
+    global _client
+    if _client is None:
+        from celery_app import make_celery
+        _client = make_celery()
+    return _client
+
+
+def _message(to, subject, body, html=None):
+    return {'to': to, 'subject': subject, 'body': body, 'html': html}
+
+
+def enqueue_email(to, subject, body, html=None):
+    """Queue one email. Raises if the broker is unreachable."""
+    _celery_client().send_task(SEND_EMAIL_TASK, kwargs=_message(to, subject, body, html),
+                               retry_policy=_PUBLISH_RETRY)
+    _track('queued', 1)
+
+
+def enqueue_email_batch(messages):
+    """Queue a batch of message dicts, sent over one SMTP connection. Raises if the broker is unreachable."""
+    messages = [_message(m['to'], m['subject'], m['body'], m.get('html')) for m in messages]
+    _celery_client().send_task(SEND_EMAIL_BATCH_TASK, kwargs={'messages': messages},
+                               retry_policy=_PUBLISH_RETRY)
+    _track('queued', len(messages))
+
+
+def _track(outcome, count):
+    try:
+        from metrics import track_emails
+        track_emails(outcome, count)
+    except Exception:
+        pass
+
+
+def retry_countdown(retries):
+    return min(30 * 2 ** retries, 900)
+
+
+def _deliver(task, messages):
+    from email_utils import send_messages
+
+    unsent = send_messages(messages)
+    if not unsent:
+        return len(messages)
+    if task.request.retries >= task.max_retries:
+        current_app.logger.error('Giving up on %d emails after %d retries', len(unsent), task.request.retries)
+        return len(messages) - len(unsent)
+    _track('retried', len(unsent))
+    # Retry only what wasn't sent, so nobody gets the same email twice
+    raise task.retry(kwargs={'messages': unsent}, countdown=retry_countdown(task.request.retries))
+
+
+def send_email_batch_task(self, messages):
+    """Celery entry point; registered with bind=True by the worker."""
+    return _deliver(self, messages)
+
+
+def send_email_task(self, to=None, subject=None, body=None, html=None, messages=None):
+    """Celery entry point for one email; a retry arrives as `messages`."""
+    return _deliver(self, messages or [_message(to, subject, body, html)])
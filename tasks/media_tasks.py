@@ -15,28 +15,21 @@ celery = None
 
 def _generate_and_store_thumbnail(gallery_id, media_path):
     try:
-        from models import db, MediaGallery
+        from models import db, MediaItem
         from services.file_utils import generate_thumbnail
 
         thumb = generate_thumbnail(media_path)
         if not thumb:
             return ''
 
-        gallery = db.session.get(MediaGallery, gallery_id)
-        if not gallery:
+        # Touch only the matching item rows so concurrent thumbnail jobs for
+        # the same gallery cannot overwrite each other's results.
+        updated = MediaItem.query.filter_by(
+            gallery_id=gallery_id, path=media_path
+        ).update({'thumbnail': thumb}, synchronize_session=False)
+        if not updated:
             return ''
-
-        changed = False
-        items = gallery.media_items or []
-        for item in items:
-            if isinstance(item, dict) and item.get('path') == media_path:
-                item['thumbnail'] = thumb
-                changed = True
-
-        if changed:
-            gallery.media_items = items
-            db.session.add(gallery)
-            db.session.commit()
+        db.session.commit()
 
         return thumb
     except Exception:
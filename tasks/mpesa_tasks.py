@@ -0,0 +1,137 @@
+"""M-Pesa STK push task for asynchronous checkout.
+
+With `MPESA_ASYNC_CHECKOUT` enabled, `/api/mpesa/checkout` reserves the
+idempotency key, calls `enqueue_stk_push` and returns 202. A worker on the
+`payments` queue (`MPESA_TASK_QUEUE`) performs the push, retrying failures
+that never reached Daraja (see `classify_push_failure`), and records the
+outcome on the idempotency entry that the status endpoint and the callback
+read. Payment throughput is bounded by that worker's concurrency rather than
+by web workers:
+
+  celery -A celery_worker.celery worker -Q payments --concurrency 4
+
+As with the other task modules, the worker registers the task on its own
+Celery instance (see `celery_worker.py`); the web process only sends it by
+name.
+"""
+import os
+
+import requests
+import urllib3
+from flask import current_app
+
+from utils.circuit import CircuitOpenError
+from utils.idempotency import update_key
+
+STK_PUSH_TASK = 'tasks.mpesa_stk_push'
+PAYMENTS_QUEUE = os.environ.get('MPESA_TASK_QUEUE', 'payments')
+MAX_RETRIES = int(os.environ.get('MPESA_TASK_MAX_RETRIES', 3))
+
+celery = None
+_client = None
+
+
+def _celery_client():
+    global _client
+    if _client is None:
+        from celery_app import make_celery
+        _client = make_celery()
+    return _client
+
+
+def enqueue_stk_push(idem_key, phone_number, amount, account_reference, transaction_desc):
+    """Queue the STK push for a reserved key. Raises if the broker is unreachable."""
+    _celery_client().send_task(STK_PUSH_TASK, kwargs={
+        'idem_key': idem_key,
+        'phone_number': phone_number,
+        'amount': amount,
+        'account_reference': account_reference,
+        'transaction_desc': transaction_desc,
+    })
+
+
+def _never_connected(exc):
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.exceptions.ConnectionError):
+        return False
+    # Only a failed connect is safe; a dropped connection may follow the push
+    reason = exc.args[0] if exc.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def classify_push_failure(exc):
+    """Sort an STK push failure into 'retry', 'unknown' or 'failed'.
+
+    'retry': the push never reached Daraja (breaker open, connect error,
+    429), so sending it again cannot prompt the customer twice.
+    'unknown': Daraja may have accepted it (read timeout, dropped
+    connection, 5xx). A new push would carry a fresh Timestamp and Password
+    and prompt again, so these are never resent.
+    'failed': rejected by Daraja or failed before the request was made.
+    """
+    if isinstance(exc, CircuitOpenError) or _never_connected(exc):
+        return 'retry'
+    if isinstance(exc, requests.exceptions.HTTPError):
+        status = exc.response.status_code if exc.response is not None else None
+        if status == 429:
+            return 'retry'
+        return 'unknown' if status is None or status >= 500 else 'failed'
+    if isinstance(exc, requests.exceptions.RequestException):
+        return 'unknown'
+    return 'failed'
+
+
+def record_push_failure(idem_key, exc, kind):
+    """Mark the key failed, or 'unknown' when Daraja may have taken the push.
+
+    An 'unknown' key is not reclaimed by a repeat checkout, so the customer
+    is not prompted a second time for the same payment.
+    """
+    if kind == 'unknown':
+        update_key(idem_key, status='unknown', response={'error': 'outcome_unknown', 'detail': str(exc)},
+                   only_if=('pending',))
+        return
+    error = 'service_unavailable' if kind == 'retry' else str(exc)
+    update_key(idem_key, status='failed', response={'error': error}, only_if=('pending',))
+
+
+def _process_stk_push(idem_key, phone_number, amount, account_reference, transaction_desc, retries_left=0):
+    """Send the push for `idem_key` and record the outcome.
+
+    Retryable failures are re-raised while `retries_left` > 0; otherwise the
+    key is marked failed. Returns the Daraja response, or None on failure.
+    """
+    from blueprints.mpesa import record_stk_response, send_stk_push
+    from utils.idempotency import get_key
+
+    entry = get_key(idem_key)
+    if entry and entry.get('status') in ('success', 'unknown'):
+        # Redelivered after the push (maybe) went out; don't prompt twice
+        return entry.get('response') if entry.get('status') == 'success' else None
+
+    try:
+        response_data = send_stk_push(phone_number, amount, account_reference, transaction_desc)
+    except Exception as exc:
+        kind = classify_push_failure(exc)
+        if retries_left > 0 and kind == 'retry':
+            raise
+        current_app.logger.exception('STK push task failed for %s', idem_key)
+        # A concurrent delivery may already have recorded the push
+        record_push_failure(idem_key, exc, kind)
+        return None
+
+    meta = (entry or {}).get('meta') or {}
+    record_stk_response(idem_key, response_data, phone_number, amount, account_reference, meta.get('user_id'))
+    return response_data
+
+
+def stk_push_task(self, idem_key, phone_number, amount, account_reference, transaction_desc):
+    """Celery entry point; registered with bind=True by the worker."""
+    retries_left = self.max_retries - self.request.retries
+    try:
+        return _process_stk_push(idem_key, phone_number, amount, account_reference, transaction_desc,
+                                 retries_left=retries_left)
+    except Exception as exc:
+        raise self.retry(exc=exc, countdown=min(5 * 2 ** self.request.retries, 60))
@@ -131,3 +131,42 @@ def app():
 @pytest.fixture
 def client(app):
     return app.test_client()
+
+
+# SQL statement budget helper. Counts the statements an endpoint issues for a
+# single request and fails if it exceeds the budget declared for it in
+# `utils.query_options`, so N+1 regressions are caught automatically.
+_TRANSACTION_CONTROL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+@pytest.fixture
+def assert_query_budget(app):
+    from sqlalchemy import event
+    from utils.query_options import query_budget
+
+    def _check(client, url, method='GET', **kwargs):
+        endpoint = app.url_map.bind('localhost').match(url.split('?')[0], method=method)[0]
+        budget = query_budget(endpoint)
+        assert budget is not None, f'No query budget declared for endpoint {endpoint}'
+
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            if not statement.lstrip().upper().startswith(_TRANSACTION_CONTROL):
+                statements.append(statement)
+
+        with app.app_context():
+            engine = _db.engine
+        event.listen(engine, 'before_cursor_execute', _record)
+        try:
+            response = client.open(url, method=method, **kwargs)
+        finally:
+            event.remove(engine, 'before_cursor_execute', _record)
+
+        assert len(statements) <= budget, (
+            f'{endpoint} issued {len(statements)} SQL statements (budget {budget}):\n'
+            + '\n'.join(statements)
+        )
+        return response
+
+    return _check
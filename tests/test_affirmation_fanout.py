@@ -0,0 +1,203 @@
+import pytest
+
+import email_utils
+import tasks.affirmation_tasks as affirmation_tasks
+from models import AffirmationDelivery, Champion, DailyAffirmation, User, db
+from services import affirmation_delivery_service as fanout
+
+
+def _champion(i, email=True, status='Active', user_id=None):
+    return Champion(
+        full_name=f'Champion {i}', gender='Female', phone_number=f'0700{i:06d}',
+        assigned_champion_code=f'FAN-{i:05d}', email=f'champion{i}@example.com' if email else None,
+        champion_status=status, user_id=user_id,
+    )
+
+
+@pytest.fixture
+def emails(monkeypatch):
+    sent = []
+
+    def fake_queue_bulk_email(messages):
+        messages = list(messages)
+        sent.extend(m['to'] for m in messages)
+        return []
+
+    monkeypatch.setattr(email_utils, 'queue_bulk_email', fake_queue_bulk_email)
+    return sent
+
+
+@pytest.fixture
+def affirmation(app):
+    champions = [_champion(i) for i in range(7)]
+    champions += [_champion(7, email=False), _champion(8, status='Inactive')]
+    db.session.add_all(champions)
+    affirmation = DailyAffirmation(content='You are enough', theme='Self Care', created_by=1, times_sent=0)
+    db.session.add(affirmation)
+    db.session.commit()
+    return affirmation
+
+
+def _deliveries(affirmation_id):
+    return AffirmationDelivery.query.filter_by(affirmation_id=affirmation_id).all()
+
+
+def test_fan_out_pages_through_active_champions(app, affirmation, emails):
+    summary = fanout.fan_out_affirmation(affirmation.affirmation_id, chunk_size=3, concurrency=2)
+
+    deliveries = _deliveries(affirmation.affirmation_id)
+    assert summary['recorded'] == len(deliveries) == 8
+    assert sorted(emails) == sorted(f'champion{i}@example.com' for i in range(7))
+    # No email address: falls through to the next channel
+    assert {d.delivery_method for d in deliveries} == {'Email', 'SMS'}
+    assert summary['channels']['email']['sent'] == 7
+    assert summary['channels']['sms'] == {'sent': 0, 'unsent': 1, 'failed': 0}
+    db.session.refresh(affirmation)
+    assert affirmation.times_sent == 8
+
+
+def test_fan_out_rerun_skips_champions_already_reached(app, affirmation, emails):
+    fanout.fan_out_affirmation(affirmation.affirmation_id, channels=['email'], chunk_size=4)
+    assert len(emails) == 7
+
+    db.session.add(_champion(9))
+    db.session.commit()
+    summary = fanout.fan_out_affirmation(affirmation.affirmation_id, channels=['email'], chunk_size=4)
+
+    assert summary['recorded'] == 1
+    assert emails[-1] == 'champion9@example.com' and len(emails) == 8
+    db.session.refresh(affirmation)
+    assert affirmation.times_sent == 8
+
+
+def test_champions_claimed_by_a_concurrent_run_are_not_sent_again(app, affirmation, emails, monkeypatch):
+    target_pages = fanout._target_pages
+
+    def racing_pages(affirmation_id, chunk_size):
+        for page in target_pages(affirmation_id, chunk_size):
+            # Another run records the first champions after this page was read
+            for row in page[:3]:
+                db.session.add(AffirmationDelivery(affirmation_id=affirmation_id, champion_id=row.champion_id,
+                                                   delivery_method='Email'))
+            db.session.commit()
+            yield page
+
+    monkeypatch.setattr(fanout, '_target_pages', racing_pages)
+    summary = fanout.fan_out_affirmation(affirmation.affirmation_id, chunk_size=100)
+
+    assert summary['recorded'] == 5
+    assert sorted(emails) == sorted(f'champion{i}@example.com' for i in range(3, 7))
+    assert len(_deliveries(affirmation.affirmation_id)) == 8
+
+
+def test_failed_batches_are_released_for_a_rerun(app, affirmation, emails, monkeypatch):
+    fake_queue_bulk_email = email_utils.queue_bulk_email
+
+    def flaky(messages):
+        messages = list(messages)
+        if any(m['to'] == 'champion5@example.com' for m in messages):
+            raise ConnectionError('smtp down')
+        return fake_queue_bulk_email(messages)
+
+    monkeypatch.setattr(email_utils, 'queue_bulk_email', flaky)
+    summary = fanout.fan_out_affirmation(affirmation.affirmation_id, channels=['email'], chunk_size=5)
+    assert summary['channels']['email'] == {'sent': 5, 'unsent': 0, 'failed': 2}
+    assert summary['recorded'] == 5
+    assert len(_deliveries(affirmation.affirmation_id)) == 5
+    db.session.refresh(affirmation)
+    assert affirmation.times_sent == 5
+
+    monkeypatch.setattr(email_utils, 'queue_bulk_email', fake_queue_bulk_email)
+    summary = fanout.fan_out_affirmation(affirmation.affirmation_id, channels=['email'], chunk_size=5)
+    assert summary['recorded'] == 2
+    assert sorted(emails[-2:]) == ['champion5@example.com', 'champion6@example.com']
+    assert len(_deliveries(affirmation.affirmation_id)) == 7
+
+
+def test_emails_left_unsent_are_released(app, affirmation, monkeypatch):
+    def smtp_down(messages):
+        # What queue_bulk_email returns when the in-process send loses SMTP
+        messages = list(messages)
+        return messages[1:]
+
+    monkeypatch.setattr(email_utils, 'queue_bulk_email', smtp_down)
+    summary = fanout.fan_out_affirmation(affirmation.affirmation_id, channels=['email'], chunk_size=10)
+    assert summary['channels']['email'] == {'sent': 1, 'unsent': 0, 'failed': 6}
+    assert [d.champion.email for d in _deliveries(affirmation.affirmation_id)] == ['champion0@example.com']
+    db.session.refresh(affirmation)
+    assert affirmation.times_sent == 1
+
+
+def test_fan_out_rejects_unknown_channel_and_inactive_affirmation(app, affirmation):
+    with pytest.raises(ValueError):
+        fanout.fan_out_affirmation(affirmation.affirmation_id, channels=['fax'])
+    affirmation.active = False
+    db.session.commit()
+    with pytest.raises(ValueError):
+        fanout.fan_out_affirmation(affirmation.affirmation_id)
+
+
+@pytest.fixture
+def admin_client(client):
+    admin = User(username='fanout_admin', password_hash='x', role='Admin')
+    db.session.add(admin)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(admin.user_id)
+    return client
+
+
+def test_fan_out_endpoint_runs_inline(admin_client, affirmation, emails):
+    resp = admin_client.post(f'/api/affirmations/{affirmation.affirmation_id}/fan-out', json={'channels': ['email']})
+    assert resp.status_code == 200
+    assert resp.get_json()['summary']['recorded'] == 7
+    assert admin_client.post('/api/affirmations/999999/fan-out', json={}).status_code == 404
+
+
+def test_fan_out_endpoint_refuses_large_inline_runs(app, admin_client, affirmation, emails, monkeypatch):
+    monkeypatch.setitem(app.config, 'AFFIRMATION_FANOUT_INLINE_MAX', 5)
+    resp = admin_client.post(f'/api/affirmations/{affirmation.affirmation_id}/fan-out', json={})
+    assert resp.status_code == 409
+    assert 'AFFIRMATION_FANOUT_ASYNC' in resp.get_json()['message']
+    assert emails == [] and _deliveries(affirmation.affirmation_id) == []
+
+
+def test_fan_out_endpoint_queues_when_async(app, admin_client, affirmation, monkeypatch):
+    queued = []
+    monkeypatch.setitem(app.config, 'AFFIRMATION_FANOUT_ASYNC', True)
+    monkeypatch.setattr(affirmation_tasks, 'enqueue_fan_out', lambda *args: queued.append(args))
+    resp = admin_client.post(f'/api/affirmations/{affirmation.affirmation_id}/fan-out', json={})
+    assert resp.status_code == 202
+    assert queued == [(affirmation.affirmation_id, None)]
+    assert _deliveries(affirmation.affirmation_id) == []
+
+
+def test_manual_delivery_of_the_same_affirmation_is_rejected(admin_client, affirmation):
+    champion_id = Champion.query.filter_by(assigned_champion_code='FAN-00000').one().champion_id
+    body = {'affirmation_id': affirmation.affirmation_id, 'champion_id': champion_id}
+    assert admin_client.post('/api/affirmations/deliveries', json=body).status_code == 201
+    assert admin_client.post('/api/affirmations/deliveries', json=body).status_code == 409
+    assert len(_deliveries(affirmation.affirmation_id)) == 1
+
+
+class FakeTask:
+    max_retries = 3
+
+    class request:
+        retries = 0
+
+    def retry(self, exc=None, countdown=None):
+        self.countdown = countdown
+        return RuntimeError('retry')
+
+
+def test_worker_retries_a_run_with_failed_batches(app, affirmation, monkeypatch):
+    def broken(messages):
+        raise ConnectionError('smtp down')
+
+    monkeypatch.setattr(email_utils, 'queue_bulk_email', broken)
+    task = FakeTask()
+    with app.app_context(), pytest.raises(RuntimeError, match='retry'):
+        affirmation_tasks.fan_out_affirmation_task(task, affirmation.affirmation_id, ['email'])
+    assert task.countdown == 60
+    assert _deliveries(affirmation.affirmation_id) == []
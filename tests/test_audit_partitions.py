@@ -0,0 +1,100 @@
+import gzip
+import json
+from datetime import date, datetime
+
+import pytest
+
+import services.audit_partition_service as partitions
+from services.audit_partition_service import (
+    add_months, archive_partitions, ensure_partitions, partition_name, write_ndjson,
+)
+
+
+def test_month_arithmetic_and_names():
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -13) == date(2024, 12, 1)
+    assert partition_name('access_audit_logs', date(2026, 3, 1)) == 'access_audit_logs_y2026m03'
+
+
+def test_write_ndjson_round_trips_rows(tmp_path):
+    path = str(tmp_path / 'part.ndjson.gz')
+    rows = [
+        {'log_id': 1, 'action': 'viewed_profile', 'timestamp': datetime(2024, 5, 1, 9, 30)},
+        {'log_id': 2, 'action': 'edited_report', 'timestamp': datetime(2024, 5, 2, 10, 0)},
+    ]
+    count, size = write_ndjson(rows, path)
+
+    assert count == 2
+    assert size == (tmp_path / 'part.ndjson.gz').stat().st_size
+    assert not (tmp_path / 'part.ndjson.gz.partial').exists()
+    with gzip.open(path, 'rt') as handle:
+        lines = [json.loads(line) for line in handle]
+    assert lines[0] == {'log_id': 1, 'action': 'viewed_profile', 'timestamp': '2024-05-01T09:30:00'}
+
+
+def test_maintenance_is_noop_without_postgres(tmp_path):
+    assert ensure_partitions() == []
+    assert archive_partitions(12, str(tmp_path / 'archive')) == []
+    assert not (tmp_path / 'archive').exists()
+
+
+class RecordingSession:
+    """Stands in for a PostgreSQL session: records statements and answers the
+    DEFAULT-partition checks from `stranded` ({table: set of 'YYYY-MM-01' months})."""
+
+    def __init__(self, stranded):
+        self.stranded = stranded
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        value = True
+        if sql.startswith('SELECT EXISTS'):
+            table = sql.split(' FROM ')[1].split('_default')[0]
+            value = params['start'] in self.stranded.get(table, set())
+        return type('Result', (), {'scalar': lambda self: value, 'rowcount': 2})()
+
+    def commit(self):
+        self.statements.append('COMMIT')
+
+
+@pytest.fixture
+def postgres_session(monkeypatch):
+    def make(stranded):
+        session = RecordingSession(stranded)
+        monkeypatch.setattr(partitions, 'db', type('FakeDB', (), {'session': session})())
+        monkeypatch.setattr(partitions, '_is_postgres', lambda: True)
+        monkeypatch.setattr(partitions, '_quote', lambda name: f'"{name}"')
+        monkeypatch.setattr(partitions, 'list_partitions', lambda table: [])
+        return session
+    return make
+
+
+def test_missed_month_rows_move_out_of_default_partition(postgres_session):
+    session = postgres_session({'access_audit_logs': {'2026-05-01'}})
+
+    created = ensure_partitions(months_ahead=1, today=date(2026, 5, 20))
+
+    assert 'access_audit_logs_y2026m05' in created and len(created) == 4
+    start = session.statements.index('LOCK TABLE access_audit_logs_default IN EXCLUSIVE MODE')
+    may = session.statements[start:session.statements.index('COMMIT', start)]
+    assert [sql.split(' WHERE')[0] for sql in may] == [
+        'LOCK TABLE access_audit_logs_default IN EXCLUSIVE MODE',
+        'SELECT EXISTS (SELECT 1 FROM access_audit_logs_default',
+        'ALTER TABLE access_audit_logs DETACH PARTITION access_audit_logs_default',
+        "CREATE TABLE access_audit_logs_y2026m05 PARTITION OF access_audit_logs "
+        "FOR VALUES FROM ('2026-05-01') TO ('2026-06-01')",
+        'INSERT INTO access_audit_logs_y2026m05 SELECT * FROM access_audit_logs_default',
+        'DELETE FROM access_audit_logs_default',
+        'ALTER TABLE access_audit_logs ATTACH PARTITION access_audit_logs_default DEFAULT',
+    ]
+
+
+def test_partition_created_directly_when_default_has_no_rows_for_month(postgres_session):
+    session = postgres_session({})
+
+    ensure_partitions(months_ahead=0, today=date(2026, 5, 20))
+
+    assert not any('DETACH' in sql or 'INSERT' in sql for sql in session.statements)
+    assert sum(sql.startswith('CREATE TABLE') for sql in session.statements) == 2
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+from prometheus_client import REGISTRY
+
+from models import db, AccessAuditLog
+from utils.audit_sink import AuditSink, REDIS_QUEUE_KEY
+
+
+class FakeRedis:
+    def __init__(self):
+        self.items = []
+
+    def llen(self, key):
+        return len(self.items)
+
+    def lpush(self, key, value):
+        self.items.insert(0, value)
+
+    def rpush(self, key, *values):
+        self.items.extend(values)
+
+    def rpop(self, key, count):
+        popped = []
+        while self.items and len(popped) < count:
+            popped.append(self.items.pop())
+        return popped
+
+
+@pytest.fixture
+def sink(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUDIT_SINK_MODE', 'async')
+    monkeypatch.setitem(app.config, 'AUDIT_SINK_QUEUE_SIZE', 3)
+    monkeypatch.setitem(app.config, 'AUDIT_SINK_BACKEND', 'memory')
+    monkeypatch.setitem(app.extensions, 'audit_sink', app.extensions.get('audit_sink'))
+    s = AuditSink()
+    s.init_app(app, start_worker=False)
+    return s
+
+
+def _logged(action):
+    return AccessAuditLog.query.filter_by(action=action).count()
+
+
+def test_async_events_are_written_in_one_flush(sink):
+    for _ in range(3):
+        assert sink.record(AccessAuditLog, action='sink_batched', details='page view') is None
+    assert _logged('sink_batched') == 0
+
+    assert sink.flush() == 3
+    assert _logged('sink_batched') == 3
+    assert AccessAuditLog.query.filter_by(action='sink_batched').first().timestamp is not None
+
+
+def test_full_queue_drops_and_counts(sink):
+    before = REGISTRY.get_sample_value('unda_audit_events_dropped_total', {'reason': 'queue_full'}) or 0
+    for _ in range(4):
+        sink.record(AccessAuditLog, action='sink_overflow')
+    assert REGISTRY.get_sample_value('unda_audit_events_dropped_total', {'reason': 'queue_full'}) == before + 1
+    assert REGISTRY.get_sample_value('unda_audit_queue_depth', {'backend': 'memory'}) == 3
+    assert sink.flush() == 3
+
+
+def test_sync_record_joins_the_callers_transaction(sink):
+    entry = sink.record(AccessAuditLog, sync=True, action='sink_sensitive')
+    assert entry in db.session.new
+    db.session.commit()
+    assert _logged('sink_sensitive') == 1
+
+
+def test_redis_queue_round_trips_timestamps(sink):
+    sink._redis = FakeRedis()
+    sink.record(AccessAuditLog, action='sink_redis')
+    assert sink._queue.qsize() == 0
+    assert json.loads(sink._redis.items[0])['table'] == 'access_audit_logs'
+
+    assert sink.flush() == 1
+    assert _logged('sink_redis') == 1
+
+
+@pytest.fixture
+def db_down(monkeypatch):
+    state = {'down': True}
+    execute = db.session.execute
+
+    def flaky_execute(statement, *args, **kwargs):
+        if state['down'] and getattr(statement, 'table', None) is AccessAuditLog.__table__:
+            raise RuntimeError('database unavailable')
+        return execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db.session, 'execute', flaky_execute)
+    return state
+
+
+@pytest.mark.parametrize('backend', ['memory', 'redis'])
+def test_failed_write_is_requeued_and_retried(sink, db_down, backend):
+    if backend == 'redis':
+        sink._redis = FakeRedis()
+    sink.record(AccessAuditLog, action='sink_outage')
+    sink.record(AccessAuditLog, action='sink_outage')
+
+    assert sink.flush() == 0
+    assert _logged('sink_outage') == 0
+    queued = sink._redis.items if backend == 'redis' else list(sink._queue.queue)
+    assert len(queued) == 2
+
+    db_down['down'] = False
+    assert sink.flush() == 2
+    assert _logged('sink_outage') == 2
+
+
+def test_rows_are_dropped_after_max_attempts(sink, db_down):
+    before = REGISTRY.get_sample_value('unda_audit_events_dropped_total', {'reason': 'write_error'}) or 0
+    sink.max_attempts = 2
+    sink.record(AccessAuditLog, action='sink_poison')
+
+    assert sink.flush() == 0
+    assert sink._queue.qsize() == 1
+    assert sink.flush() == 0
+    assert sink._queue.qsize() == 0
+    assert REGISTRY.get_sample_value('unda_audit_events_dropped_total', {'reason': 'write_error'}) == before + 1
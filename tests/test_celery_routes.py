@@ -0,0 +1,32 @@
+"""Task routing, checked on a real Celery app so a broken celery_app.py fails here."""
+import pytest
+
+from celery_app import make_celery
+
+ROUTES = [
+    ('tasks.mpesa_stk_push', 'payments'),
+    ('tasks.send_email', 'email'),
+    ('tasks.send_email_batch', 'email'),
+    ('tasks.fan_out_affirmation', 'affirmations'),
+]
+
+
+@pytest.fixture(autouse=True)
+def default_queues(monkeypatch):
+    for name in ('MPESA_TASK_QUEUE', 'EMAIL_TASK_QUEUE', 'AFFIRMATION_TASK_QUEUE'):
+        monkeypatch.delenv(name, raising=False)
+
+
+def _queue(celery, task_name):
+    return celery.amqp.router.route({}, task_name)['queue'].name
+
+
+@pytest.mark.parametrize('task_name, queue', ROUTES)
+def test_task_routes(task_name, queue):
+    assert _queue(make_celery(), task_name) == queue
+
+
+@pytest.mark.parametrize('task_name, queue', ROUTES)
+def test_task_routes_with_flask_config(app, task_name, queue):
+    # The worker passes the Flask app, whose config switches Celery to old setting names
+    assert _queue(make_celery(app), task_name) == queue
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from models import db, Champion, ChampionCodeCounter, allocate_champion_number, generate_champion_code
+
+
+def _prefix():
+    return f'UMV-{datetime.now().year}-'
+
+
+def _clear_counter():
+    ChampionCodeCounter.query.filter_by(year=datetime.now().year).delete()
+    Champion.query.filter(Champion.assigned_champion_code.like(f'{_prefix()}%')).delete(synchronize_session=False)
+    db.session.flush()
+
+
+def test_codes_are_sequential_per_year():
+    _clear_counter()
+    codes = [generate_champion_code() for _ in range(3)]
+    assert codes == [f'{_prefix()}000001', f'{_prefix()}000002', f'{_prefix()}000003']
+    assert db.session.get(ChampionCodeCounter, datetime.now().year).last_value == 3
+
+
+def test_first_allocation_continues_after_existing_codes():
+    _clear_counter()
+    db.session.add(Champion(full_name='Legacy', gender='F', phone_number='0700003333',
+                            assigned_champion_code=f'{_prefix()}000041'))
+    db.session.flush()
+
+    assert generate_champion_code() == f'{_prefix()}000042'
+    assert generate_champion_code() == f'{_prefix()}000043'
+
+
+def test_years_have_independent_counters():
+    assert allocate_champion_number(1999) == 1
+    assert allocate_champion_number(1998) == 1
+    assert allocate_champion_number(1999) == 2
+
+
+def test_rolled_back_allocation_is_released():
+    _clear_counter()
+    db.session.commit()
+    assert generate_champion_code() == f'{_prefix()}000001'
+    db.session.rollback()
+    assert generate_champion_code() == f'{_prefix()}000001'
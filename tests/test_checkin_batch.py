@@ -0,0 +1,127 @@
+import os
+
+import jwt
+import pytest
+
+import utils.idempotency as idempotency
+from models import db, Champion, User, YouthSupport
+
+HEADERS = {'Authorization': 'Bearer batch-token'}
+
+
+@pytest.fixture(autouse=True)
+def token_and_store(monkeypatch):
+    monkeypatch.setenv('API_SMOKE_TOKEN', 'batch-token')
+    monkeypatch.setattr(idempotency, '_backend', idempotency.MemoryBackend())
+
+
+@pytest.fixture
+def champions():
+    created = []
+    for i in range(2):
+        c = Champion(full_name=f'Batch Champ {i}', gender='F', phone_number=f'07000022{i:02d}', assigned_champion_code=f'UMV-2026-2222{i:02d}')
+        db.session.add(c)
+        created.append(c)
+    db.session.commit()
+    return created
+
+
+def _post(client, reports):
+    return client.post('/api/checkin/batch', json={'reports': reports}, headers=HEADERS)
+
+
+def test_batch_upserts_valid_items_and_reports_per_item_errors(client, champions):
+    a, b = champions
+    rv = _post(client, [
+        {'champion_id': a.champion_id, 'reporting_period': '2026-04-06', 'weekly_check_in_completion_rate': 90},
+        {'champion_id': b.champion_id, 'reporting_period': '2026-04-06', 'weekly_check_in_completion_rate': 20},
+        {'champion_id': a.champion_id, 'reporting_period': '06/04/2026'},
+        {'champion_id': 999999, 'reporting_period': '2026-04-06'},
+        {'champion_id': a.champion_id, 'reporting_period': '2026-04-13', 'referrals_initiated': 'many'},
+    ])
+    assert rv.status_code == 200
+    body = rv.get_json()
+    assert body['accepted'] == 2 and body['rejected'] == 3
+    statuses = [r['status'] for r in body['results']]
+    assert statuses == ['ok', 'ok', 'error', 'error', 'error']
+    assert body['results'][0]['flagged'] is False
+    assert body['results'][1]['flagged'] is True
+    assert 'reporting_period' in body['results'][2]['error']
+    assert body['results'][3]['error'] == 'Champion profile not found'
+    assert YouthSupport.query.filter(YouthSupport.champion_id.in_([a.champion_id, b.champion_id])).count() == 2
+
+
+def test_batch_merges_repeated_reports_for_same_period(client, champions):
+    a = champions[0]
+    rv = _post(client, [
+        {'champion_id': a.champion_id, 'reporting_period': '2026-04-20', 'number_of_youth_under_support': 3},
+        {'champion_id': a.champion_id, 'reporting_period': '2026-04-20', 'referrals_initiated': 1},
+    ])
+    results = rv.get_json()['results']
+    assert results[0]['report_id'] == results[1]['report_id']
+
+    db.session.expire_all()
+    report = YouthSupport.query.filter_by(champion_id=a.champion_id).one()
+    assert report.number_of_youth_under_support == 3
+    assert report.referrals_initiated == 1
+
+
+def test_batch_replays_items_with_seen_idempotency_keys(client, champions):
+    a = champions[0]
+    item = {'champion_id': a.champion_id, 'reporting_period': '2026-04-27', 'idempotency_key': 'sync-1',
+            'weekly_check_in_completion_rate': 70}
+    first = _post(client, [item]).get_json()['results'][0]
+    assert first['status'] == 'ok' and 'replayed' not in first
+
+    again = _post(client, [dict(item, weekly_check_in_completion_rate=10)]).get_json()['results'][0]
+    assert again['replayed'] is True
+    assert again['report_id'] == first['report_id']
+
+    db.session.expire_all()
+    report = YouthSupport.query.filter_by(champion_id=a.champion_id).one()
+    assert float(report.weekly_check_in_completion_rate) == 70
+
+
+def test_batch_rejects_oversized_and_empty_payloads(app, client, champions, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHECKIN_BATCH_MAX_ITEMS', 2)
+    item = {'champion_id': champions[0].champion_id}
+    assert _post(client, [item] * 3).status_code == 413
+    assert _post(client, []).status_code == 400
+
+
+def test_batch_requires_auth(client):
+    rv = client.post('/api/checkin/batch', json={'reports': [{}]})
+    assert rv.status_code == 401
+
+
+def _jwt_headers(app, role, champion_id=None):
+    user = User(username=f'batch_{role.lower().replace(" ", "_")}', password_hash='x', role=role, champion_id=champion_id)
+    db.session.add(user)
+    db.session.commit()
+    secret = os.environ.get('SECRET_KEY') or app.config['SECRET_KEY']
+    return {'Authorization': 'Bearer ' + jwt.encode({'sub': str(user.user_id)}, secret, algorithm='HS256')}
+
+
+def test_batch_jwt_without_champion_profile_cannot_name_champions(app, client, champions):
+    headers = _jwt_headers(app, User.ROLE_PREVENTION_ADVOCATE)
+    report = {'champion_id': champions[0].champion_id, 'reporting_period': '2026-05-04'}
+    rv = client.post('/api/checkin/batch', json={'reports': [report]}, headers=headers)
+    assert rv.status_code == 403
+    assert YouthSupport.query.filter_by(champion_id=champions[0].champion_id).count() == 0
+
+
+def test_batch_jwt_champion_is_limited_to_own_profile(app, client, champions):
+    own, other = champions
+    headers = _jwt_headers(app, User.ROLE_PREVENTION_ADVOCATE, champion_id=own.champion_id)
+    rv = client.post('/api/checkin/batch', json={'reports': [
+        {'reporting_period': '2026-05-04'},
+        {'champion_id': other.champion_id, 'reporting_period': '2026-05-04'},
+    ]}, headers=headers)
+    assert [r['status'] for r in rv.get_json()['results']] == ['ok', 'error']
+
+
+def test_batch_supervisor_jwt_may_name_champions(app, client, champions):
+    headers = _jwt_headers(app, User.ROLE_SUPERVISOR)
+    report = {'champion_id': champions[1].champion_id, 'reporting_period': '2026-05-04'}
+    rv = client.post('/api/checkin/batch', json={'reports': [report]}, headers=headers)
+    assert rv.get_json()['accepted'] == 1
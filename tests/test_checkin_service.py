@@ -0,0 +1,78 @@
+from datetime import date
+
+import pytest
+
+from models import db, Champion, YouthSupport
+from services.checkin_service import parse_reporting_period, submit_checkin
+
+
+@pytest.fixture
+def champion():
+    c = Champion(full_name='Checkin Champ', gender='F', phone_number='0700001111', assigned_champion_code='UMV-2026-111111')
+    db.session.add(c)
+    db.session.commit()
+    return c
+
+
+def _reports(champion_id):
+    db.session.expire_all()
+    return YouthSupport.query.filter_by(champion_id=champion_id).all()
+
+
+def test_parse_reporting_period():
+    assert parse_reporting_period('2026-03-02') == date(2026, 3, 2)
+    assert parse_reporting_period(None) == date.today()
+    with pytest.raises(ValueError):
+        parse_reporting_period('02/03/2026')
+
+
+def test_submit_creates_then_updates_single_row(champion):
+    period = date(2026, 3, 2)
+    first_id, flagged = submit_checkin(champion.champion_id, period, {
+        'number_of_youth_under_support': 4, 'weekly_check_in_completion_rate': 80,
+    })
+    assert flagged is False
+
+    second_id, flagged = submit_checkin(champion.champion_id, period, {'referrals_initiated': '2'})
+    assert second_id == first_id
+    assert flagged is False
+
+    reports = _reports(champion.champion_id)
+    assert len(reports) == 1
+    report = reports[0]
+    # Fields absent from the second payload keep their stored values
+    assert report.number_of_youth_under_support == 4
+    assert float(report.weekly_check_in_completion_rate) == 80
+    assert report.referrals_initiated == 2
+
+
+def test_red_flag_uses_merged_values(champion):
+    period = date(2026, 3, 9)
+    _, flagged = submit_checkin(champion.champion_id, period, {'weekly_check_in_completion_rate': 30})
+    assert flagged is True
+
+    # A later update without a rate still sees the stored low rate
+    _, flagged = submit_checkin(champion.champion_id, period, {'number_of_youth_under_support': 3})
+    assert flagged is True
+
+    other = date(2026, 3, 16)
+    _, flagged = submit_checkin(champion.champion_id, other, {'weekly_check_in_completion_rate': 90})
+    assert flagged is False
+    _, flagged = submit_checkin(champion.champion_id, other, {'flags_and_concerns_logged': 'Absent twice'})
+    assert flagged is True
+    assert _reports(champion.champion_id)[-1].flag_timestamp is not None
+
+
+def test_checkin_endpoint_retries_do_not_duplicate(client, champion, monkeypatch):
+    monkeypatch.setenv('API_SMOKE_TOKEN', 'checkin-token')
+    payload = {'champion_id': champion.champion_id, 'reporting_period': '2026-03-23', 'weekly_check_in_completion_rate': 75}
+    headers = {'Authorization': 'Bearer checkin-token'}
+
+    ids = set()
+    for _ in range(3):
+        rv = client.post('/api/checkin', json=payload, headers=headers)
+        assert rv.status_code == 201, rv.data[:200]
+        ids.add(rv.get_json()['report_id'])
+
+    assert len(ids) == 1
+    assert len(_reports(champion.champion_id)) == 1
@@ -0,0 +1,200 @@
+import threading
+import time
+
+import pytest
+
+from utils.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, circuit
+
+
+class FakeRedis:
+    """The handful of commands the shared breaker state uses, with TTLs."""
+
+    def __init__(self):
+        self.store = {}
+        self.expires = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError('redis down')
+        now = time.time()
+        for key in [k for k, at in self.expires.items() if at <= now]:
+            self.store.pop(key, None)
+            self.expires.pop(key, None)
+
+    def mget(self, *keys):
+        self._check()
+        return [self.store.get(k) for k in keys]
+
+    def set(self, key, val, nx=False, ex=None):
+        self._check()
+        if nx and key in self.store:
+            return None
+        self.store[key] = val
+        if ex:
+            self.expires[key] = time.time() + ex
+        return True
+
+    def incr(self, key):
+        self._check()
+        self.store[key] = int(self.store.get(key, 0)) + 1
+        return self.store[key]
+
+    def expire(self, key, seconds):
+        self.expires[key] = time.time() + seconds
+
+    def zadd(self, key, mapping):
+        self._check()
+        self.store.setdefault(key, {}).update(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.store.get(key, {})
+        for member in [m for m, score in zset.items() if low <= score <= high]:
+            del zset[member]
+
+    def zcard(self, key):
+        return len(self.store.get(key, {}))
+
+    def zcount(self, key, low, high):
+        self._check()
+        return sum(1 for score in self.store.get(key, {}).values() if score >= low)
+
+    def delete(self, *keys):
+        self._check()
+        removed = 0
+        for key in keys:
+            removed += key in self.store
+            self.store.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        # The breaker registers one script: INCR with a TTL on creation
+        def admit_trial(keys, args):
+            trials = self.incr(keys[0])
+            if trials == 1:
+                self.expire(keys[0], int(args[0]))
+            return trials
+        return admit_trial
+
+
+class FakePipeline:
+    """Queues commands and runs them together on execute()."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+        return lambda *args, **kwargs: self.commands.append((command, args, kwargs))
+
+    def execute(self):
+        self.redis._check()
+        return [command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+
+def _shared(redis, **kwargs):
+    cb = CircuitBreaker(name='svc', redis_url='redis://fake', **kwargs)
+    cb._redis.client = redis
+    return cb
+
+
+def _expire_open(cb):
+    """Skip past reset_timeout."""
+    if cb._redis.client is not None:
+        cb._redis.client.store.pop('circuit:svc:open', None)
+    else:
+        cb._memory._opened_at -= cb.reset_timeout + 1
+
+
+def _fail(cb):
+    with pytest.raises(ValueError):
+        cb.call(lambda: (_ for _ in ()).throw(ValueError('down')))
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_opens_then_half_open_trial_closes(shared):
+    cb = _shared(FakeRedis(), fail_max=3, reset_timeout=30) if shared else CircuitBreaker(fail_max=3)
+    for _ in range(3):
+        _fail(cb)
+    assert cb.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        cb.call(lambda: 'ok')
+
+    _expire_open(cb)
+    assert cb.state == HALF_OPEN
+    assert cb.call_allowed() is True
+    # Only one trial at a time
+    others = []
+    probe = threading.Thread(target=lambda: others.append(cb.call_allowed()))
+    probe.start()
+    probe.join()
+    assert others == [False]
+    cb.record_success()
+    assert cb.state == CLOSED and cb.failure_count == 0
+    assert cb.call(lambda: 'ok') == 'ok'
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_failed_trial_reopens(shared):
+    cb = _shared(FakeRedis(), fail_max=1) if shared else CircuitBreaker(fail_max=1)
+    _fail(cb)
+    _expire_open(cb)
+    _fail(cb)
+    assert cb.state == OPEN
+
+
+def test_failures_outside_the_window_do_not_count():
+    cb = CircuitBreaker(fail_max=2, window=60)
+    _fail(cb)
+    cb._memory._failures[0] -= 61
+    _fail(cb)
+    assert cb.state == CLOSED and cb.failure_count == 1
+
+
+def test_state_is_shared_between_processes():
+    redis = FakeRedis()
+    web, worker = _shared(redis, fail_max=2), _shared(redis, fail_max=2)
+    _fail(web)
+    _fail(worker)
+    assert web.is_open() and worker.is_open()
+
+    _expire_open(web)
+    web.call(lambda: 'probe')
+    assert worker.state == CLOSED
+
+
+def test_falls_back_to_process_state_when_redis_is_down():
+    redis = FakeRedis()
+    redis.down = True
+    cb = _shared(redis, fail_max=2)
+    _fail(cb)
+    _fail(cb)
+    assert cb.state == OPEN
+    assert cb._client() is None
+
+
+def test_decorator_raises_runtime_error_when_open():
+    cb = CircuitBreaker(fail_max=1)
+
+    @circuit(cb)
+    def call():
+        raise ConnectionError('down')
+
+    with pytest.raises(ConnectionError):
+        call()
+    with pytest.raises(RuntimeError, match='CircuitOpen'):
+        call()
+
+
+def test_half_open_trial_counter_gets_a_ttl():
+    redis = FakeRedis()
+    cb = _shared(redis, fail_max=1, reset_timeout=30)
+    _fail(cb)
+    _expire_open(cb)
+    assert cb.call_allowed() is True
+    assert 'circuit:svc:trials' in redis.expires
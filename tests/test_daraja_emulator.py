@@ -0,0 +1,68 @@
+import base64
+
+from tools.daraja_emulator import DarajaEmulator
+
+
+def _push_body(emulator_passkey='pk', reference='ref-1'):
+    timestamp = '20261019120000'
+    return {
+        'BusinessShortCode': '174379',
+        'Password': base64.b64encode(f'174379{emulator_passkey}{timestamp}'.encode()).decode(),
+        'Timestamp': timestamp,
+        'TransactionType': 'CustomerPayBillOnline',
+        'Amount': 10,
+        'PartyA': '254712345678',
+        'PartyB': '174379',
+        'PhoneNumber': '254712345678',
+        'CallBackURL': 'http://127.0.0.1:9/api/mpesa/callback',
+        'AccountReference': reference,
+        'TransactionDesc': 'test',
+    }
+
+
+def test_oauth_push_and_query_flow():
+    emulator = DarajaEmulator(latency=(0, 0), callback_delay=(3600, 3600), lost_callback_rate=1.0,
+                              cancel_rate=0, insufficient_rate=0, timeout_rate=0,
+                              consumer_key='key', consumer_secret='secret', passkey='pk', seed=1)
+    client = emulator.create_app().test_client()
+    basic = {'Authorization': 'Basic ' + base64.b64encode(b'key:secret').decode()}
+
+    assert client.get('/oauth/v1/generate?grant_type=client_credentials').status_code == 400
+    token = client.get('/oauth/v1/generate?grant_type=client_credentials', headers=basic).get_json()['access_token']
+    bearer = {'Authorization': f'Bearer {token}'}
+
+    assert client.post('/mpesa/stkpush/v1/processrequest', json=_push_body()).status_code == 401
+    assert client.post('/mpesa/stkpush/v1/processrequest', json=_push_body('wrong'), headers=bearer).status_code == 400
+
+    accepted = client.post('/mpesa/stkpush/v1/processrequest', json=_push_body(), headers=bearer).get_json()
+    assert accepted['ResponseCode'] == '0'
+    checkout_id = accepted['CheckoutRequestID']
+
+    query = client.post('/mpesa/stkpushquery/v1/query', json={'CheckoutRequestID': checkout_id}, headers=bearer)
+    assert query.status_code == 500 and query.get_json()['errorMessage'] == 'The transaction is being processed'
+
+    # Complete the push now; the callback is "lost" so nothing is posted
+    emulator._complete(checkout_id)
+    query = client.post('/mpesa/stkpushquery/v1/query', json={'CheckoutRequestID': checkout_id}, headers=bearer)
+    assert query.get_json()['ResultCode'] == '0'
+
+    client.post('/mpesa/stkpush/v1/processrequest', json=_push_body(), headers=bearer)
+    stats = client.get('/__emulator__/stats').get_json()
+    assert stats['counters']['push_accepted'] == 2
+    assert stats['counters']['repeated_pushes'] == 1
+    assert stats['counters']['callbacks_lost'] == 1
+
+
+def test_callback_body_matches_daraja():
+    emulator = DarajaEmulator(seed=1)
+    push = {
+        'checkout_request_id': 'ws_CO_1', 'merchant_request_id': 'm1', 'phone_number': '254712345678',
+        'amount': 10, 'receipt': 'ABC123', 'outcome': 'paid',
+    }
+    callback = emulator._callback_body(push)['Body']['stkCallback']
+    items = {item['Name']: item['Value'] for item in callback['CallbackMetadata']['Item']}
+    assert callback['ResultCode'] == 0 and items['MpesaReceiptNumber'] == 'ABC123'
+
+    push['outcome'] = 'cancelled'
+    callback = emulator._callback_body(push)['Body']['stkCallback']
+    assert callback['ResultCode'] == 1032 and 'CallbackMetadata' not in callback
@@ -0,0 +1,65 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from utils.db_pool import InstrumentedQueuePool, engine_options
+
+PG_URL = 'postgresql://u:p@db/unda'
+
+
+def test_sqlite_keeps_default_engine_options():
+    assert engine_options('sqlite:///:memory:', environ={}) == {}
+
+
+def test_pool_sizes_follow_process_type_and_overrides():
+    web = engine_options(PG_URL, environ={})
+    assert web['poolclass'] is InstrumentedQueuePool
+    assert (web['pool_size'], web['max_overflow'], web['pool_timeout']) == (10, 5, 10)
+    assert web['connect_args']['options'] == '-c statement_timeout=30000'
+
+    worker = engine_options(PG_URL, environ={'APP_PROCESS_TYPE': 'worker', 'DB_POOL_SIZE': '8', 'DB_POOL_SIZE_WORKER': '3'})
+    assert worker['pool_size'] == 3
+    assert worker['max_overflow'] == 2
+
+    cli = engine_options(PG_URL, process='cli', environ={'DB_MAX_OVERFLOW': '4'})
+    assert (cli['pool_size'], cli['max_overflow']) == (1, 4)
+
+
+def test_pgbouncer_mode_uses_null_pool_without_startup_options():
+    options = engine_options(PG_URL, environ={'DB_PGBOUNCER': 'True'})
+    assert options['poolclass'] is NullPool
+    assert 'options' not in options['connect_args']
+    assert 'pool_size' not in options
+
+    psycopg3 = engine_options('postgresql+psycopg://u:p@db/unda', environ={'DB_PGBOUNCER': 'True'})
+    assert psycopg3['connect_args']['prepare_threshold'] is None
+
+
+def _sample(name, pool):
+    return REGISTRY.get_sample_value(name, {'pool': pool}) or 0
+
+
+def test_instrumented_pool_reports_usage_and_timeouts(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "pool.db"}', poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    engine.pool.metrics_label = 'pool_test'
+    waits = _sample('unda_db_pool_wait_seconds_count', 'pool_test')
+    timeouts = _sample('unda_db_pool_timeouts_total', 'pool_test')
+
+    conn = engine.connect()
+    assert _sample('unda_db_pool_checked_out', 'pool_test') == 1
+    assert _sample('unda_db_pool_wait_seconds_count', 'pool_test') == waits + 1
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    assert _sample('unda_db_pool_timeouts_total', 'pool_test') == timeouts + 1
+
+    conn.close()
+    assert _sample('unda_db_pool_checked_out', 'pool_test') == 0
+
+    # The label survives dispose(), which recreates the pool
+    engine.dispose()
+    assert engine.pool.metrics_label == 'pool_test'
+    engine.dispose()
@@ -0,0 +1,65 @@
+import pytest
+
+import utils.db_routing as db_routing
+from app import create_app
+from models import db, BlogPost
+from utils.db_routing import RoutingSession
+
+
+def _seed(engine, title):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(BlogPost.__table__.insert().values(title=title, slug='routed', content='x', published=True))
+
+
+@pytest.fixture
+def routed_app(tmp_path, monkeypatch):
+    app, _ = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.db"}',
+        'DATABASE_REPLICA_URL': f'sqlite:///{tmp_path / "replica.db"}',
+        'RATELIMIT_STORAGE_URL': 'memory://',
+        'WTF_CSRF_ENABLED': False,
+    })
+
+    @app.route('/_routing/rename', methods=['POST'])
+    def rename_post():
+        BlogPost.query.filter_by(slug='routed').one().title = 'renamed'
+        db.session.commit()
+        return '', 204
+
+    # The shared test fixtures swap db.session for a plain session; use the
+    # application's routing session for these requests.
+    monkeypatch.setattr(db, 'session', db._make_scoped_session({'class_': RoutingSession}))
+    monkeypatch.setattr(db_routing, '_lag_cache', {})
+
+    with app.app_context():
+        _seed(db.engines[None], 'on primary')
+        _seed(db.engines['replica_0'], 'on replica')
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app registers (empty) metadata per bind on the shared extension;
+    # drop it so other apps in this process don't look for the replica bind.
+    db.metadatas.pop('replica_0', None)
+
+
+def _titles(client):
+    return [p['title'] for p in client.get('/api/blog/').get_json()['posts']]
+
+
+def test_marked_reads_use_replica_until_client_writes(routed_app):
+    client = routed_app.test_client()
+    assert _titles(client) == ['on replica']
+
+    assert client.post('/_routing/rename').status_code == 204
+    # Read-your-writes: the writer is pinned to the primary for a while
+    assert _titles(client) == ['renamed']
+    # Other clients keep reading from the replica
+    assert _titles(routed_app.test_client()) == ['on replica']
+
+
+def test_lagging_replica_is_skipped(routed_app, monkeypatch):
+    monkeypatch.setattr(db_routing, '_measure_lag', lambda engine: 60.0)
+    assert _titles(routed_app.test_client()) == ['on primary']
@@ -0,0 +1,126 @@
+import smtplib
+
+import pytest
+
+import email_utils
+import tasks.email_tasks as email_tasks
+from utils.circuit import get_breaker
+
+
+class FakeConnection:
+    def __init__(self, log, fail_on=None):
+        self.log = log
+        self.fail_on = fail_on or {}
+
+    def __enter__(self):
+        self.log['connects'] += 1
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send(self, msg):
+        to = msg.recipients[0]
+        if to in self.fail_on:
+            raise self.fail_on[to]
+        self.log['sent'].append(to)
+
+
+@pytest.fixture
+def smtp(app, monkeypatch):
+    log = {'connects': 0, 'sent': [], 'fail_on': {}}
+    monkeypatch.setattr(email_utils.mail, 'connect', lambda: FakeConnection(log, log['fail_on']))
+    get_breaker('smtp').reset()
+    with app.app_context():
+        yield log
+    get_breaker('smtp').reset()
+
+
+def _messages(n):
+    return [{'to': f'user{i}@example.com', 'subject': 'Hi', 'body': 'Hello'} for i in range(n)]
+
+
+def test_batch_is_sent_over_one_connection(smtp):
+    assert email_utils.send_messages(_messages(5), rate=0) == []
+    assert smtp['connects'] == 1
+    assert smtp['sent'] == [f'user{i}@example.com' for i in range(5)]
+
+
+def test_connection_error_returns_unsent_and_permanent_refusals_are_dropped(smtp):
+    smtp['fail_on']['user1@example.com'] = smtplib.SMTPRecipientsRefused({'user1@example.com': (550, b'no')})
+    smtp['fail_on']['user3@example.com'] = smtplib.SMTPServerDisconnected('gone')
+    unsent = email_utils.send_messages(_messages(5), rate=0)
+    assert smtp['sent'] == ['user0@example.com', 'user2@example.com']
+    assert [m['to'] for m in unsent] == ['user3@example.com', 'user4@example.com']
+
+
+def test_queue_email_enqueues_when_async(app, smtp, monkeypatch):
+    queued = []
+    monkeypatch.setitem(app.config, 'EMAIL_ASYNC', True)
+    monkeypatch.setattr(email_tasks, 'enqueue_email', lambda *args: queued.append(args))
+    assert email_utils.queue_email('a@example.com', 'Subject', 'Body', '<p>Body</p>') is True
+    assert queued == [('a@example.com', 'Subject', 'Body', '<p>Body</p>')]
+
+
+def test_queue_email_sends_in_process_when_broker_is_down(app, smtp, monkeypatch):
+    def down(*args):
+        raise ConnectionError('broker down')
+
+    monkeypatch.setitem(app.config, 'EMAIL_ASYNC', True)
+    monkeypatch.setattr(email_tasks, 'enqueue_email', down)
+    assert email_utils.queue_email('a@example.com', 'Subject', 'Body') is True
+    assert smtp['sent'] == ['a@example.com']
+
+
+def test_bulk_email_is_queued_in_batches(app, smtp, monkeypatch):
+    batches = []
+    monkeypatch.setitem(app.config, 'EMAIL_ASYNC', True)
+    monkeypatch.setitem(app.config, 'EMAIL_BATCH_SIZE', 2)
+    monkeypatch.setattr(email_tasks, 'enqueue_email_batch', lambda batch: batches.append(len(batch)))
+    assert email_utils.queue_bulk_email(_messages(5)) == []
+    assert batches == [2, 2, 1]
+
+
+def test_bulk_email_returns_what_an_in_process_send_left_unsent(app, smtp, monkeypatch):
+    monkeypatch.setitem(app.config, 'EMAIL_ASYNC', False)
+    monkeypatch.setitem(app.config, 'EMAIL_SEND_RATE', 0)
+    smtp['fail_on']['user2@example.com'] = smtplib.SMTPServerDisconnected('gone')
+    unsent = email_utils.queue_bulk_email(_messages(4))
+    assert [m['to'] for m in unsent] == ['user2@example.com', 'user3@example.com']
+
+
+class FakeTask:
+    max_retries = 3
+
+    class request:
+        retries = 0
+
+    def retry(self, kwargs=None, countdown=None):
+        self.retried_with = (kwargs, countdown)
+        return RuntimeError('retry')
+
+
+def test_worker_retries_only_unsent_messages(smtp):
+    smtp['fail_on']['user2@example.com'] = smtplib.SMTPServerDisconnected('gone')
+    task = FakeTask()
+    with pytest.raises(RuntimeError, match='retry'):
+        email_tasks.send_email_batch_task(task, _messages(3))
+    kwargs, countdown = task.retried_with
+    assert [m['to'] for m in kwargs['messages']] == ['user2@example.com']
+    assert countdown == email_tasks.retry_countdown(0)
+    assert smtp['sent'] == ['user0@example.com', 'user1@example.com']
+
+
+def test_email_async_defaults_on_when_a_broker_is_configured(monkeypatch):
+    from app import create_app
+
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'SECRET_KEY': 'test-secret-key'}
+    monkeypatch.delenv('EMAIL_ASYNC', raising=False)
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    assert create_app(config)[0].config['EMAIL_ASYNC'] is False
+
+    monkeypatch.setenv('REDIS_URL', 'redis://localhost:6379/0')
+    assert create_app(config)[0].config['EMAIL_ASYNC'] is True
+
+    monkeypatch.setenv('EMAIL_ASYNC', 'False')
+    assert create_app(config)[0].config['EMAIL_ASYNC'] is False
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+from flask import Flask, jsonify, request
+
+from utils.circuit import CircuitBreaker
+from utils.endpoint_guard import GuardExecutor, GuardSaturated, endpoint_guard, get_guard_executor, reset_guard_executor
+
+
+@pytest.fixture
+def guarded_app():
+    reset_guard_executor()
+    release = threading.Event()
+    app = Flask(__name__)
+    app.config.update(TESTING=True, ENDPOINT_GUARD_MAX_WORKERS=1, ENDPOINT_GUARD_MAX_QUEUE=1)
+    cb = CircuitBreaker(fail_max=10, reset_timeout=30)
+
+    @app.route('/slow')
+    @endpoint_guard(cb=cb, timeout=0.05)
+    def slow():
+        release.wait(5)
+        return jsonify({'ok': True})
+
+    @app.route('/echo')
+    @endpoint_guard(timeout=5)
+    def echo():
+        return jsonify({'name': request.args.get('name')})
+
+    app.release = release
+    app.cb = cb
+    yield app
+    release.set()
+    reset_guard_executor()
+
+
+def test_handler_runs_with_request_context(guarded_app):
+    resp = guarded_app.test_client().get('/echo?name=amina')
+    assert resp.status_code == 200
+    assert resp.get_json() == {'name': 'amina'}
+
+
+def test_timed_out_handlers_are_bounded_and_excess_requests_rejected(guarded_app):
+    client = guarded_app.test_client()
+
+    # First handler occupies the only worker, the second waits in the queue
+    assert client.get('/slow').status_code == 504
+    executor = get_guard_executor()
+    assert executor.in_flight == 1
+
+    # Queued handler is cancelled on timeout, freeing its slot
+    assert client.get('/slow').status_code == 504
+    assert executor.queued == 0
+
+    # Hold the queue slot from outside the request and the next one is rejected
+    blocker = executor.submit(guarded_app.release.wait, 5)
+    resp = client.get('/slow')
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '5'
+    assert executor.in_flight == 1
+
+    guarded_app.release.set()
+    blocker.result(timeout=5)
+    assert executor.in_flight == 0 and executor.queued == 0
+    assert guarded_app.cb.failure_count == 2
+
+
+def test_open_circuit_rejects_before_submitting(guarded_app):
+    for _ in range(guarded_app.cb.fail_max):
+        guarded_app.cb.record_failure()
+    resp = guarded_app.test_client().get('/slow')
+    assert resp.status_code == 503
+    with guarded_app.app_context():
+        assert get_guard_executor().in_flight == 0
+
+
+def test_executor_rejects_beyond_workers_plus_queue():
+    executor = GuardExecutor(max_workers=1, max_queue=0, use_gevent=False)
+    gate = threading.Event()
+    try:
+        first = executor.submit(gate.wait, 5)
+        with pytest.raises(GuardSaturated):
+            executor.submit(lambda: None)
+        gate.set()
+        assert first.result(timeout=5) is True
+        # Slot is released once the handler finishes
+        assert executor.submit(lambda: 'ok').result(timeout=5) == 'ok'
+    finally:
+        gate.set()
+        executor.shutdown()
+
+
+def test_shutdown_cancels_queued_handlers():
+    executor = GuardExecutor(max_workers=1, max_queue=2, use_gevent=False)
+    release = threading.Event()
+    running = executor.submit(release.wait, 5)
+    queued = executor.submit(lambda: 'never')
+    executor.shutdown()
+    release.set()
+    assert queued.cancelled()
+    assert running.result(timeout=5) is True
+    assert executor.queued == 0
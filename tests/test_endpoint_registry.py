@@ -0,0 +1,71 @@
+from flask_login import login_required
+
+from app import create_app
+from decorators import admin_required, roles_required, supervisor_required
+from utils.endpoint_registry import EXTENSION_KEY, endpoint_meta
+
+DEV_KEY = 'your-secret-dev-key-change-this'
+
+
+def test_registry_is_compiled_at_startup(app):
+    table = app.extensions[EXTENSION_KEY]
+
+    admin = table['admin.dashboard']
+    assert admin.auth == 'roles' and admin.roles == frozenset({'admin'})
+    assert admin.csrf_exempt is False
+
+    # Exempt view and exempt blueprint
+    assert table['public_auth.api_login'].csrf_exempt is True
+    assert table['dev.list_routes'].csrf_exempt is True
+    assert table['dev.list_routes'].auth == 'dev_key'
+    assert table['blog.list_posts'].db_route == 'replica'
+
+
+def test_auth_mode_and_roles_follow_decorators():
+    app, _ = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RATELIMIT_STORAGE_URL': 'memory://',
+    })
+
+    @app.route('/_registry/stacked')
+    @login_required
+    @supervisor_required
+    @roles_required(' ADMIN ', 'Champion')
+    def registry_stacked():
+        return 'ok'
+
+    @app.route('/_registry/login')
+    @login_required
+    def registry_login():
+        return 'ok'
+
+    @app.route('/_registry/public', methods=['GET', 'POST'])
+    def registry_public():
+        return 'ok'
+
+    # Added after startup: compiled on first lookup
+    stacked = endpoint_meta(app, 'registry_stacked')
+    assert stacked.auth == 'roles'
+    assert stacked.roles == frozenset({'admin'})
+
+    assert endpoint_meta(app, 'registry_login').auth == 'login'
+    public = endpoint_meta(app, 'registry_public')
+    assert public.auth == 'public' and public.roles is None
+    assert public.methods == ('GET', 'POST')
+    assert endpoint_meta(app, 'no.such.endpoint') is None
+
+
+def test_roles_required_normalises_roles_once():
+    assert admin_required(lambda: None)._endpoint_auth[2] == frozenset({'admin'})
+    assert roles_required(' Supervisor ')(lambda: None)._endpoint_auth[1:] == ('roles', frozenset({'supervisor'}))
+
+
+def test_dev_routes_dumps_compiled_table(client):
+    rv = client.get(f'/__dev__/routes?key={DEV_KEY}')
+    assert rv.status_code == 200
+    rows = {row['endpoint']: row for row in rv.get_json()['endpoints']}
+    assert rows['admin.dashboard']['auth'] == 'roles'
+    assert rows['admin.dashboard']['roles'] == ['admin']
+    assert rows['admin.dashboard']['rules'] == ['/admin/dashboard']
+    assert rows['public_auth.api_login']['csrf_exempt'] is True
@@ -1,6 +1,10 @@
 import importlib.util
+import os
+import threading
 from pathlib import Path
 
+import pytest
+
 # Load utils/idempotency.py directly to avoid package import issues in test env
 spec = importlib.util.spec_from_file_location(
     "idempotency",
@@ -10,31 +14,21 @@ idempotency = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(idempotency)
 
 
-class FakeRedis:
-    def __init__(self):
-        self.store = {}
-
-    def setnx(self, key, val):
-        if key in self.store:
-            return False
-        self.store[key] = val
-        return True
-
-    def expire(self, key, ttl):
-        # no-op for fake
-        return True
-
-    def get(self, key):
-        return self.store.get(key)
-
-    def set(self, key, val, ex=None):
-        self.store[key] = val
-        return True
+def setup_function(fn):
+    # Fresh in-memory store for each test
+    idempotency.set_backend(idempotency.MemoryBackend())
 
 
-def setup_function(fn):
-    # Replace the real Redis client with a fresh fake for each test
-    idempotency._r = FakeRedis()
+def _redis_backend():
+    url = os.environ.get('REDIS_URL')
+    if not url:
+        return None
+    try:
+        backend = idempotency.RedisBackend(url)
+        backend._redis().ping()
+        return backend
+    except Exception:
+        return None
 
 
 def test_make_key_is_deterministic():
@@ -61,3 +55,59 @@ def test_reserve_conflict():
     assert idempotency.reserve_key(key) is True
     # second reservation should fail
     assert idempotency.reserve_key(key) is False
+
+
+def test_failed_key_can_be_reserved_again():
+    assert idempotency.reserve_key('retry') is True
+    idempotency.update_key('retry', status='failed', response={'error': 'timeout'})
+    assert idempotency.reserve_key('retry') is True
+    assert idempotency.get_key('retry')['status'] == 'pending'
+    idempotency.update_key('retry', status='success', response={'ok': True})
+    assert idempotency.reserve_key('retry') is False
+
+
+def test_update_merges_meta_and_respects_only_if():
+    idempotency.reserve_key('k', meta={'user_id': '7'})
+    assert idempotency.update_key('k', status='success', response={'id': 1}, meta={'checkout': 'c1'}) is True
+    assert idempotency.update_key('k', status='failed', only_if=('pending',)) is False
+    entry = idempotency.get_key('k')
+    assert entry['status'] == 'success'
+    assert entry['meta'] == {'user_id': '7', 'checkout': 'c1'}
+
+
+def test_get_keys_and_expiry():
+    idempotency.reserve_key('a')
+    idempotency.reserve_key('b', ttl=0)
+    assert set(idempotency.get_keys(['a', 'b', 'missing'])) == {'a'}
+    assert idempotency.get_key('b') is None
+
+
+def test_concurrent_reservations_have_one_winner():
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(idempotency.reserve_key('race'))) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.count(True) == 1
+
+
+def test_redis_backend_scripts():
+    backend = _redis_backend()
+    if backend is None:
+        pytest.skip('REDIS_URL not reachable')
+    idempotency.set_backend(backend)
+    key = f'test-{os.getpid()}-{threading.get_ident()}'
+    try:
+        assert idempotency.reserve_key(key, meta={'a': 1}, ttl=30) is True
+        assert idempotency.reserve_key(key, ttl=30) is False
+        assert backend._redis().ttl(idempotency._redis_key(key)) > 0
+        assert idempotency.update_key(key, status='failed', response=None, meta={'b': 2}, ttl=30) is True
+        assert idempotency.reserve_key(key, ttl=30) is True
+        assert idempotency.update_key(key, status='success', response={'ok': True}, ttl=30,
+                                      only_if=('pending',)) is True
+        assert idempotency.update_key(key, status='failed', ttl=30, only_if=('pending',)) is False
+        entry = idempotency.get_keys([key])[key]
+        assert entry['status'] == 'success' and entry['response'] == {'ok': True}
+    finally:
+        backend._redis().delete(idempotency._redis_key(key))
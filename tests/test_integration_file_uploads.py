@@ -10,12 +10,14 @@ from models import db, MediaGallery, InstitutionalToolkitItem
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     test_config = {
         "TESTING": True,
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
         "WTF_CSRF_ENABLED": False,
         "RATELIMIT_STORAGE_URL": "memory://",
+        # Keep uploaded test files out of the instance folder
+        "UPLOAD_FOLDER": str(tmp_path / "uploads"),
     }
     app, limiter = create_app(test_config=test_config)
 
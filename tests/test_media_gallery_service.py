@@ -5,7 +5,7 @@ import pytest
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import create_app
-from models import db, MediaGallery
+from models import db, MediaGallery, MediaItem
 from services import media_gallery_service
 
 
@@ -62,3 +62,48 @@ def test_delete_media_gallery(app):
         db.session.commit()
         media_gallery_service.delete_media_gallery(g.gallery_id)
         assert db.session.get(MediaGallery, g.gallery_id) is None
+
+
+def test_media_items_stored_as_rows_with_precomputed_src(app):
+    data = {
+        'title': 'Rows',
+        'media_items': [
+            {'type': 'file', 'path': 'uploads/media_galleries/a.jpg', 'thumbnail': '', 'filename': 'a.jpg'},
+            {'url': 'https://cdn.example.org/clip.mp4', 'caption': 'Clip'},
+        ]
+    }
+    with app.app_context():
+        g = media_gallery_service.create_media_gallery(data, creator_id=1)
+        rows = MediaItem.query.filter_by(gallery_id=g.gallery_id).order_by(MediaItem.position).all()
+        assert [r.position for r in rows] == [0, 1]
+        assert rows[0].src == '/api/media/media_galleries/a.jpg'
+        assert rows[0].type == 'photo'
+        assert rows[1].src == 'https://cdn.example.org/clip.mp4'
+        assert rows[1].type == 'video'
+        # The compatibility property returns normalised dicts in order
+        items = g.media_items
+        assert items[0]['thumbnail'] == items[0]['src']
+        assert items[1]['url'] == 'https://cdn.example.org/clip.mp4'
+        assert items[1]['caption'] == 'Clip'
+
+
+def test_thumbnail_task_updates_only_matching_item(app, monkeypatch):
+    from services import file_utils
+    from tasks import media_tasks
+
+    data = {
+        'title': 'Thumbs',
+        'media_items': [
+            {'type': 'file', 'path': 'uploads/media_galleries/a.jpg', 'filename': 'a.jpg'},
+            {'type': 'file', 'path': 'uploads/media_galleries/b.jpg', 'filename': 'b.jpg'},
+        ]
+    }
+    monkeypatch.setattr(file_utils, 'generate_thumbnail', lambda path: path + '.thumb.jpg')
+    with app.app_context():
+        g = media_gallery_service.create_media_gallery(data, creator_id=1)
+        thumb = media_tasks._generate_and_store_thumbnail(g.gallery_id, 'uploads/media_galleries/b.jpg')
+        assert thumb == 'uploads/media_galleries/b.jpg.thumb.jpg'
+        db.session.expire_all()
+        rows = MediaItem.query.filter_by(gallery_id=g.gallery_id).order_by(MediaItem.position).all()
+        assert rows[0].thumbnail is None
+        assert rows[1].thumbnail == thumb
@@ -0,0 +1,215 @@
+import json
+
+import pytest
+import requests
+from flask import g
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+import blueprints.mpesa as mpesa_mod
+import tasks.mpesa_tasks as mpesa_tasks
+import utils.idempotency as idemp_mod
+from models import Payment, User, db
+from utils.circuit import CircuitOpenError
+
+
+class FakeResp:
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self._data
+
+
+ACCEPTED = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1', 'MerchantRequestID': 'm1', 'ResponseDescription': 'Success'}
+HEADERS = {'Content-Type': 'application/json', 'Idempotency-Key': 'idem-async-1'}
+PAYLOAD = json.dumps({'phoneNumber': '254712345678', 'amount': 100})
+
+
+@pytest.fixture
+def async_checkout(app, client, monkeypatch):
+    monkeypatch.setenv('MPESA_CALLBACK_TOKEN', 'async-callback-token')
+    monkeypatch.setitem(app.config, 'MPESA_ASYNC_CHECKOUT', True)
+    monkeypatch.setattr(idemp_mod, '_backend', idemp_mod.MemoryBackend())
+    for name, value in (('CONSUMER_KEY', 'key'), ('CONSUMER_SECRET', 'secret'), ('SHORTCODE', '174379'), ('PASSKEY', 'pass')):
+        monkeypatch.setattr(mpesa_mod, name, value)
+    monkeypatch.setattr(mpesa_mod, 'get_access_token', lambda: 'token')
+    pushes = []
+    monkeypatch.setattr(mpesa_mod, 'request_with_timeout', lambda *a, **kw: pushes.append(kw['json']) or FakeResp(ACCEPTED))
+    queued = []
+    monkeypatch.setattr(mpesa_tasks, 'enqueue_stk_push', lambda *args: queued.append(args))
+
+    user = User(username='async_payer', password_hash='x', role='Prevention Advocate')
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.user_id)
+    return queued, pushes
+
+
+def test_checkout_queues_push_and_returns_status_url(app, client, async_checkout):
+    queued, pushes = async_checkout
+
+    resp = client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS)
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert body['status'] == 'pending' and body['success'] is True
+    assert resp.headers['Location'] == body['statusUrl'] == '/api/mpesa/checkout/status/idem-async-1'
+    assert len(queued) == 1 and pushes == []
+
+    status = client.get(body['statusUrl'])
+    assert status.get_json()['status'] == 'pending'
+    assert status.headers['Retry-After'] == '2'
+
+    # A repeat click while queued does not enqueue again
+    assert client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS).status_code == 202
+    assert len(queued) == 1
+
+    # Worker sends the push; a redelivered task does not prompt twice
+    with app.app_context():
+        assert mpesa_tasks._process_stk_push(*queued[0]) == ACCEPTED
+        mpesa_tasks._process_stk_push(*queued[0])
+    assert len(pushes) == 1
+    assert client.get(body['statusUrl']).get_json()['checkoutRequestId'] == 'ws_CO_1'
+    payment = db.session.get(Payment, 'ws_CO_1')
+    assert payment.status == 'pending' and payment.amount == 100 and payment.idempotency_key == 'idem-async-1'
+
+    callback = {'Body': {'stkCallback': {
+        'ResultCode': 0, 'ResultDesc': 'Processed', 'MerchantRequestID': 'm1', 'CheckoutRequestID': 'ws_CO_1',
+        'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': 'NLJ7RT61SV'}, {'Name': 'Amount', 'Value': 100}]},
+    }}}
+    assert client.post('/api/mpesa/callback/async-callback-token', json=callback).status_code == 200
+
+    final = client.get(body['statusUrl'])
+    data = final.get_json()
+    assert data['status'] == 'success' and data['paymentStatus'] == 'paid'
+    assert data['receipt'] == 'NLJ7RT61SV'
+    assert 'Retry-After' not in final.headers
+
+
+def test_status_poll_settles_a_stale_payment_whose_callback_was_lost(app, client, async_checkout, monkeypatch):
+    from datetime import datetime, timedelta
+
+    queued, _ = async_checkout
+    queries = []
+    monkeypatch.setattr(mpesa_mod, 'query_stk_push', lambda checkout_id: queries.append(checkout_id) or {
+        'ResponseCode': '0', 'ResultCode': '0', 'ResultDesc': 'The service request is processed successfully.'})
+    client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS)
+    with app.app_context():
+        mpesa_tasks._process_stk_push(*queued[0])
+
+    assert client.get('/api/mpesa/checkout/status/idem-async-1').get_json()['paymentStatus'] is None
+    assert queries == []
+
+    payment = db.session.get(Payment, 'ws_CO_1')
+    payment.created_at = datetime.utcnow() - timedelta(minutes=5)
+    db.session.commit()
+    data = client.get('/api/mpesa/checkout/status/idem-async-1').get_json()
+    assert queries == ['ws_CO_1']
+    assert data['paymentStatus'] == 'paid' and data['success'] is True
+
+
+def test_status_is_private_to_the_payer(app, client, async_checkout):
+    client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS)
+
+    other = User(username='async_other', password_hash='x', role='Prevention Advocate')
+    db.session.add(other)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(other.user_id)
+    # Requests share the test's app context, so drop Flask-Login's cached user
+    g.pop('_login_user', None)
+    assert client.get('/api/mpesa/checkout/status/idem-async-1').status_code == 404
+
+
+def test_transient_failures_retry_then_mark_failed(app, client, async_checkout, monkeypatch):
+    import requests
+
+    queued, _ = async_checkout
+    client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS)
+
+    def timeout(*args, **kwargs):
+        raise requests.exceptions.ConnectTimeout('slow')
+    monkeypatch.setattr(mpesa_mod, 'request_with_timeout', timeout)
+
+    with app.app_context():
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            mpesa_tasks._process_stk_push(*queued[0], retries_left=1)
+        assert idemp_mod.get_key('idem-async-1')['status'] == 'pending'
+
+        assert mpesa_tasks._process_stk_push(*queued[0], retries_left=0) is None
+        assert idemp_mod.get_key('idem-async-1')['status'] == 'failed'
+
+
+def _http_error(status):
+    import requests
+
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f'{status}', response=response)
+
+
+@pytest.mark.parametrize('exc, kind', [
+    (CircuitOpenError('mpesa'), 'retry'),
+    (requests.exceptions.ConnectTimeout('slow connect'), 'retry'),
+    (requests.exceptions.ConnectionError(MaxRetryError(None, '/', NewConnectionError(None, 'refused'))), 'retry'),
+    (_http_error(429), 'retry'),
+    (requests.exceptions.ReadTimeout('slow reply'), 'unknown'),
+    (requests.exceptions.ConnectionError('Connection aborted'), 'unknown'),
+    (_http_error(503), 'unknown'),
+    (_http_error(400), 'failed'),
+    (ValueError('not configured'), 'failed'),
+])
+def test_only_pushes_that_never_reached_daraja_are_retried(exc, kind):
+    assert mpesa_tasks.classify_push_failure(exc) == kind
+
+
+def test_ambiguous_failure_is_never_pushed_again(app, client, async_checkout, monkeypatch):
+    queued, _ = async_checkout
+    client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS)
+
+    attempts = []
+
+    def read_timeout(*args, **kwargs):
+        attempts.append(1)
+        raise requests.exceptions.ReadTimeout('no reply')
+    monkeypatch.setattr(mpesa_mod, 'request_with_timeout', read_timeout)
+
+    with app.app_context():
+        # Not raised for a retry even with retries left
+        assert mpesa_tasks._process_stk_push(*queued[0], retries_left=3) is None
+        assert idemp_mod.get_key('idem-async-1')['status'] == 'unknown'
+        mpesa_tasks._process_stk_push(*queued[0], retries_left=3)
+    assert len(attempts) == 1
+
+    resp = client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS)
+    assert resp.status_code == 502 and resp.get_json()['status'] == 'unknown'
+    assert len(queued) == 1
+    status = client.get('/api/mpesa/checkout/status/idem-async-1').get_json()
+    assert status['status'] == 'unknown' and status['success'] is False
+
+
+def test_enqueue_failure_releases_the_key(app, client, async_checkout, monkeypatch):
+    def broker_down(*args):
+        raise ConnectionError('broker down')
+    monkeypatch.setattr(mpesa_tasks, 'enqueue_stk_push', broker_down)
+
+    resp = client.post('/api/mpesa/checkout', data=PAYLOAD, headers=HEADERS)
+    assert resp.status_code == 503
+    assert idemp_mod.get_key('idem-async-1')['status'] == 'failed'
+
+
+def test_async_checkout_refuses_to_start_without_shared_idempotency(monkeypatch):
+    from app import create_app
+
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'SECRET_KEY': 'test-secret-key',
+              'MPESA_ASYNC_CHECKOUT': True}
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    monkeypatch.delenv('IDEMPOTENCY_BACKEND', raising=False)
+    with pytest.raises(RuntimeError, match='idempotency'):
+        create_app(config)
+
+    monkeypatch.setenv('IDEMPOTENCY_BACKEND', 'redis')
+    assert create_app(config)[0].config['MPESA_ASYNC_CHECKOUT'] is True
@@ -18,27 +18,6 @@ db = models.db
 User = models.User
 
 
-class FakeRedis:
-    def __init__(self):
-        self.store = {}
-
-    def setnx(self, key, val):
-        if key in self.store:
-            return False
-        self.store[key] = val
-        return True
-
-    def expire(self, key, ttl):
-        return True
-
-    def get(self, key):
-        return self.store.get(key)
-
-    def set(self, key, val, ex=None):
-        self.store[key] = val
-        return True
-
-
 def make_fake_resp(data):
     class FakeResp:
         def __init__(self, d):
@@ -73,9 +52,9 @@ def test_mpesa_stk_idempotency_flow():
     # Import mpesa module after app creation so its imports are available
     from blueprints import mpesa as mpesa_mod
 
-    # Replace idempotency redis client with fake
+    # Keep idempotency keys in memory
     import utils.idempotency as idemp_mod
-    idemp_mod._r = FakeRedis()
+    idemp_mod.set_backend(idemp_mod.MemoryBackend())
 
     # Patch external calls to M-Pesa to return success
     # Ensure M-Pesa module looks configured (bypass environment requirements)
@@ -0,0 +1,211 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import blueprints.mpesa as mpesa_mod
+import services.payment_service as payment_service
+from models import Payment, User, db
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, val, ex=None):
+        self.store[key] = val
+        return True
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+    def exists(self, key):
+        return int(key in self.store)
+
+
+def _callback(checkout_id, result_code=0, receipt='NLJ7RT61SV'):
+    callback = {
+        'ResultCode': result_code, 'ResultDesc': 'Processed', 'MerchantRequestID': 'm1',
+        'CheckoutRequestID': checkout_id,
+    }
+    if result_code == 0:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': 100},
+            {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+            {'Name': 'TransactionDate', 'Value': 20261019120000},
+            {'Name': 'PhoneNumber', 'Value': 254712345678},
+        ]}
+    return {'Body': {'stkCallback': callback}}
+
+
+CALLBACK_URL = '/api/mpesa/callback/callback-secret-token'
+
+
+@pytest.fixture(autouse=True)
+def callback_token(monkeypatch):
+    monkeypatch.setenv('MPESA_CALLBACK_TOKEN', 'callback-secret-token')
+
+
+@pytest.fixture(autouse=True)
+def no_cached_misses(monkeypatch):
+    monkeypatch.setattr(payment_service, '_misses', {})
+
+
+@pytest.fixture
+def status_cache(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setenv('REDIS_URL', 'redis://fake')
+    monkeypatch.setattr(payment_service._redis, 'client', redis)
+    monkeypatch.setattr(payment_service._redis, 'down_until', 0)
+    return redis
+
+
+def test_duplicate_callbacks_settle_once(app, client):
+    with app.app_context():
+        payment_service.record_checkout('ws_CO_dup', 'm1', idempotency_key='k1', amount=100)
+
+    for _ in range(3):
+        resp = client.post(CALLBACK_URL, json=_callback('ws_CO_dup'))
+        assert resp.status_code == 200 and resp.get_json()['ResultCode'] == 0
+    # A late failure report for the same push doesn't overwrite the receipt
+    client.post(CALLBACK_URL, json=_callback('ws_CO_dup', result_code=1))
+
+    payment = db.session.get(Payment, 'ws_CO_dup', populate_existing=True)
+    assert payment.status == 'paid' and payment.mpesa_receipt == 'NLJ7RT61SV'
+    assert payment.idempotency_key == 'k1' and payment.result_code == 0
+    assert payment.transaction_date == datetime(2026, 10, 19, 12, 0, 0)
+    assert db.session.query(Payment).filter_by(checkout_request_id='ws_CO_dup').count() == 1
+
+
+def test_apply_callback_reports_duplicates(app):
+    with app.app_context():
+        payment_service.record_checkout('ws_CO_outcome')
+        assert payment_service.apply_callback(_callback('ws_CO_outcome', result_code=1032)) == 'applied'
+        assert payment_service.apply_callback(_callback('ws_CO_outcome', result_code=1032)) == 'duplicate'
+        assert db.session.get(Payment, 'ws_CO_outcome', populate_existing=True).status == 'cancelled'
+
+
+def test_callback_for_unknown_checkout_creates_no_row(app):
+    with app.app_context():
+        assert payment_service.apply_callback(_callback('ws_CO_unknown')) == 'unknown'
+        assert db.session.get(Payment, 'ws_CO_unknown') is None
+
+
+def test_forged_callback_is_rejected(app, client):
+    with app.app_context():
+        payment_service.record_checkout('ws_CO_forged', 'm1', amount=100)
+
+    # The payer knows their CheckoutRequestID but not the callback token
+    assert client.post('/api/mpesa/callback/guessed-token', json=_callback('ws_CO_forged')).status_code == 403
+    assert client.post('/api/mpesa/callback', json=_callback('ws_CO_forged')).status_code == 404
+
+    payment = db.session.get(Payment, 'ws_CO_forged', populate_existing=True)
+    assert payment.status == 'pending' and payment.mpesa_receipt is None
+
+    assert client.post(CALLBACK_URL, json=_callback('ws_CO_forged')).status_code == 200
+    assert db.session.get(Payment, 'ws_CO_forged', populate_existing=True).status == 'paid'
+
+
+def test_callback_url_carries_the_token(app, monkeypatch):
+    monkeypatch.setenv('BACKEND_URL', 'https://api.example.org')
+    with app.app_context():
+        assert mpesa_mod.callback_url() == 'https://api.example.org' + CALLBACK_URL
+        monkeypatch.delenv('MPESA_CALLBACK_TOKEN')
+        derived = mpesa_mod.callback_token()
+        assert len(derived) == 32 and derived != app.config['SECRET_KEY']
+
+
+def test_invalid_callback_is_rejected(client):
+    resp = client.post(CALLBACK_URL, json={'Body': {}})
+    assert resp.status_code == 500 and resp.get_json()['ResultCode'] == 1
+
+
+def test_status_served_from_cache_without_querying_daraja(app, status_cache):
+    def query(checkout_request_id):
+        raise AssertionError('Daraja should not be queried')
+
+    with app.app_context():
+        payment_service.record_checkout('ws_CO_hot', amount=50)
+        payment, source = payment_service.get_payment_status('ws_CO_hot', query=query, stale_after=60)
+        assert (payment['status'], source) == ('pending', 'ledger')
+        payment, source = payment_service.get_payment_status('ws_CO_hot', query=query, stale_after=60)
+        assert (payment['status'], source) == ('pending', 'cache')
+
+        # The callback clears the cached copy
+        payment_service.apply_callback(_callback('ws_CO_hot'))
+        assert payment_service.CACHE_PREFIX + 'ws_CO_hot' not in status_cache.store
+        payment, source = payment_service.get_payment_status('ws_CO_hot', query=query, stale_after=60)
+        assert (payment['status'], source) == ('paid', 'ledger')
+        assert json.loads(status_cache.store[payment_service.CACHE_PREFIX + 'ws_CO_hot'])['status'] == 'paid'
+
+
+def test_stale_pending_payment_falls_back_to_stkpushquery(app):
+    calls = []
+
+    def query(checkout_request_id):
+        calls.append(checkout_request_id)
+        return {'ResponseCode': '0', 'ResultCode': '1', 'ResultDesc': 'Insufficient balance'}
+
+    with app.app_context():
+        payment_service.record_checkout('ws_CO_stale')
+        payment, source = payment_service.get_payment_status('ws_CO_stale', query=query, stale_after=60)
+        assert source == 'ledger' and calls == []
+
+        row = db.session.get(Payment, 'ws_CO_stale')
+        row.created_at = datetime.utcnow() - timedelta(minutes=5)
+        db.session.commit()
+
+        payment, source = payment_service.get_payment_status('ws_CO_stale', query=query, stale_after=60)
+        assert calls == ['ws_CO_stale']
+        assert (payment['status'], source) == ('failed', 'daraja')
+        assert payment['result_desc'] == 'Insufficient balance'
+
+
+def test_query_endpoint_uses_ledger_and_404s_unknown_ids(app, client, monkeypatch):
+    queried = []
+
+    def query(checkout_request_id):
+        queried.append(checkout_request_id)
+        return {'ResponseCode': '0', 'ResultDesc': 'The transaction is being processed'}
+    monkeypatch.setattr(mpesa_mod, 'query_stk_push', query)
+
+    supervisor = User(username='payments_supervisor', password_hash='x', role='Supervisor')
+    db.session.add(supervisor)
+    db.session.commit()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(supervisor.user_id)
+
+    payment_service.record_checkout('ws_CO_query', amount=10)
+    resp = client.get('/api/mpesa/query/ws_CO_query')
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['source'] == 'ledger' and body['data']['status'] == 'pending'
+    assert queried == []
+
+    # Unknown to the ledger: asks Daraja, which has no result yet
+    assert client.get('/api/mpesa/query/ws_CO_missing').status_code == 404
+    assert queried == ['ws_CO_missing']
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_unknown_checkout_is_not_queried_again_until_stale(app, request, shared):
+    store = request.getfixturevalue('status_cache') if shared else None
+    calls = []
+
+    def query(checkout_request_id):
+        calls.append(checkout_request_id)
+        return {'ResponseCode': '0', 'ResultDesc': 'The transaction is being processed'}
+
+    with app.app_context():
+        assert payment_service.get_payment_status('ws_CO_lost', query=query, stale_after=60) == (None, None)
+        assert payment_service.get_payment_status('ws_CO_lost', query=query, stale_after=60) == (None, None)
+        assert calls == ['ws_CO_lost']
+        if shared:
+            assert payment_service.MISS_PREFIX + 'ws_CO_lost' in store.store
+        else:
+            payment_service._misses['ws_CO_lost'] = 0
+            payment_service.get_payment_status('ws_CO_lost', query=query, stale_after=60)
+            assert calls == ['ws_CO_lost', 'ws_CO_lost']
@@ -0,0 +1,116 @@
+"""Per-endpoint SQL statement budgets for serialized list endpoints.
+
+Each test seeds several rows with related records so an N+1 pattern would
+exceed the budget declared in `utils/query_options.py`.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import (
+    db, User, Champion, BlogPost, Event, EventParticipation, MediaGallery, Podcast
+)
+
+ROWS = 5
+
+
+def _user(username, role='Admin'):
+    u = User(username=username, role=role)
+    u.set_password('secret')
+    db.session.add(u)
+    db.session.flush()
+    return u
+
+
+def _login(client, user):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.user_id)
+
+
+def _events(n=ROWS):
+    events = []
+    for i in range(n):
+        ev = Event(title=f'Event {i}', event_date=datetime(2026, 1, 1) + timedelta(days=i), event_type='Debate', status='Upcoming')
+        db.session.add(ev)
+        events.append(ev)
+    db.session.flush()
+    return events
+
+
+@pytest.fixture
+def seeded_galleries():
+    events = _events()
+    for i, ev in enumerate(events):
+        g = MediaGallery(
+            title=f'Gallery {i}', published=True, event_id=ev.event_id, category='Campus',
+            media_items=[{'url': f'https://cdn.example.org/{i}_{j}.jpg'} for j in range(3)],
+        )
+        db.session.add(g)
+    db.session.commit()
+    return events
+
+
+@pytest.mark.parametrize('url', [
+    '/api/media-galleries',
+    '/api/workstreams/gallery',
+    '/api/workstreams/gallery/categories',
+])
+def test_gallery_lists_within_budget(client, assert_query_budget, seeded_galleries, url):
+    rv = assert_query_budget(client, url)
+    assert rv.status_code == 200
+
+
+def test_event_galleries_within_budget(client, assert_query_budget, seeded_galleries):
+    rv = assert_query_budget(client, f'/api/workstreams/events/{seeded_galleries[0].event_id}/galleries')
+    assert rv.status_code == 200
+
+
+@pytest.mark.parametrize('url', ['/api/blog/', '/api/workstreams/stories'])
+def test_blog_lists_within_budget(client, assert_query_budget, url):
+    for i in range(ROWS):
+        author = _user(f'author{i}')
+        db.session.add(BlogPost(
+            title=f'Post {i}', slug=f'post-{i}', content='Body', author_id=author.user_id,
+            published=True, published_at=datetime(2026, 1, 1) + timedelta(days=i),
+        ))
+    db.session.commit()
+
+    rv = assert_query_budget(client, url)
+    assert rv.status_code == 200
+
+
+def _participations():
+    champion = Champion(full_name='Budget Champ', gender='F', phone_number='0700000999', assigned_champion_code='UMV-2026-999999')
+    db.session.add(champion)
+    db.session.flush()
+    for ev in _events():
+        db.session.add(EventParticipation(event_id=ev.event_id, champion_id=champion.champion_id))
+    db.session.commit()
+    return champion
+
+
+def test_participation_lists_within_budget(client, assert_query_budget):
+    champion = _participations()
+    admin = _user('budget_admin')
+    db.session.commit()
+    _login(client, admin)
+
+    rv = assert_query_budget(client, '/api/event-participation/')
+    assert rv.status_code == 200
+    assert rv.get_json()['total'] == ROWS
+
+    rv = assert_query_budget(client, f'/api/event-participation/champion/{champion.champion_id}/history')
+    assert rv.status_code == 200
+    assert rv.get_json()['total_events'] == ROWS
+
+
+@pytest.mark.parametrize('url', ['/admin/workstreams/events', '/admin/podcasts', '/admin/media-galleries'])
+def test_admin_lists_within_budget(client, assert_query_budget, seeded_galleries, url):
+    admin = _user('budget_admin')
+    for i in range(ROWS):
+        db.session.add(Podcast(title=f'Episode {i}', audio_url=f'https://cdn.example.org/{i}.mp3', created_by=admin.user_id, published=True))
+    db.session.commit()
+    _login(client, admin)
+
+    rv = assert_query_budget(client, url)
+    assert rv.status_code == 200
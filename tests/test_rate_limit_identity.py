@@ -0,0 +1,71 @@
+import datetime
+
+import jwt
+import pytest
+from flask import jsonify
+
+from app import create_app
+from extensions import limiter
+from models import db
+
+SECRET = 'rate-limit-test-secret-0123456789abcdef'
+
+
+@limiter.limit('2 per minute')
+def limited_view():
+    return jsonify({'ok': True})
+
+
+@pytest.fixture
+def limited_app(monkeypatch):
+    monkeypatch.setenv('SECRET_KEY', SECRET)
+    app, _ = create_app({
+        'TESTING': True,
+        'SECRET_KEY': SECRET,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RATELIMIT_ENABLED': True,
+        'RATELIMIT_STORAGE_URL': 'memory://',
+        'WTF_CSRF_ENABLED': False,
+    })
+    app.add_url_rule('/api/_test/limited', 'limited_view', limited_view)
+    with app.app_context():
+        db.create_all()
+    yield app
+    # The limiter is shared by every app built in this process
+    limiter.reset()
+
+
+def _bearer(sub, secret=SECRET):
+    exp = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5)
+    token = jwt.encode({'sub': sub, 'exp': exp}, secret, algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def _statuses(client, n, **kwargs):
+    return [client.get('/api/_test/limited', **kwargs).status_code for _ in range(n)]
+
+
+def test_limits_are_per_identity(limited_app):
+    client = limited_app.test_client()
+    assert _statuses(client, 3) == [200, 200, 429]
+    # Same address, but each verified token gets its own bucket
+    assert _statuses(client, 3, headers=_bearer('7')) == [200, 200, 429]
+    assert _statuses(client, 1, headers=_bearer('8')) == [200]
+    # Another client address is not affected by the first one's limit
+    assert _statuses(client, 1, environ_base={'REMOTE_ADDR': '10.0.0.9'}) == [200]
+
+
+def test_forged_token_falls_back_to_client_ip(limited_app):
+    client = limited_app.test_client()
+    assert _statuses(client, 2, headers=_bearer('1', secret='not-the-signing-key-0123456789abcdef')) == [200, 200]
+    assert _statuses(client, 1, headers=_bearer('2', secret='not-the-signing-key-0123456789abcdef')) == [429]
+
+
+def test_login_is_rate_limited_with_retry_after(limited_app):
+    client = limited_app.test_client()
+    statuses = [client.post('/api/auth/login', json={'username': 'nobody', 'password': 'x'}).status_code
+                for _ in range(11)]
+    assert statuses[:10] == [401] * 10
+    assert statuses[10] == 429
+    resp = client.post('/api/auth/login', json={'username': 'nobody', 'password': 'x'})
+    assert resp.status_code == 429 and int(resp.headers['Retry-After']) > 0
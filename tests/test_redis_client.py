@@ -0,0 +1,30 @@
+import time
+
+from utils.redis_client import LazyRedis
+
+
+def test_no_url_means_no_client(monkeypatch):
+    monkeypatch.delenv('REDIS_URL', raising=False)
+    assert LazyRedis('Test cache').get() is None
+    assert LazyRedis('Test cache', url='').get() is None
+
+
+def test_url_is_read_from_the_environment_at_call_time(monkeypatch):
+    cache = LazyRedis('Test cache')
+    monkeypatch.setenv('REDIS_URL', 'redis://example:6379/0')
+    client = cache.get()
+    assert client is not None
+    assert cache.get() is client
+    assert client.connection_pool.connection_kwargs['socket_timeout'] == 0.5
+
+
+def test_mark_down_skips_redis_until_retry_after():
+    cache = LazyRedis('Test cache', url='redis://example:6379/0', retry_after=30)
+    cache.client = object()
+    try:
+        raise ConnectionError('redis down')
+    except ConnectionError:
+        cache.mark_down()
+    assert cache.get() is None
+    cache.down_until = time.monotonic() - 1
+    assert cache.get() is cache.client
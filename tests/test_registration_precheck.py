@@ -0,0 +1,56 @@
+from models import db, Champion, MemberRegistration, User
+from services.registration_service import find_registration_conflict, next_available_username
+
+
+def _registration(username, phone, email=None, status='Pending'):
+    reg = MemberRegistration(full_name='Pre Check', username=username, phone_number=phone, email=email)
+    reg.set_password('secret')
+    reg.status = status
+    db.session.add(reg)
+    db.session.flush()
+    return reg
+
+
+def test_next_available_username_fills_lowest_gap():
+    assert next_available_username('zelda') == 'zelda'
+
+    user = User(username='zelda', role=User.ROLE_PREVENTION_ADVOCATE)
+    user.set_password('secret')
+    db.session.add(user)
+    _registration('zelda2', '+254700000201')
+    _registration('zelda4', '+254700000202')
+    # Neither a different name sharing the prefix nor a zero-padded suffix takes a slot
+    _registration('zeldath', '+254700000203')
+    _registration('zelda03', '+254700000204')
+
+    assert next_available_username('zelda') == 'zelda3'
+
+
+def test_next_available_username_escapes_like_wildcards():
+    _registration('ab_x', '+254700000211')
+    assert next_available_username('a_') == 'a_'
+
+
+def test_conflict_precedence_and_messages():
+    user = User(username='taken', role=User.ROLE_PREVENTION_ADVOCATE)
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.add(Champion(full_name='Existing', gender='F', phone_number='+254700000221',
+                            email='champ@example.com', assigned_champion_code='UMV-2026-333301'))
+    reg = _registration('inflight', '+254700000222', email='reg@example.com', status='Under_Review')
+
+    assert find_registration_conflict('taken', '+254700000221', 'champ@example.com')['field'] == 'username'
+    assert find_registration_conflict('fresh', '+254700000221', 'champ@example.com')['field'] == 'email'
+    assert find_registration_conflict('fresh', '+254700000221')['field'] == 'phone_number'
+
+    conflict = find_registration_conflict('fresh', '+254700000999', 'reg@example.com')
+    assert conflict == {
+        'field': 'registration',
+        'message': f'Existing registration (id={reg.registration_id}) with status "Under_Review" is already in progress',
+    }
+    assert find_registration_conflict('fresh', '+254700000999', 'new@example.com') is None
+
+
+def test_rejected_registration_does_not_conflict():
+    _registration('retry', '+254700000231', email='retry@example.com', status='Rejected')
+    assert find_registration_conflict('retry', '+254700000231', 'retry@example.com') is None
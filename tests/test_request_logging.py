@@ -0,0 +1,69 @@
+import json
+import logging
+
+import pytest
+
+from app import create_app
+from utils.request_logging import StructuredMessage
+
+
+def _app(sample_rate):
+    app, _ = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RATELIMIT_STORAGE_URL': 'memory://',
+        'REQUEST_LOG_SAMPLE_RATE': sample_rate,
+    })
+
+    @app.route('/_log/ok')
+    def log_ok():
+        return 'ok'
+
+    @app.route('/api/_log/denied')
+    def log_denied():
+        return 'no', 401
+
+    return app
+
+
+def _records(caplog):
+    return [r for r in caplog.records if r.name == 'unda.request']
+
+
+def test_sampled_requests_are_logged_with_structured_fields(caplog):
+    client = _app(1.0).test_client()
+    with caplog.at_level(logging.INFO, logger='unda.request'):
+        client.get('/_log/ok')
+
+    [record] = _records(caplog)
+    assert record.levelno == logging.INFO
+    assert isinstance(record.args[0], StructuredMessage)
+    fields = json.loads(record.getMessage())
+    assert fields == record.request_fields
+    assert fields['path'] == '/_log/ok' and fields['status'] == 200
+    assert fields['authenticated'] is False
+
+
+@pytest.mark.parametrize('path, expected', [('/_log/ok', 0), ('/api/_log/denied', 1)])
+def test_unsampled_requests_log_only_errors(caplog, path, expected):
+    client = _app(0.0).test_client()
+    with caplog.at_level(logging.INFO, logger='unda.request'):
+        client.get(path)
+
+    records = _records(caplog)
+    assert len(records) == expected
+    assert all(r.levelno == logging.WARNING for r in records)
+
+
+def test_nothing_is_collected_when_level_is_disabled(caplog, monkeypatch):
+    import utils.request_logging as request_logging
+
+    client = _app(1.0).test_client()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('fields collected for a disabled level')
+
+    monkeypatch.setattr(request_logging, '_request_fields', fail)
+    with caplog.at_level(logging.ERROR, logger='unda.request'):
+        assert client.get('/_log/ok').status_code == 200
+    assert _records(caplog) == []
@@ -0,0 +1,74 @@
+import logging
+
+from flask import g
+from prometheus_client import REGISTRY
+
+from models import db, BlogPost, User
+from utils.sql_instrumentation import normalize_sql
+
+
+def _sample(name, endpoint):
+    return REGISTRY.get_sample_value(name, {'endpoint': endpoint}) or 0
+
+
+def test_normalize_sql_folds_literals_and_in_lists():
+    a = normalize_sql("SELECT * FROM users\n  WHERE user_id IN (?, ?, ?) AND username = 'bob' LIMIT 10")
+    b = normalize_sql("SELECT * FROM users WHERE user_id IN (?) AND username = 'alice' LIMIT 5")
+    assert a == b == 'SELECT * FROM users WHERE user_id IN (...) AND username = ? LIMIT ?'
+
+
+def test_request_exports_db_metrics_and_server_timing(client):
+    author = User(username='timing_author', role='Admin')
+    author.set_password('secret')
+    db.session.add(author)
+    db.session.flush()
+    db.session.add(BlogPost(title='Timed', slug='timed', content='Body', author_id=author.user_id, published=True))
+    db.session.commit()
+
+    before_count = _sample('unda_db_queries_per_request_count', 'blog.list_posts')
+    before_sum = _sample('unda_db_queries_per_request_sum', 'blog.list_posts')
+    rv = client.get('/api/blog/')
+    assert rv.status_code == 200
+
+    assert _sample('unda_db_queries_per_request_count', 'blog.list_posts') == before_count + 1
+    assert _sample('unda_db_queries_per_request_sum', 'blog.list_posts') >= before_sum + 1
+    assert REGISTRY.get_sample_value(
+        'unda_endpoint_response_seconds_count', {'endpoint': 'blog.list_posts', 'method': 'GET'}
+    ) >= 1
+
+    header = rv.headers.get('Server-Timing')
+    assert header and header.startswith('db;dur=')
+    assert 'queries' in header and 'app;dur=' in header
+
+
+def test_slow_statements_are_logged_with_call_site(app, caplog):
+    with app.test_request_context('/api/blog/'):
+        g._sql_stats = {'count': 0, 'time': 0.0, 'slowest': 0.0, 'slow_ms': 0, 'sample_rate': 1.0}
+        with caplog.at_level(logging.WARNING, logger='sql.slow'):
+            db.session.execute(db.text("SELECT 1 WHERE 'x' = 'x'"))
+        stats = g._sql_stats
+
+    assert stats['count'] >= 1
+    assert stats['slowest'] > 0
+    messages = [r.getMessage() for r in caplog.records if r.name == 'sql.slow']
+    message = next(m for m in messages if 'sql=SELECT ? WHERE ? = ?' in m)
+    assert 'call_site=tests/test_sql_instrumentation.py' in message
+
+
+def test_slow_query_log_respects_sample_rate(app, caplog):
+    with app.test_request_context('/api/blog/'):
+        g._sql_stats = {'count': 0, 'time': 0.0, 'slowest': 0.0, 'slow_ms': 0, 'sample_rate': 0.0}
+        with caplog.at_level(logging.WARNING, logger='sql.slow'):
+            db.session.execute(db.text('SELECT 1'))
+
+    assert not [r for r in caplog.records if r.name == 'sql.slow']
+
+
+def test_failed_statement_does_not_leak_its_start_time(app):
+    with app.app_context():
+        conn = db.session.connection()
+        try:
+            db.session.execute(db.text('SELECT * FROM no_such_table'))
+        except Exception:
+            pass
+        assert not conn.info.get('_sql_start_times')
@@ -0,0 +1,93 @@
+"""Startup budget: importing the app module and running `create_app()`.
+
+Runs in a fresh interpreter under `python -X importtime` so earlier tests'
+imports don't hide regressions. Fails when import plus `create_app()` takes
+longer than STARTUP_BUDGET_MS (default 3000; raise it for slow CI runners or
+coverage runs) and lists the slowest imports. Also checks that importing
+`app` builds no application and that optional integrations stay unloaded.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 3000))
+
+# Only needed when their integration is configured or used
+OPTIONAL_MODULES = ('sentry_sdk', 'PIL', 'boto3', 'botocore', 'cloudinary', 'celery', 'alembic')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+built_at_import = 'app' in vars(app_module) or app_module._app_instance is not None
+app_module.create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+created = time.perf_counter()
+print('STARTUP ' + json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_ms': (created - imported) * 1000,
+    'built_at_import': built_at_import,
+    'modules': sorted({name.split('.')[0] for name in sys.modules}),
+}))
+"""
+
+
+def _slowest_imports(importtime_output, n=10):
+    """Imports made by the app module or by create_app(), slowest first."""
+    rows, children = [], []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = (int(cumulative), name.strip())
+        # Children are printed before their parent; expand `app` into its
+        # direct imports and keep every other top-level import whole
+        if depth == 1:
+            children.append(entry)
+        elif depth == 0:
+            if entry[1] == 'app':
+                rows.extend(children)
+            elif entry[1] != 'site':
+                rows.append(entry)
+            children = []
+    return sorted(rows, reverse=True)[:n]
+
+
+@pytest.fixture(scope='module')
+def startup():
+    env = dict(os.environ)
+    for name in ('SENTRY_DSN', 'CLOUDINARY_CLOUD_NAME', 'S3_BUCKET', 'APP_PROCESS_TYPE'):
+        env.pop(name, None)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    line = next((line for line in proc.stdout.splitlines() if line.startswith('STARTUP ')), None)
+    assert proc.returncode == 0 and line, proc.stderr[-2000:]
+    result = json.loads(line[len('STARTUP '):])
+    result['slowest'] = _slowest_imports(proc.stderr)
+    return result
+
+
+def test_importing_app_builds_no_application(startup):
+    assert startup['built_at_import'] is False
+
+
+def test_optional_integrations_are_not_imported(startup):
+    loaded = set(OPTIONAL_MODULES) & set(startup['modules'])
+    assert not loaded, f'imported at startup without being configured: {sorted(loaded)}'
+
+
+def test_create_app_within_startup_budget(startup):
+    total = startup['import_ms'] + startup['create_ms']
+    slowest = '\n'.join(f'  {us / 1000:8.1f} ms  {name}' for us, name in startup['slowest'])
+    assert total <= BUDGET_MS, (
+        f"startup took {total:.0f} ms (import {startup['import_ms']:.0f} ms, "
+        f"create_app {startup['create_ms']:.0f} ms), budget {BUDGET_MS:.0f} ms "
+        f"(STARTUP_BUDGET_MS). Slowest imports:\n{slowest}"
+    )
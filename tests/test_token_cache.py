@@ -0,0 +1,192 @@
+import threading
+import time
+
+import pytest
+
+from utils.circuit import CircuitBreaker
+from utils.token_cache import TokenCache
+
+# Captured at import: test_mpesa_smoke replaces the module attribute
+from blueprints.mpesa import get_access_token as real_get_access_token
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError('redis down')
+
+    def get(self, key):
+        self._check()
+        return self.store.get(key)
+
+    def set(self, key, val, nx=False, ex=None):
+        self._check()
+        if nx and key in self.store:
+            return None
+        self.store[key] = val
+        return True
+
+    def delete(self, key):
+        self._check()
+        self.store.pop(key, None)
+
+    def exists(self, key):
+        self._check()
+        return int(key in self.store)
+
+
+class Fetcher:
+    def __init__(self, expires_in=3600):
+        self.calls = 0
+        self.expires_in = expires_in
+
+    def __call__(self):
+        self.calls += 1
+        return f'token-{self.calls}', self.expires_in
+
+
+def _cache(redis=None, **kwargs):
+    cache = TokenCache(redis_url='redis://fake' if redis is not None else '', **kwargs)
+    cache._redis.client = redis
+    return cache
+
+
+def test_token_is_fetched_once_and_shared_between_processes():
+    redis = FakeRedis()
+    fetch = Fetcher()
+    web, worker = _cache(redis), _cache(redis)
+
+    assert web.get('mpesa', fetch) == 'token-1'
+    assert web.get('mpesa', fetch) == 'token-1'
+    assert worker.get('mpesa', fetch) == 'token-1'
+    assert fetch.calls == 1
+
+
+def test_refreshes_before_expiry():
+    fetch = Fetcher(expires_in=200)
+    cache = _cache(FakeRedis(), refresh_margin=300)
+
+    assert cache.get('mpesa', fetch) == 'token-1'
+    # Inside the refresh margin: fetch a new one
+    assert cache.get('mpesa', fetch) == 'token-2'
+
+
+def test_other_processes_keep_the_valid_token_while_one_refreshes():
+    redis = FakeRedis()
+    cache = _cache(redis, refresh_margin=300)
+    redis.store['oauth_token:mpesa'] = '{"token": "old", "expires_at": %f}' % (time.time() + 100)
+    redis.store['oauth_token:mpesa:lock'] = 'someone-else'
+    fetch = Fetcher()
+
+    assert cache.get('mpesa', fetch) == 'old'
+    assert fetch.calls == 0
+
+
+def test_waits_for_the_lock_holder_when_no_valid_token():
+    redis = FakeRedis()
+    redis.store['oauth_token:mpesa:lock'] = 'someone-else'
+    cache = _cache(redis, wait_timeout=2)
+    fetch = Fetcher()
+
+    def holder_finishes():
+        time.sleep(0.2)
+        redis.store['oauth_token:mpesa'] = '{"token": "from-holder", "expires_at": %f}' % (time.time() + 3600)
+        del redis.store['oauth_token:mpesa:lock']
+
+    threading.Thread(target=holder_finishes).start()
+    assert cache.get('mpesa', fetch) == 'from-holder'
+    assert fetch.calls == 0
+
+
+def test_threads_in_one_process_fetch_once():
+    fetch = Fetcher()
+    gate = threading.Event()
+
+    def slow_fetch():
+        gate.wait(1)
+        return fetch()
+
+    cache = _cache()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('mpesa', slow_fetch))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    gate.set()
+    for t in threads:
+        t.join()
+    assert results == ['token-1'] * 5
+    assert fetch.calls == 1
+
+
+def test_falls_back_to_process_cache_when_redis_is_down():
+    redis = FakeRedis()
+    redis.down = True
+    cache = _cache(redis)
+    fetch = Fetcher()
+
+    assert cache.get('mpesa', fetch) == 'token-1'
+    assert cache.get('mpesa', fetch) == 'token-1'
+    assert fetch.calls == 1
+    # Redis is skipped until the retry window passes
+    assert cache._client() is None
+
+
+def test_failed_refresh_keeps_valid_token_and_invalidate_forces_fetch():
+    redis = FakeRedis()
+    cache = _cache(redis, refresh_margin=300)
+    assert cache.get('mpesa', lambda: ('short', 200)) == 'short'
+
+    def broken():
+        raise RuntimeError('daraja down')
+    assert cache.get('mpesa', broken) == 'short'
+
+    cache.invalidate('mpesa')
+    assert 'oauth_token:mpesa' not in redis.store
+    with pytest.raises(RuntimeError):
+        cache.get('mpesa', broken)
+
+
+def test_mpesa_fetches_token_once_and_refetches_after_401(app, monkeypatch):
+    import requests
+    import blueprints.mpesa as mpesa_mod
+
+    class Resp:
+        def __init__(self, status, body):
+            self.status_code = status
+            self._body = body
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise requests.exceptions.HTTPError(response=self)
+
+        def json(self):
+            return self._body
+
+    oauth_calls = []
+
+    def fake_request(session, method, url, timeout, **kwargs):
+        if 'oauth' in url:
+            oauth_calls.append(url)
+            return Resp(200, {'access_token': f'tok-{len(oauth_calls)}', 'expires_in': '3599'})
+        if kwargs['headers']['Authorization'] == 'Bearer tok-1' and len(oauth_calls) == 1:
+            return Resp(401, {})
+        return Resp(200, {'ResponseCode': '0'})
+
+    monkeypatch.setattr(mpesa_mod, '_token_cache', _cache())
+    monkeypatch.setattr(mpesa_mod, 'request_with_timeout', fake_request)
+    monkeypatch.setattr(mpesa_mod, 'get_access_token', real_get_access_token)
+    monkeypatch.setattr(mpesa_mod, '_mpesa_cb', CircuitBreaker(fail_max=4, reset_timeout=30))
+    for name, value in (('CONSUMER_KEY', 'key'), ('CONSUMER_SECRET', 'secret'), ('SHORTCODE', '174379'),
+                        ('PASSKEY', 'pass'), ('MPESA_MOCK', False)):
+        monkeypatch.setattr(mpesa_mod, name, value)
+
+    with app.test_request_context():
+        assert mpesa_mod.get_access_token() == mpesa_mod.get_access_token() == 'tok-1'
+        with pytest.raises(requests.exceptions.HTTPError):
+            mpesa_mod.send_stk_push('254712345678', 10, 'ref', 'desc')
+        assert mpesa_mod.send_stk_push('254712345678', 10, 'ref', 'desc') == {'ResponseCode': '0'}
+    assert len(oauth_calls) == 2
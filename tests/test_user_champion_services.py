@@ -85,6 +85,7 @@ def test_create_champion_generates_code_and_sends_invite(monkeypatch):
     monkeypatch.setattr(champion_service, 'db', fake_db)
     monkeypatch.setattr(champion_service, 'User', FakeUser)
     monkeypatch.setattr(champion_service, 'Champion', FakeChampion)
+    monkeypatch.setattr(champion_service, 'generate_champion_code', lambda: 'UMV-2026-000001')
 
     called = {}
 
@@ -97,5 +98,5 @@ def test_create_champion_generates_code_and_sends_invite(monkeypatch):
     res = champion_service.create_champion('bob', 'Bob Example', 'bob@example.com', '0712345678', None)
 
     assert res['invite_sent'] is True
-    assert 'champion_code' in res
+    assert res['champion_code'] == 'UMV-2026-000001'
     assert called.get('args') is not None
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""Local stand-in for Safaricom's Daraja API, for payment load testing.
+
+Implements the endpoints `blueprints/mpesa.py` calls:
+
+- GET  /oauth/v1/generate?grant_type=client_credentials (HTTP Basic auth)
+- POST /mpesa/stkpush/v1/processrequest
+- POST /mpesa/stkpushquery/v1/query
+
+Accepted pushes get a result (paid, cancelled, insufficient funds or
+timeout) and the emulator POSTs the stkCallback to the push's CallBackURL
+after a random delay. Latency, push failure rate, outcome mix, duplicate
+and lost callbacks are configurable. `GET /__emulator__/stats` reports
+counters, including `repeated_pushes`: accepted pushes whose
+AccountReference was already seen, i.e. a customer prompted twice.
+
+Point the app at it with `MPESA_BASE_URL`:
+
+  python3 tools/daraja_emulator.py --port 8089 --duplicate-rate 0.2
+  MPESA_BASE_URL=http://127.0.0.1:8089 BACKEND_URL=http://127.0.0.1:5000 bash run.sh
+
+`tools/mpesa_load_scenario.py` starts it in-process together with the app.
+"""
+import argparse
+import base64
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+# Daraja ResultCodes the emulator can produce
+RESULTS = {
+    'paid': (0, 'The service request is processed successfully.'),
+    'cancelled': (1032, 'Request cancelled by user'),
+    'insufficient': (1, 'The balance is insufficient for the transaction'),
+    'timeout': (1037, 'DS timeout user cannot be reached'),
+}
+
+STK_PUSH_FIELDS = ('BusinessShortCode', 'Password', 'Timestamp', 'TransactionType', 'Amount',
+                   'PartyA', 'PartyB', 'PhoneNumber', 'CallBackURL', 'AccountReference', 'TransactionDesc')
+
+
+class DarajaEmulator:
+    """In-memory Daraja. All rates are probabilities between 0 and 1."""
+
+    def __init__(self, latency=(0.05, 0.3), failure_rate=0.0, callback_delay=(1.0, 3.0),
+                 duplicate_rate=0.0, lost_callback_rate=0.0, cancel_rate=0.05,
+                 insufficient_rate=0.03, timeout_rate=0.02, token_ttl=3599,
+                 consumer_key=None, consumer_secret=None, passkey=None, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.callback_delay = callback_delay
+        self.duplicate_rate = duplicate_rate
+        self.lost_callback_rate = lost_callback_rate
+        self.outcome_weights = {
+            'cancelled': cancel_rate,
+            'insufficient': insufficient_rate,
+            'timeout': timeout_rate,
+        }
+        self.outcome_weights['paid'] = max(0.0, 1.0 - sum(self.outcome_weights.values()))
+        self.token_ttl = token_ttl
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.passkey = passkey
+        self.random = random.Random(seed)
+        self.stats = Counter()
+        self.callback_statuses = Counter()
+        self._tokens = {}
+        self._pushes = {}
+        self._references = set()
+        self._timers = set()
+        self._lock = threading.Lock()
+        self._http = requests.Session()
+
+    # -- helpers ---------------------------------------------------------
+
+    def _sleep(self, bounds):
+        low, high = bounds
+        if high > 0:
+            time.sleep(self.random.uniform(low, high))
+
+    def _count(self, name, counter=None):
+        with self._lock:
+            (self.stats if counter is None else counter)[name] += 1
+
+    def _chance(self, rate):
+        with self._lock:
+            return self.random.random() < rate
+
+    def _error(self, status, code, message):
+        return jsonify({
+            'requestId': uuid.uuid4().hex[:12],
+            'errorCode': code,
+            'errorMessage': message,
+        }), status
+
+    def _authorized(self):
+        header = request.headers.get('Authorization', '')
+        token = header[7:] if header.startswith('Bearer ') else None
+        with self._lock:
+            expires_at = self._tokens.get(token)
+        return expires_at is not None and time.time() < expires_at
+
+    def _password_ok(self, body):
+        if not self.passkey:
+            return True
+        expected = base64.b64encode(f"{body['BusinessShortCode']}{self.passkey}{body['Timestamp']}".encode()).decode()
+        return body['Password'] == expected
+
+    def _pick_outcome(self):
+        with self._lock:
+            names = list(self.outcome_weights)
+            return self.random.choices(names, weights=[self.outcome_weights[n] for n in names])[0]
+
+    # -- callbacks -------------------------------------------------------
+
+    def _schedule(self, delay, fn, *args):
+        timer = threading.Timer(delay, self._run_timer, args=(fn,) + args)
+        timer.daemon = True
+        with self._lock:
+            self._timers.add(timer)
+        timer.start()
+
+    def _run_timer(self, fn, *args):
+        try:
+            fn(*args)
+        finally:
+            with self._lock:
+                self._timers.discard(threading.current_thread())
+
+    def _complete(self, checkout_id):
+        with self._lock:
+            push = self._pushes[checkout_id]
+            push['completed_at'] = time.time()
+        self._count('completed')
+        if self._chance(self.lost_callback_rate):
+            self._count('callbacks_lost')
+            return
+        self._send_callback(checkout_id)
+        if self._chance(self.duplicate_rate):
+            # Safaricom redelivers; send the same body again shortly after
+            self._schedule(self.random.uniform(0, 0.5), self._send_callback, checkout_id, True)
+
+    def _callback_body(self, push):
+        result_code, result_desc = RESULTS[push['outcome']]
+        callback = {
+            'MerchantRequestID': push['merchant_request_id'],
+            'CheckoutRequestID': push['checkout_request_id'],
+            'ResultCode': result_code,
+            'ResultDesc': result_desc,
+        }
+        if result_code == 0:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': push['amount']},
+                {'Name': 'MpesaReceiptNumber', 'Value': push['receipt']},
+                {'Name': 'TransactionDate', 'Value': int(datetime.now().strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': int(push['phone_number'])},
+            ]}
+        return {'Body': {'stkCallback': callback}}
+
+    def _send_callback(self, checkout_id, duplicate=False):
+        with self._lock:
+            push = dict(self._pushes[checkout_id])
+        self._count('callbacks_duplicated' if duplicate else 'callbacks_sent')
+        try:
+            resp = self._http.post(push['callback_url'], json=self._callback_body(push), timeout=10)
+            self._count(resp.status_code, self.callback_statuses)
+        except requests.RequestException:
+            self._count('error', self.callback_statuses)
+
+    def pending_callbacks(self):
+        """Callbacks and redeliveries still scheduled or in flight."""
+        with self._lock:
+            return len(self._timers)
+
+    def snapshot(self):
+        with self._lock:
+            pushes = len(self._pushes)
+            completed = sum(1 for p in self._pushes.values() if p.get('completed_at'))
+            outcomes = Counter(p['outcome'] for p in self._pushes.values())
+            counters = dict(self.stats)
+            callback_statuses = {str(k): v for k, v in self.callback_statuses.items()}
+        return {
+            'counters': counters,
+            'callback_statuses': callback_statuses,
+            'pushes': pushes,
+            'completed': completed,
+            'outcomes': dict(outcomes),
+            'pending_callbacks': self.pending_callbacks(),
+        }
+
+    # -- WSGI app --------------------------------------------------------
+
+    def create_app(self):
+        app = Flask('daraja_emulator')
+
+        @app.route('/oauth/v1/generate', methods=['GET'])
+        def generate_token():
+            self._count('oauth_requests')
+            self._sleep(self.latency)
+            auth = request.authorization
+            if request.args.get('grant_type') != 'client_credentials' or auth is None:
+                return self._error(400, '400.008.02', 'Invalid grant type passed')
+            if self.consumer_key and (auth.username, auth.password) != (self.consumer_key, self.consumer_secret):
+                return self._error(400, '400.008.01', 'Invalid Authentication passed')
+            token = uuid.uuid4().hex
+            with self._lock:
+                self._tokens[token] = time.time() + self.token_ttl
+            return jsonify({'access_token': token, 'expires_in': str(self.token_ttl)})
+
+        @app.route('/mpesa/stkpush/v1/processrequest', methods=['POST'])
+        def stk_push():
+            self._count('push_requests')
+            self._sleep(self.latency)
+            if not self._authorized():
+                self._count('push_unauthorized')
+                return self._error(401, '404.001.03', 'Invalid Access Token')
+            body = request.get_json(silent=True) or {}
+            missing = [f for f in STK_PUSH_FIELDS if body.get(f) in (None, '')]
+            if missing:
+                return self._error(400, '400.002.02', f"Bad Request - Invalid {missing[0]}")
+            if not self._password_ok(body):
+                return self._error(400, '400.002.02', 'Bad Request - Invalid Password')
+            if self._chance(self.failure_rate):
+                self._count('push_failed')
+                return self._error(500, '500.003.02', 'System is busy. Please try again in few minutes.')
+
+            checkout_id = f"ws_CO_{datetime.now().strftime('%d%m%Y%H%M%S')}{uuid.uuid4().hex[:10]}"
+            push = {
+                'checkout_request_id': checkout_id,
+                'merchant_request_id': f'{uuid.uuid4().hex[:5]}-{uuid.uuid4().hex[:8]}-1',
+                'phone_number': str(body['PhoneNumber']),
+                'amount': body['Amount'],
+                'account_reference': body['AccountReference'],
+                'callback_url': body['CallBackURL'],
+                'outcome': self._pick_outcome(),
+                'receipt': uuid.uuid4().hex[:10].upper(),
+                'created_at': time.time(),
+                'completed_at': None,
+            }
+            with self._lock:
+                if push['account_reference'] in self._references:
+                    self.stats['repeated_pushes'] += 1
+                self._references.add(push['account_reference'])
+                self._pushes[checkout_id] = push
+            self._count('push_accepted')
+            low, high = self.callback_delay
+            self._schedule(self.random.uniform(low, high), self._complete, checkout_id)
+            return jsonify({
+                'MerchantRequestID': push['merchant_request_id'],
+                'CheckoutRequestID': checkout_id,
+                'ResponseCode': '0',
+                'ResponseDescription': 'Success. Request accepted for processing',
+                'CustomerMessage': 'Success. Request accepted for processing',
+            })
+
+        @app.route('/mpesa/stkpushquery/v1/query', methods=['POST'])
+        def stk_query():
+            self._count('query_requests')
+            self._sleep(self.latency)
+            if not self._authorized():
+                return self._error(401, '404.001.03', 'Invalid Access Token')
+            body = request.get_json(silent=True) or {}
+            with self._lock:
+                push = self._pushes.get(body.get('CheckoutRequestID'))
+                push = dict(push) if push else None
+            if push is None:
+                return self._error(500, '500.001.1001', 'Unable to lock subscriber, a transaction is already in process for the current subscriber')
+            if not push['completed_at']:
+                return self._error(500, '500.001.1001', 'The transaction is being processed')
+            result_code, result_desc = RESULTS[push['outcome']]
+            return jsonify({
+                'ResponseCode': '0',
+                'ResponseDescription': 'The service request has been accepted successsfully',
+                'MerchantRequestID': push['merchant_request_id'],
+                'CheckoutRequestID': push['checkout_request_id'],
+                'ResultCode': str(result_code),
+                'ResultDesc': result_desc,
+            })
+
+        @app.route('/__emulator__/stats', methods=['GET'])
+        def stats():
+            return jsonify(self.snapshot())
+
+        return app
+
+    def serve(self, host='127.0.0.1', port=0):
+        """Start a threaded server in the background and return it (`server.port`)."""
+        server = make_server(host, port, self.create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _range(value):
+    low, _, high = value.partition(':')
+    return float(low), float(high or low)
+
+
+def add_emulator_arguments(parser):
+    parser.add_argument('--latency', type=_range, default=(0.05, 0.3), help='API latency in seconds, MIN:MAX')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of STK pushes answered with HTTP 500')
+    parser.add_argument('--callback-delay', type=_range, default=(1.0, 3.0), help='seconds until the callback, MIN:MAX')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='share of callbacks delivered twice')
+    parser.add_argument('--lost-callback-rate', type=float, default=0.0, help='share of callbacks never delivered')
+    parser.add_argument('--cancel-rate', type=float, default=0.05, help='share of pushes the customer cancels (1032)')
+    parser.add_argument('--insufficient-rate', type=float, default=0.03, help='share failing for lack of funds (1)')
+    parser.add_argument('--timeout-rate', type=float, default=0.02, help='share where the phone is unreachable (1037)')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def emulator_from_args(args, **kwargs):
+    return DarajaEmulator(
+        latency=args.latency, failure_rate=args.failure_rate, callback_delay=args.callback_delay,
+        duplicate_rate=args.duplicate_rate, lost_callback_rate=args.lost_callback_rate,
+        cancel_rate=args.cancel_rate, insufficient_rate=args.insufficient_rate,
+        timeout_rate=args.timeout_rate, seed=args.seed, **kwargs,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--consumer-key', help='reject OAuth requests with other credentials')
+    parser.add_argument('--consumer-secret')
+    parser.add_argument('--passkey', help='verify the STK push Password against this passkey')
+    add_emulator_arguments(parser)
+    args = parser.parse_args()
+
+    emulator = emulator_from_args(args, consumer_key=args.consumer_key,
+                                  consumer_secret=args.consumer_secret, passkey=args.passkey)
+    print(f'Daraja emulator on http://{args.host}:{args.port} (stats: /__emulator__/stats)')
+    make_server(args.host, args.port, emulator.create_app(), threaded=True).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
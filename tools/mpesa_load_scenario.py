@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""End-to-end M-Pesa checkout load scenario against the Daraja emulator.
+
+Starts `tools/daraja_emulator.py` and the app (threaded WSGI server, test
+config, SQLite file unless --database-url is given) on local ports, logs a
+payer in, then fires POST /api/mpesa/checkout from --concurrency clients.
+A share of requests (--repeat-rate) replays an earlier Idempotency-Key, as
+a double-clicking customer would. After the emulator has delivered every
+callback (including duplicates) it reports:
+
+- checkout throughput and latency percentiles, and responses by status
+- emulator counters: push requests, accepted pushes, callbacks and the
+  app's responses to them
+- the payments ledger by status
+
+and checks idempotency: no customer prompted twice for one key, one ledger
+row per accepted push, and no pending rows left once callbacks are in.
+Exits 1 if a check fails.
+
+With REDIS_URL set, idempotency keys, the OAuth token and the status cache
+use that Redis (`docker compose -f docker-compose.redis.yml up -d`);
+otherwise idempotency keys are kept in memory.
+
+Run: python3 tools/mpesa_load_scenario.py --requests 300 --concurrency 20 \\
+         --duplicate-rate 0.3 --failure-rate 0.05
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from tools.daraja_emulator import add_emulator_arguments, emulator_from_args
+
+CONSUMER_KEY = 'emulator-key'
+CONSUMER_SECRET = 'emulator-secret'
+SHORTCODE = '174379'
+PASSKEY = 'emulator-passkey'
+USERNAME = 'mpesa_load_payer'
+PASSWORD = 'Load-test-passw0rd'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def start_app(database_url, emulator_url):
+    # blueprints.mpesa reads its settings at import time
+    os.environ.update({
+        'MPESA_BASE_URL': emulator_url,
+        'MPESA_CONSUMER_KEY': CONSUMER_KEY,
+        'MPESA_CONSUMER_SECRET': CONSUMER_SECRET,
+        'MPESA_SHORTCODE': SHORTCODE,
+        'MPESA_PASSKEY': PASSKEY,
+        'MPESA_MOCK': 'False',
+    })
+    os.environ.setdefault('SECRET_KEY', 'mpesa-load-scenario')
+
+    from app import create_app
+    from models import db, User
+
+    app, _limiter = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'RATELIMIT_ENABLED': False,
+    })
+    with app.app_context():
+        db.create_all()
+        if not User.query.filter_by(username=USERNAME).first():
+            user = User(username=USERNAME, role='Prevention Advocate')
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            db.session.commit()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app_url = f'http://127.0.0.1:{server.port}'
+    os.environ['BACKEND_URL'] = app_url
+    return app, app_url
+
+
+def build_plan(total, repeat_rate, rng):
+    """Return the Idempotency-Key for each request; some replay earlier keys."""
+    run = uuid.uuid4().hex[:6]
+    plan = []
+    for i in range(total):
+        if plan and rng.random() < repeat_rate:
+            plan.append(rng.choice(plan))
+        else:
+            plan.append(f'load-{run}-{i}')
+    return plan
+
+
+def run_checkouts(app_url, plan, concurrency):
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'session'):
+            session = requests.Session()
+            resp = session.post(f'{app_url}/api/auth/login', json={'username': USERNAME, 'password': PASSWORD})
+            resp.raise_for_status()
+            local.session = session
+        return local.session
+
+    def checkout(key):
+        number = key.rsplit('-', 1)[-1]
+        body = {
+            'phoneNumber': '2547' + number.zfill(8)[-8:],
+            'amount': 10 + int(number) % 90,
+            # Unique per key so the emulator can spot a second prompt
+            'accountReference': key,
+        }
+        started = time.perf_counter()
+        try:
+            resp = client().post(f'{app_url}/api/mpesa/checkout', json=body,
+                                 headers={'Idempotency-Key': key}, timeout=30)
+            status = resp.status_code
+        except requests.RequestException:
+            status = 0
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(checkout, plan))
+    return results, time.perf_counter() - started
+
+
+def wait_for_callbacks(emulator, accepted_before, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        snap = emulator.snapshot()
+        if snap['completed'] >= accepted_before and snap['pending_callbacks'] == 0:
+            return snap, True
+        time.sleep(0.2)
+    return emulator.snapshot(), False
+
+
+def ledger_summary(app):
+    from models import db, Payment
+    with app.app_context():
+        rows = db.session.query(Payment.status, db.func.count()).group_by(Payment.status).all()
+        return {status: count for status, count in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=200, help='checkout requests to send')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--repeat-rate', type=float, default=0.2,
+                        help='share of requests replaying an earlier Idempotency-Key')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--settle-timeout', type=float, default=60.0,
+                        help='seconds to wait for outstanding callbacks')
+    add_emulator_arguments(parser)
+    args = parser.parse_args()
+
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url:
+        try:
+            import redis
+            redis.from_url(redis_url, socket_connect_timeout=2).ping()
+        except Exception as exc:
+            print(f'Redis at {redis_url} is unreachable: {exc}', file=sys.stderr)
+            return 2
+    # Keep the per-request access log out of the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    emulator = emulator_from_args(args, consumer_key=CONSUMER_KEY, consumer_secret=CONSUMER_SECRET,
+                                  passkey=PASSKEY)
+    emulator_server = emulator.serve()
+    emulator_url = f'http://127.0.0.1:{emulator_server.port}'
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='mpesa-load-'), 'load.db')
+    app, app_url = start_app(database_url, emulator_url)
+    print(f'Daraja emulator: {emulator_url}  app: {app_url}  database: {database_url}')
+
+    plan = build_plan(args.requests, args.repeat_rate, random.Random(args.seed))
+    results, elapsed = run_checkouts(app_url, plan, args.concurrency)
+    accepted = emulator.snapshot()['counters'].get('push_accepted', 0)
+    settle_started = time.perf_counter()
+    snap, settled = wait_for_callbacks(emulator, accepted, args.settle_timeout)
+    settle_elapsed = time.perf_counter() - settle_started
+    ledger = ledger_summary(app)
+
+    latencies = [latency for _, latency in results]
+    statuses = Counter(status for status, _ in results)
+    counters = snap['counters']
+    print('\nCheckout requests')
+    print(f'  sent: {len(results)} ({len(set(plan))} unique keys)  concurrency: {args.concurrency}')
+    print(f'  throughput: {len(results) / elapsed:.1f} req/s over {elapsed:.2f}s')
+    print('  latency p50/p95/p99: {:.3f}s / {:.3f}s / {:.3f}s'.format(
+        percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99)))
+    print(f'  responses: {dict(sorted(statuses.items()))}')
+    print('\nDaraja emulator')
+    for name in ('oauth_requests', 'push_requests', 'push_accepted', 'push_failed', 'repeated_pushes',
+                 'query_requests', 'callbacks_sent', 'callbacks_duplicated', 'callbacks_lost'):
+        print(f'  {name}: {counters.get(name, 0)}')
+    print(f"  outcomes: {snap['outcomes']}")
+    print(f"  callback responses: {snap['callback_statuses']}")
+    print(f'  callbacks settled {settle_elapsed:.2f}s after the last checkout'
+          + ('' if settled else ' (timed out)'))
+    print('\nPayments ledger')
+    print(f'  {ledger}')
+
+    lost = counters.get('callbacks_lost', 0)
+    checks = {
+        'every request answered': statuses.get(0, 0) == 0,
+        'no customer prompted twice': counters.get('repeated_pushes', 0) == 0,
+        'one ledger row per accepted push': sum(ledger.values()) == counters.get('push_accepted', 0),
+        'callbacks acknowledged': set(snap['callback_statuses']) <= {'200'},
+        'only lost callbacks left pending': ledger.get('pending', 0) == lost,
+    }
+    print('\nChecks')
+    for name, ok in checks.items():
+        print(f"  [{'ok' if ok else 'FAIL'}] {name}")
+    return 0 if all(checks.values()) and settled else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
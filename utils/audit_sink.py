@@ -0,0 +1,274 @@
+"""Write-behind sink for audit log rows.
+
+Audit rows such as `AccessAuditLog` page views do not need to be committed
+inside the request that produced them. `audit_sink.record(...)` queues the
+row and a background worker writes queued rows with one multi-row INSERT
+per table every `AUDIT_SINK_BATCH_SIZE` events or `AUDIT_SINK_FLUSH_MS`
+milliseconds, whichever comes first.
+
+Queues:
+- `memory` (default): a bounded in-process queue of `AUDIT_SINK_QUEUE_SIZE`
+  events. Events arriving while it is full are dropped and counted.
+- `redis` (default when `REDIS_URL` is set): a Redis list shared by every
+  process, so queued events survive a worker restart. If Redis cannot be
+  reached the event falls back to the in-process queue.
+
+A batch that fails to insert (e.g. during a database outage) goes back on
+the Redis list, or the in-process queue without Redis, and is retried on the
+next flush. After `AUDIT_SINK_MAX_ATTEMPTS` failed writes
+its rows are dropped and counted.
+
+`record(..., sync=True)`, or `AUDIT_SINK_MODE=sync`, adds the row to the
+caller's session instead, so it commits (or rolls back) with the request's
+own transaction. Use it for high-sensitivity actions. Tests run in sync mode.
+
+Queue depth, dropped events and written rows are exported to Prometheus.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime
+
+logger = logging.getLogger(__name__)
+
+REDIS_QUEUE_KEY = 'audit:events'
+
+
+class AuditSink:
+    def __init__(self, app=None):
+        self.app = None
+        self.sync = True
+        self._models = {}
+        self._queue = queue.Queue()
+        self._redis = None
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, start_worker=True):
+        self.app = app
+        self.sync = app.config.get('AUDIT_SINK_MODE', 'async') == 'sync'
+        self.batch_size = int(app.config.get('AUDIT_SINK_BATCH_SIZE', 100))
+        self.flush_interval = float(app.config.get('AUDIT_SINK_FLUSH_MS', 500)) / 1000
+        self.max_queue = int(app.config.get('AUDIT_SINK_QUEUE_SIZE', 10000))
+        self.max_attempts = max(int(app.config.get('AUDIT_SINK_MAX_ATTEMPTS', 5)), 1)
+        self.start_worker = start_worker
+        self._queue = queue.Queue(maxsize=self.max_queue)
+
+        self._redis = None
+        if app.config.get('AUDIT_SINK_BACKEND') == 'redis' and app.config.get('AUDIT_SINK_REDIS_URL'):
+            import redis
+            self._redis = redis.from_url(app.config['AUDIT_SINK_REDIS_URL'], socket_timeout=1, socket_connect_timeout=1)
+
+        if not self.sync:
+            atexit.register(self.flush)
+        app.extensions['audit_sink'] = self
+
+    # -- producers -------------------------------------------------------
+
+    def record(self, model, sync=False, **values):
+        """Queue an audit row for `model`, or add it to the session when synchronous.
+
+        Returns the model instance in sync mode and None otherwise.
+        """
+        from models import db
+
+        if sync or self.sync:
+            entry = model(**values)
+            db.session.add(entry)
+            return entry
+
+        table = model.__table__
+        self._models[table.name] = model
+        # Stamp the event now; it may be written seconds later
+        for column in table.columns:
+            if column.name not in values and isinstance(column.type, DateTime) and column.default is not None:
+                values[column.name] = datetime.utcnow()
+        event = {'table': table.name, 'values': values}
+
+        self._ensure_worker()
+        if self._redis is not None and self._push_redis(event):
+            return None
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._track_dropped('queue_full')
+        self._track_depth('memory', self._queue.qsize())
+        return None
+
+    def _push_redis(self, event):
+        try:
+            depth = self._redis.llen(REDIS_QUEUE_KEY)
+            if depth >= self.max_queue:
+                self._track_dropped('queue_full')
+                return True
+            self._redis.lpush(REDIS_QUEUE_KEY, json.dumps(event, default=str))
+            self._track_depth('redis', depth + 1)
+            return True
+        except Exception:
+            logger.warning('Audit sink could not reach Redis; queueing in memory', exc_info=True)
+            return False
+
+    # -- consumer --------------------------------------------------------
+
+    def _ensure_worker(self):
+        if not self.start_worker:
+            return
+        # Threads do not survive fork(); start one per worker process
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+                return
+            self._worker = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            while time.monotonic() < deadline and self._queue.qsize() < self.batch_size:
+                time.sleep(min(0.05, self.flush_interval))
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Audit sink flush failed')
+
+    def _drain(self):
+        events = []
+        while len(events) < self.batch_size:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._track_depth('memory', self._queue.qsize())
+
+        if self._redis is not None and len(events) < self.batch_size:
+            try:
+                raw = self._redis.rpop(REDIS_QUEUE_KEY, self.batch_size - len(events)) or []
+                events.extend(json.loads(item) for item in raw)
+                self._track_depth('redis', self._redis.llen(REDIS_QUEUE_KEY))
+            except Exception:
+                logger.warning('Audit sink could not read from Redis', exc_info=True)
+        return events
+
+    def flush(self):
+        """Write every queued event now. Returns the number of rows written.
+
+        Stops at the first batch that fails to write; its events are queued
+        again and retried on the next flush.
+        """
+        if self.app is None:
+            return 0
+        written = 0
+        with self._flush_lock:
+            while True:
+                events = self._drain()
+                if not events:
+                    return written
+                batch_written, failed = self._write(events)
+                written += batch_written
+                if failed:
+                    return written
+
+    def _write(self, events):
+        """Insert `events`, one statement per table. Returns (written, failed)."""
+        from models import db
+
+        by_table = {}
+        for event in events:
+            by_table.setdefault(event['table'], []).append(event)
+
+        written = 0
+        failed = []
+        with self.app.app_context():
+            for table_name, table_events in by_table.items():
+                model = self._models.get(table_name) or _model_for_table(db, table_name)
+                if model is None:
+                    self._track_dropped('unknown_table', len(table_events))
+                    continue
+                table = model.__table__
+                rows = [_coerce_datetimes(table, dict(event['values'])) for event in table_events]
+                try:
+                    db.session.execute(table.insert(), rows)
+                    db.session.commit()
+                    written += len(rows)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Audit sink failed to write %d %s rows', len(rows), table_name)
+                    failed.extend(table_events)
+        if failed:
+            self._requeue(failed)
+        if written:
+            from metrics import track_audit_written
+            track_audit_written(written)
+        return written, len(failed)
+
+    def _requeue(self, events):
+        """Queue events from a failed write again, dropping them after max_attempts."""
+        retry = []
+        for event in events:
+            event['attempts'] = event.get('attempts', 0) + 1
+            if event['attempts'] < self.max_attempts:
+                retry.append(event)
+        if len(retry) < len(events):
+            logger.error('Audit sink dropped %d rows after %d failed writes', len(events) - len(retry),
+                         self.max_attempts)
+            self._track_dropped('write_error', len(events) - len(retry))
+        if not retry:
+            return
+
+        if self._redis is not None:
+            try:
+                # The consumer pops from the right, so these are read first
+                self._redis.rpush(REDIS_QUEUE_KEY, *[json.dumps(event, default=str) for event in retry])
+                self._track_depth('redis', self._redis.llen(REDIS_QUEUE_KEY))
+                return
+            except Exception:
+                logger.warning('Audit sink could not requeue to Redis; queueing in memory', exc_info=True)
+        for event in retry:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self._track_dropped('queue_full')
+        self._track_depth('memory', self._queue.qsize())
+
+    # -- metrics ---------------------------------------------------------
+
+    @staticmethod
+    def _track_depth(backend, depth):
+        from metrics import track_audit_queue_depth
+        track_audit_queue_depth(backend, depth)
+
+    @staticmethod
+    def _track_dropped(reason, count=1):
+        from metrics import track_audit_dropped
+        track_audit_dropped(reason, count)
+
+
+def _model_for_table(db, table_name):
+    for mapper in db.Model.registry.mappers:
+        if mapper.local_table is not None and mapper.local_table.name == table_name:
+            return mapper.class_
+    return None
+
+
+def _coerce_datetimes(table, row):
+    # Redis round-trips datetimes as strings
+    for column in table.columns:
+        value = row.get(column.name)
+        if isinstance(value, str) and isinstance(column.type, DateTime):
+            row[column.name] = datetime.fromisoformat(value)
+    return row
+
+
+audit_sink = AuditSink()
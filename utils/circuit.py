@@ -1,51 +1,306 @@
-"""Simple in-memory circuit breaker to prevent repeated downstream calls when failing."""
-import time
+"""Circuit breaker for calls to external services (M-Pesa, Cloudinary, S3, SMTP).
+
+A breaker is closed until `fail_max` failures land within a sliding
+`window` of seconds. It then opens and rejects calls for `reset_timeout`
+seconds, after which it is half-open: up to `half_open_max` trial calls are
+let through. A successful trial closes it and a failed one opens it again.
+
+Named breakers keep their state in Redis (`REDIS_URL`) so every gunicorn
+worker and Celery process trips and recovers together. Without Redis, or
+while it is unreachable, each process falls back to its own in-memory state.
+Unnamed breakers are always per process.
+
+    cb = get_breaker('cloudinary')
+    result = cb.call(cloudinary.uploader.upload, data)
+
+or decorate a function with `@circuit(cb)`. Both raise `CircuitOpenError`
+(a RuntimeError) while the breaker rejects calls.
+"""
+import collections
+import logging
 import threading
+import time
+import uuid
+
+from utils.redis_client import LazyRedis
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+# Exported as the unda_circuit_breaker_state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, name=None):
+        super().__init__('CircuitOpen')
+        self.name = name
+
+
+class _MemoryState:
+    """Breaker state for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = collections.deque()
+        self._opened_at = None
+        self._half_open = False
+        self._trials = 0
+        self._trial_at = 0
+
+    def state(self, reset_timeout):
+        with self._lock:
+            if self._opened_at is not None and time.time() - self._opened_at < reset_timeout:
+                return OPEN
+            return HALF_OPEN if self._half_open else CLOSED
+
+    def admit_trial(self, half_open_max, reset_timeout):
+        with self._lock:
+            if self._trials >= half_open_max and time.time() - self._trial_at < reset_timeout:
+                return False
+            if self._trials >= half_open_max:
+                # Trials never reported back; let new ones through
+                self._trials = 0
+            self._trials += 1
+            self._trial_at = time.time()
+            return True
+
+    def add_failure(self, window):
+        now = time.time()
+        with self._lock:
+            self._failures.append(now)
+            while self._failures and self._failures[0] <= now - window:
+                self._failures.popleft()
+            return len(self._failures)
+
+    def failure_count(self, window):
+        cutoff = time.time() - window
+        with self._lock:
+            return sum(1 for ts in self._failures if ts > cutoff)
+
+    def open(self, reset_timeout):
+        with self._lock:
+            changed = not (self._opened_at is not None and time.time() - self._opened_at < reset_timeout)
+            self._opened_at = time.time()
+            self._half_open = True
+            self._trials = 0
+            self._failures.clear()
+            return changed
+
+    def close(self):
+        with self._lock:
+            changed = self._half_open or self._opened_at is not None
+            self._opened_at = None
+            self._half_open = False
+            self._trials = 0
+            self._failures.clear()
+            return changed
+
+
+# INCR the trial counter and give it a TTL when it is created: KEYS[1] =
+# trials key, ARGV[1] = ttl seconds. Returns the new count.
+_ADMIT_TRIAL = """
+local trials = redis.call('INCR', KEYS[1])
+if trials == 1 then
+  redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]))
+end
+return trials
+"""
+
+
+class _RedisState:
+    """Breaker state shared through Redis.
+
+    `<prefix>:open` exists (with a TTL of reset_timeout) while the breaker is
+    open; `<prefix>:half_open` stays set from opening until a trial succeeds,
+    so once the open key expires the breaker is half-open. Trials are counted
+    in `<prefix>:trials` and failures in the `<prefix>:failures` sorted set.
+    """
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.open_key = f'{prefix}:open'
+        self.half_open_key = f'{prefix}:half_open'
+        self.trials_key = f'{prefix}:trials'
+        self.failures_key = f'{prefix}:failures'
+
+    def state(self, reset_timeout):
+        is_open, half_open = self.client.mget(self.open_key, self.half_open_key)
+        if is_open:
+            return OPEN
+        return HALF_OPEN if half_open else CLOSED
+
+    def admit_trial(self, half_open_max, reset_timeout):
+        # One script, so the counter can never be left without its TTL; a
+        # trial whose process died must not block the breaker forever
+        trials = self.client.register_script(_ADMIT_TRIAL)(
+            keys=[self.trials_key], args=[max(int(reset_timeout), 1)])
+        return int(trials) <= half_open_max
+
+    def add_failure(self, window):
+        now = time.time()
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zadd(self.failures_key, {uuid.uuid4().hex: now})
+        pipe.zremrangebyscore(self.failures_key, 0, now - window)
+        pipe.expire(self.failures_key, max(int(window), 1))
+        pipe.zcard(self.failures_key)
+        return pipe.execute()[-1]
+
+    def failure_count(self, window):
+        return self.client.zcount(self.failures_key, time.time() - window, '+inf')
+
+    def open(self, reset_timeout):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self.open_key, '1', nx=True, ex=max(int(reset_timeout), 1))
+        pipe.set(self.half_open_key, '1')
+        pipe.delete(self.trials_key, self.failures_key)
+        return bool(pipe.execute()[0])
+
+    def close(self):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self.half_open_key)
+        pipe.delete(self.open_key, self.trials_key, self.failures_key)
+        return bool(pipe.execute()[0])
 
 
 class CircuitBreaker:
-    def __init__(self, fail_max=5, reset_timeout=30):
+    def __init__(self, fail_max=5, reset_timeout=30, name=None, window=60, half_open_max=1,
+                 redis_url=None, redis_retry_after=30):
         self.fail_max = fail_max
         self.reset_timeout = reset_timeout
-        self._lock = threading.Lock()
-        self._fail_count = 0
-        self._last_failure = None
+        self.name = name
+        self.window = window
+        self.half_open_max = half_open_max
+        self._memory = _MemoryState()
+        self._redis = LazyRedis(f'Circuit breaker {name}', redis_url, retry_after=redis_retry_after)
+        self._local = threading.local()
+        self._observed = None
+
+    # -- public API ------------------------------------------------------
+
+    @property
+    def state(self):
+        return self._run(lambda store: store.state(self.reset_timeout))
+
+    @property
+    def failure_count(self):
+        """Failures within the current window."""
+        return self._run(lambda store: store.failure_count(self.window))
+
+    def is_open(self):
+        """True while calls are rejected outright (does not use up a half-open trial)."""
+        return self.state == OPEN
 
     def call_allowed(self):
-        with self._lock:
-            if self._fail_count >= self.fail_max:
-                # check if reset timeout elapsed
-                if (time.time() - (self._last_failure or 0)) > self.reset_timeout:
-                    # reset
-                    self._fail_count = 0
-                    self._last_failure = None
-                    return True
-                return False
+        """Whether a call may go ahead; in the half-open state this takes a trial slot."""
+        self._local.trial = False
+        state = self.state
+        self._observe(state)
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._run(lambda store: store.admit_trial(self.half_open_max, self.reset_timeout)):
+            self._local.trial = True
             return True
+        self._track('rejected')
+        return False
 
     def record_success(self):
-        with self._lock:
-            self._fail_count = 0
-            self._last_failure = None
+        if getattr(self._local, 'trial', False):
+            self._local.trial = False
+            if self._run(lambda store: store.close()):
+                self._transition(CLOSED)
 
     def record_failure(self):
-        with self._lock:
-            self._fail_count += 1
-            self._last_failure = time.time()
+        self._local.trial = False
 
+        def fail(store):
+            state = store.state(self.reset_timeout)
+            if state == OPEN:
+                return False
+            if state == HALF_OPEN or store.add_failure(self.window) >= self.fail_max:
+                return store.open(self.reset_timeout)
+            return False
 
-def circuit(fb: CircuitBreaker):
-    def decorator(fn):
-        def wrapper(*args, **kwargs):
-            if not fb.call_allowed():
-                raise RuntimeError('CircuitOpen')
+        if self._run(fail):
+            self._transition(OPEN)
+
+    def call(self, fn, *args, **kwargs):
+        if not self.call_allowed():
+            raise CircuitOpenError(self.name)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def reset(self):
+        """Close the breaker and forget failures (tests, manual recovery)."""
+        self._run(lambda store: store.close())
+        self._observe(CLOSED)
+
+    # -- state store -----------------------------------------------------
+
+    def _client(self):
+        if not self.name:
+            return None
+        return self._redis.get()
+
+    def _run(self, op):
+        client = self._client()
+        if client is not None:
             try:
-                result = fn(*args, **kwargs)
+                return op(_RedisState(client, f'circuit:{self.name}'))
             except Exception:
-                fb.record_failure()
-                raise
+                self._redis.mark_down()
+        return op(self._memory)
+
+    # -- metrics ---------------------------------------------------------
+
+    def _observe(self, state):
+        if state != self._observed:
+            self._observed = state
+            self._track('state', state)
+
+    def _transition(self, state):
+        logger.warning('Circuit breaker %s is now %s', self.name or 'unnamed', state)
+        self._observed = state
+        self._track('transition', state)
+
+    def _track(self, event, state=None):
+        try:
+            from metrics import track_circuit_rejected, track_circuit_state, track_circuit_transition
+            name = self.name or 'unnamed'
+            if event == 'rejected':
+                track_circuit_rejected(name)
+            elif event == 'transition':
+                track_circuit_transition(name, state, STATE_VALUES[state])
             else:
-                fb.record_success()
-                return result
+                track_circuit_state(name, STATE_VALUES[state])
+        except Exception:
+            logger.debug('Failed to record circuit breaker metrics', exc_info=True)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, **kwargs):
+    """Return the process-wide named breaker, creating it with `kwargs` on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name=name, **kwargs)
+        return breaker
+
+
+def circuit(fb: CircuitBreaker):
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            return fb.call(fn, *args, **kwargs)
         return wrapper
     return decorator
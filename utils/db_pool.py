@@ -0,0 +1,119 @@
+"""Database connection pool configuration and metrics.
+
+Engine options are chosen per process type (`APP_PROCESS_TYPE`: `web`,
+`worker` or `cli`) so gunicorn workers, Celery workers and one-off scripts
+do not all open the web pool's worth of connections. Each setting can be
+overridden with `DB_<SETTING>_<PROCESS>` or `DB_<SETTING>`, e.g.
+`DB_POOL_SIZE_WORKER=4` or `DB_POOL_TIMEOUT=5`.
+
+With `DB_PGBOUNCER=True` the application holds no pool of its own
+(`NullPool`): PgBouncer in transaction mode does the pooling, so startup
+`options` (which PgBouncer rejects) are dropped and driver-side prepared
+statements are disabled.
+
+Pooled engines use `InstrumentedQueuePool`, which exports checked-out and
+overflow connections, checkout wait time and checkout timeouts to
+Prometheus. A short `pool_timeout` turns pool exhaustion into a fast
+`TimeoutError` (backpressure) instead of requests piling up.
+"""
+import os
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+PROCESS_TYPES = ('web', 'worker', 'cli')
+
+# Per-process defaults: web serves concurrent requests, workers run a few
+# tasks at a time and CLI commands need a single connection.
+POOL_DEFAULTS = {
+    'web': {'pool_size': 10, 'max_overflow': 5, 'pool_timeout': 10, 'pool_recycle': 3600},
+    'worker': {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 30, 'pool_recycle': 3600},
+    'cli': {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 30, 'pool_recycle': 3600},
+}
+
+STATEMENT_TIMEOUT_MS = 30000
+CONNECT_TIMEOUT_SECONDS = 10
+
+
+def process_type(environ=None) -> str:
+    """Return the configured process type, defaulting to `web`."""
+    environ = os.environ if environ is None else environ
+    value = (environ.get('APP_PROCESS_TYPE') or 'web').lower()
+    return value if value in PROCESS_TYPES else 'web'
+
+
+def _setting(environ, name, process, default):
+    raw = environ.get(f'DB_{name.upper()}_{process.upper()}', environ.get(f'DB_{name.upper()}'))
+    return default if raw in (None, '') else int(raw)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports utilisation and checkout waits to Prometheus."""
+
+    metrics_label = 'primary'
+
+    def _do_get(self):
+        from metrics import track_db_pool_checkout, track_db_pool_timeout
+
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            track_db_pool_timeout(self.metrics_label)
+            raise
+        track_db_pool_checkout(self.metrics_label, time.perf_counter() - started, self)
+        return connection
+
+    def _do_return_conn(self, record):
+        from metrics import track_db_pool_usage
+
+        super()._do_return_conn(record)
+        track_db_pool_usage(self.metrics_label, self)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics_label = self.metrics_label
+        return pool
+
+
+def engine_options(database_url: str, process=None, environ=None) -> dict:
+    """Build `SQLALCHEMY_ENGINE_OPTIONS` for `database_url`."""
+    environ = os.environ if environ is None else environ
+    if database_url.startswith('sqlite'):
+        # SQLite (tests, local fallback) keeps SQLAlchemy's defaults
+        return {}
+
+    process = process or process_type(environ)
+    defaults = POOL_DEFAULTS[process]
+    driver = make_url(database_url).get_driver_name()
+
+    if environ.get('DB_PGBOUNCER', 'False') == 'True':
+        connect_args = {'connect_timeout': CONNECT_TIMEOUT_SECONDS}
+        if driver == 'psycopg':
+            # psycopg 3 prepares repeated statements server-side by default;
+            # they do not survive transaction pooling. psycopg2 never does.
+            connect_args['prepare_threshold'] = None
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': _setting(environ, 'pool_size', process, defaults['pool_size']),
+        'max_overflow': _setting(environ, 'max_overflow', process, defaults['max_overflow']),
+        'pool_timeout': _setting(environ, 'pool_timeout', process, defaults['pool_timeout']),
+        'pool_recycle': _setting(environ, 'pool_recycle', process, defaults['pool_recycle']),
+        'pool_pre_ping': True,  # Verify connections before using
+        'connect_args': {
+            'connect_timeout': CONNECT_TIMEOUT_SECONDS,
+            'options': f'-c statement_timeout={STATEMENT_TIMEOUT_MS}',
+        },
+    }
+
+
+def label_pools(db, app):
+    """Name each bind's pool in the metrics (`primary`, `replica_0`, ...)."""
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if isinstance(engine.pool, InstrumentedQueuePool):
+                engine.pool.metrics_label = key or 'primary'
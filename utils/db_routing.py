@@ -0,0 +1,170 @@
+"""Read-replica routing for the default database bind.
+
+When `DATABASE_REPLICA_URL` is set (a comma-separated list for several
+replicas) each URL is registered as a Flask-SQLAlchemy bind named
+`replica_<n>`. `RoutingSession` sends plain SELECTs issued while handling a
+read-routed request to one of those engines; flushes, INSERT/UPDATE/DELETE,
+`SELECT ... FOR UPDATE` and text statements always use the primary.
+
+A request is read-routed when its view is marked with `@use_replica`, or when
+`DB_REPLICA_ROUTING` is `'safe'` and the method is GET/HEAD/OPTIONS; views
+marked `@use_primary` never are. Once a request writes, its remaining reads
+stay on the primary, and the client is pinned to the primary for
+`DB_REPLICA_PIN_SECONDS` so it reads its own writes. Replicas lagging more
+than `DB_REPLICA_MAX_LAG_SECONDS` are skipped until they catch up; lag is
+sampled at most every `DB_REPLICA_LAG_CHECK_SECONDS` and exported as the
+`unda_db_replica_lag_seconds` gauge.
+"""
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.selectable import Select
+
+from utils.endpoint_registry import endpoint_meta
+
+REPLICA_BIND_PREFIX = 'replica_'
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+_PIN_SESSION_KEY = '_db_primary_until'
+
+_POSTGRES_LAG_SQL = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+# bind key -> (lag_seconds or None when unreachable, checked_at)
+_lag_cache = {}
+
+
+def use_replica(view):
+    """Mark a read-only view so its queries may be served by a replica."""
+    view._db_route = 'replica'
+    return view
+
+
+def use_primary(view):
+    """Keep a view on the primary even when all safe GETs are read-routed."""
+    view._db_route = 'primary'
+    return view
+
+
+def replica_binds(urls):
+    """Map replica URLs to `SQLALCHEMY_BINDS` entries."""
+    binds = {}
+    for index, url in enumerate(urls):
+        if url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        binds[f'{REPLICA_BIND_PREFIX}{index}'] = url
+    return binds
+
+
+def _is_plain_read(clause):
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """Session that serves reads for read-routed requests from a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or not has_request_context():
+            return engine
+
+        if self._flushing or isinstance(clause, UpdateBase):
+            g._db_wrote = True
+            return engine
+
+        replica_key = g.get('_db_replica')
+        if replica_key is None or g.get('_db_wrote') or not _is_plain_read(clause):
+            return engine
+        # Only tables on the default bind are replicated
+        if engine is not self._db.engines.get(None):
+            return engine
+        return self._db.engines.get(replica_key, engine)
+
+
+def _measure_lag(engine):
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    with engine.connect() as conn:
+        return float(conn.execute(_POSTGRES_LAG_SQL).scalar() or 0)
+
+
+def replica_lag(bind_key, check_interval):
+    """Return the cached lag for `bind_key`, refreshing it when stale.
+
+    Returns None when the replica could not be reached.
+    """
+    from models import db
+    from metrics import replica_lag_seconds
+
+    cached = _lag_cache.get(bind_key)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < check_interval:
+        return cached[0]
+
+    try:
+        lag = _measure_lag(db.engines[bind_key])
+        replica_lag_seconds.labels(replica=bind_key).set(lag)
+    except Exception:
+        current_app.logger.warning('Replica lag check failed for %s', bind_key, exc_info=True)
+        lag = None
+    _lag_cache[bind_key] = (lag, now)
+    return lag
+
+
+def _wants_replica(app, mode):
+    meta = endpoint_meta(app, request.endpoint)
+    route = meta.db_route if meta else None
+    if route == 'primary':
+        return False
+    if route == 'replica':
+        return True
+    return mode == 'safe' and request.method in SAFE_METHODS
+
+
+def init_db_routing(app):
+    """Route read-only requests to the configured replicas."""
+    replica_keys = sorted(
+        key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+        if key.startswith(REPLICA_BIND_PREFIX)
+    )
+    if not replica_keys:
+        return
+
+    from metrics import track_db_route
+
+    mode = app.config.get('DB_REPLICA_ROUTING', 'marked')
+    pin_seconds = float(app.config.get('DB_REPLICA_PIN_SECONDS', 5))
+    max_lag = float(app.config.get('DB_REPLICA_MAX_LAG_SECONDS', 10))
+    check_interval = float(app.config.get('DB_REPLICA_LAG_CHECK_SECONDS', 15))
+
+    @app.before_request
+    def choose_db_target():
+        g._db_replica = None
+        g._db_wrote = False
+        if not _wants_replica(app, mode):
+            return
+        if session.get(_PIN_SESSION_KEY, 0) > time.time():
+            track_db_route('pinned')
+            return
+        healthy = []
+        for key in replica_keys:
+            lag = replica_lag(key, check_interval)
+            if lag is not None and lag <= max_lag:
+                healthy.append(key)
+        if not healthy:
+            track_db_route('replica_unavailable')
+            return
+        g._db_replica = random.choice(healthy)
+        track_db_route('replica')
+
+    @app.after_request
+    def pin_after_write(response):
+        if g.get('_db_wrote') and pin_seconds > 0:
+            session[_PIN_SESSION_KEY] = time.time() + pin_seconds
+        return response
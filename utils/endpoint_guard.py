@@ -1,49 +1,222 @@
+"""Run guarded endpoint handlers on a shared, bounded executor.
+
+Every `endpoint_guard` view in a process shares one executor with
+`ENDPOINT_GUARD_MAX_WORKERS` workers and room for `ENDPOINT_GUARD_MAX_QUEUE`
+waiting handlers. When both are used up the request is rejected at once
+with 503 instead of starting yet another thread, so a slow downstream API
+(e.g. M-Pesa during a Safaricom outage) ties up a fixed number of workers
+rather than an unbounded pile of orphaned threads.
+
+A handler that times out keeps its worker until it finishes, because Python
+threads cannot be killed; one still waiting in the queue is cancelled. Under
+gevent (threading monkey-patched) the workers are greenlets.
+
+In-flight and queued handlers, timeouts and rejections are exported to
+Prometheus.
+"""
 import functools
 import concurrent.futures
-from flask import jsonify, copy_current_request_context
+import os
+import queue
+import threading
+
+from flask import current_app, jsonify, copy_current_request_context
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_QUEUE = 32
+
+
+class GuardSaturated(Exception):
+    """Raised when the guard executor has no free worker or queue slot."""
+
+
+def _gevent_active():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class GuardExecutor:
+    """Bounded executor shared by every guarded endpoint in a process."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE, use_gevent=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.use_gevent = _gevent_active() if use_gevent is None else use_gevent
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        if self.use_gevent:
+            import gevent.pool
+            self._pool = gevent.pool.Pool(max_workers)
+        else:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='endpoint-guard')
+
+    @property
+    def queued(self):
+        return self._queued
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule `fn` and return a Future, or raise GuardSaturated."""
+        if not self._slots.acquire(blocking=False):
+            raise GuardSaturated()
+        self._adjust(queued=1)
+        try:
+            if self.use_gevent:
+                future = self._spawn_greenlet(fn, args, kwargs)
+            else:
+                future = self._pool.submit(self._run, fn, args, kwargs)
+        except BaseException:
+            self._adjust(queued=-1)
+            self._slots.release()
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _spawn_greenlet(self, fn, args, kwargs):
+        import gevent
+
+        future = concurrent.futures.Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self._run(fn, args, kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+        # Pool.spawn blocks while every worker is busy; wait in a helper
+        # greenlet so the caller's timeout also covers time spent queued.
+        gevent.spawn(self._pool.spawn, run)
+        return future
+
+    def _run(self, fn, args, kwargs):
+        self._adjust(queued=-1, in_flight=1)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._adjust(in_flight=-1)
+
+    def _on_done(self, future):
+        if future.cancelled():
+            # Cancelled while still queued; _run never started
+            self._adjust(queued=-1)
+        self._slots.release()
+
+    def _adjust(self, queued=0, in_flight=0):
+        with self._lock:
+            self._queued += queued
+            self._in_flight += in_flight
+            queued_now, in_flight_now = self._queued, self._in_flight
+        from metrics import track_guard_usage
+        track_guard_usage(in_flight_now, queued_now)
+
+    def shutdown(self):
+        if self.use_gevent:
+            self._pool.kill(block=False)
+        else:
+            # What shutdown(cancel_futures=True) does, which needs Python 3.9
+            while True:
+                try:
+                    item = self._pool._work_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item.future.cancel()
+            self._pool.shutdown(wait=False)
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_guard_executor():
+    """Return this process's guard executor, creating it on first use.
+
+    Sized from `ENDPOINT_GUARD_MAX_WORKERS`/`ENDPOINT_GUARD_MAX_QUEUE` in the
+    app config. Created per pid so forked workers don't inherit dead threads.
+    """
+    global _executor, _executor_pid
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            config = current_app.config
+            _executor = GuardExecutor(
+                max_workers=int(config.get('ENDPOINT_GUARD_MAX_WORKERS', DEFAULT_MAX_WORKERS)),
+                max_queue=int(config.get('ENDPOINT_GUARD_MAX_QUEUE', DEFAULT_MAX_QUEUE)),
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def reset_guard_executor():
+    """Drop the process executor so the next request builds a new one (tests)."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = None
+        _executor_pid = None
 
 
 def endpoint_guard(cb=None, timeout=10):
     """Decorator to guard endpoint execution with a timeout and optional circuit breaker.
 
-    - cb: CircuitBreaker instance (optional). If provided, requests will be rejected when circuit is open.
+    - cb: CircuitBreaker instance (optional). If provided, requests will be rejected when circuit is open;
+      half-open trial slots are left to the breaker-wrapped call inside the handler.
     - timeout: seconds to wait for the handler to complete before returning 504.
+
+    Returns 503 without running the handler when the circuit is open or the
+    shared executor is saturated.
     """
     def decorator(fn):
         @functools.wraps(fn)
         def wrapper(*args, **kwargs):
-            if cb and not cb.call_allowed():
+            from metrics import track_guard_rejected, track_guard_timeout
+
+            if cb and cb.is_open():
+                track_guard_rejected(fn.__name__, 'circuit_open')
                 return jsonify({'success': False, 'message': 'Service temporarily unavailable.'}), 503
 
-            # Run handler in a short-lived thread to enforce a hard timeout
-            # Preserve the Flask request context for the worker thread so
-            # handlers that access `request` or other context locals work
-            # correctly during tests and normal execution.
-            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            # Preserve the Flask request context for the worker so handlers
+            # that access `request` or other context locals keep working.
             worker_fn = copy_current_request_context(fn)
-            future = executor.submit(worker_fn, *args, **kwargs)
             try:
-                result = future.result(timeout=timeout)
-                return result
+                future = get_guard_executor().submit(worker_fn, *args, **kwargs)
+            except GuardSaturated:
+                track_guard_rejected(fn.__name__, 'saturated')
+                response = jsonify({'success': False, 'message': 'Service busy, please retry shortly.'})
+                return response, 503, {'Retry-After': '5'}
+
+            try:
+                return future.result(timeout=timeout)
             except concurrent.futures.TimeoutError:
+                # Frees the slot if the handler never started
+                future.cancel()
+                track_guard_timeout(fn.__name__)
                 if cb:
                     try:
                         cb.record_failure()
                     except Exception:
                         pass
                 return jsonify({'success': False, 'message': 'Request timed out.'}), 504
-            except Exception as e:
+            except Exception:
                 if cb:
                     try:
                         cb.record_failure()
                     except Exception:
                         pass
                 raise
-            finally:
-                try:
-                    executor.shutdown(wait=False)
-                except Exception:
-                    pass
 
         return wrapper
     return decorator
@@ -0,0 +1,150 @@
+"""Endpoint metadata compiled once at startup.
+
+`build_endpoint_registry(app, csrf)` runs after every blueprint and CSRF
+exemption is registered and records, for each endpoint:
+
+- `csrf_exempt`: whether Flask-WTF skips the CSRF check (exempt view or
+  exempt blueprint, using the same rules as `CSRFProtect`);
+- `auth`: the strictest guard on the view: `roles`, `login`, `token`
+  (login or bearer token), `dev_key` or `public`;
+- `roles`: the lowercased roles allowed by `roles_required`, as a frozenset;
+- `db_route`: the `use_replica`/`use_primary` marker, if any.
+
+Request hooks read it with `endpoint_meta(app, request.endpoint)`, a single
+dict lookup. Endpoints added after the registry was built (tests, plugins)
+are compiled on first use. `/__dev__/routes` dumps the table for auditing.
+
+Auth decorators declare what they enforce with `mark_auth(wrapper, mode)`.
+The marker records the wrapper's code object so a marker copied onto outer
+wrappers by `functools.wraps` is attributed to the right layer.
+"""
+from collections import namedtuple
+
+EXTENSION_KEY = 'endpoint_registry'
+
+# Strictest first; the registry reports the first mode present on a view
+AUTH_MODES = ('roles', 'login', 'token', 'dev_key', 'public')
+
+EndpointMeta = namedtuple('EndpointMeta', ['endpoint', 'rules', 'methods', 'csrf_exempt', 'auth', 'roles', 'db_route'])
+
+
+def mark_auth(wrapper, mode, roles=None):
+    """Record on `wrapper` that it enforces `mode` (and `roles`, for `roles`)."""
+    wrapper._endpoint_auth = (wrapper.__code__, mode, roles)
+    return wrapper
+
+
+def _login_required_code():
+    try:
+        from flask_login import login_required
+    except ImportError:
+        return None
+    return login_required(lambda: None).__code__
+
+
+_LOGIN_REQUIRED_CODE = _login_required_code()
+
+
+def _auth_layers(view):
+    """Yield (mode, roles) for each auth decorator wrapped around `view`."""
+    fn = view
+    seen = set()
+    while fn is not None and id(fn) not in seen:
+        seen.add(id(fn))
+        code = getattr(fn, '__code__', None)
+        marker = getattr(fn, '__dict__', {}).get('_endpoint_auth')
+        if marker is not None and marker[0] is code:
+            yield marker[1], marker[2]
+        elif code is not None and code is _LOGIN_REQUIRED_CODE:
+            yield 'login', None
+        fn = getattr(fn, '__wrapped__', None)
+
+
+def _auth_for(view):
+    modes = set()
+    roles = None
+    for mode, layer_roles in _auth_layers(view):
+        modes.add(mode)
+        if layer_roles is not None:
+            # Stacked role decorators must all pass
+            roles = layer_roles if roles is None else roles & layer_roles
+    auth = next((mode for mode in AUTH_MODES if mode in modes), 'public')
+    return auth, roles
+
+
+def _csrf_exempt(app, csrf, endpoint, view):
+    if csrf is None:
+        return False
+    blueprint = endpoint.rpartition('.')[0]
+    if blueprint and app.blueprints.get(blueprint) in csrf._exempt_blueprints:
+        return True
+    return f'{view.__module__}.{view.__name__}' in csrf._exempt_views
+
+
+def _compile(app, csrf, endpoint, rules):
+    view = app.view_functions[endpoint]
+    auth, roles = _auth_for(view)
+    methods = set()
+    for rule in rules:
+        methods.update(rule.methods or ())
+    methods.discard('HEAD')
+    methods.discard('OPTIONS')
+    return EndpointMeta(
+        endpoint=endpoint,
+        rules=tuple(sorted(rule.rule for rule in rules)),
+        methods=tuple(sorted(methods)),
+        csrf_exempt=_csrf_exempt(app, csrf, endpoint, view),
+        auth=auth,
+        roles=roles,
+        db_route=getattr(view, '_db_route', None),
+    )
+
+
+def _rules_by_endpoint(app):
+    rules = {}
+    for rule in app.url_map.iter_rules():
+        rules.setdefault(rule.endpoint, []).append(rule)
+    return rules
+
+
+def build_endpoint_registry(app, csrf=None):
+    """Compile metadata for every registered endpoint and store it on `app`."""
+    if csrf is None:
+        csrf = app.extensions.get('csrf')
+    table = {
+        endpoint: _compile(app, csrf, endpoint, rules)
+        for endpoint, rules in _rules_by_endpoint(app).items()
+        if endpoint in app.view_functions
+    }
+    app.extensions[EXTENSION_KEY] = table
+    return table
+
+
+def endpoint_meta(app, endpoint):
+    """Return the `EndpointMeta` for `endpoint`, or None if it is not a view."""
+    if not endpoint:
+        return None
+    table = app.extensions.get(EXTENSION_KEY)
+    if table is None:
+        table = build_endpoint_registry(app)
+    meta = table.get(endpoint)
+    if meta is None and endpoint in app.view_functions:
+        rules = _rules_by_endpoint(app).get(endpoint, [])
+        meta = table[endpoint] = _compile(app, app.extensions.get('csrf'), endpoint, rules)
+    return meta
+
+
+def registry_rows(app):
+    """Return the compiled table as JSON-serialisable rows sorted by rule."""
+    table = app.extensions.get(EXTENSION_KEY)
+    if table is None:
+        table = build_endpoint_registry(app)
+    rows = []
+    for meta in table.values():
+        row = meta._asdict()
+        row['rules'] = list(meta.rules)
+        row['methods'] = list(meta.methods)
+        row['roles'] = sorted(meta.roles) if meta.roles is not None else None
+        rows.append(row)
+    rows.sort(key=lambda row: (row['rules'][0] if row['rules'] else '', row['endpoint']))
+    return rows
@@ -1,8 +1,9 @@
 import os
 import json
 import hashlib
+import threading
+import time
 from datetime import datetime, timezone
-import redis
 from typing import Optional, Dict, Any
 from prometheus_client import Counter
 
@@ -35,12 +36,210 @@ def _ensure_metrics():
         except Exception:
             pass
 
-# Simple Redis-backed idempotency utilities.
-# Uses a JSON value stored at key `idemp:{idempotency_key}` with fields:
-# {status: 'pending'|'success'|'failed', created_at, updated_at, response, meta}
+# Idempotency entries are JSON values stored at `idemp:{idempotency_key}`:
+# {status: 'pending'|'success'|'failed'|'unknown', created_at, updated_at, response, meta}
+#
+# Backends (IDEMPOTENCY_BACKEND):
+# - `redis` (default when REDIS_URL is set): shared by every process. Keys are
+#   reserved with one SET NX EX and updated by Lua scripts, so each
+#   transition is a single atomic round trip. The client connects lazily.
+# - `memory`: a per-process dict, for tests and single-node deployments.
+
+DEFAULT_TTL = 60 * 60 * 24
+
+# Reclaim a key whose earlier attempt failed: ARGV = entry JSON, ttl
+_RECLAIM_FAILED = """
+local raw = redis.call('GET', KEYS[1])
+if raw then
+  local ok, entry = pcall(cjson.decode, raw)
+  if ok and type(entry) == 'table' and entry['status'] ~= 'failed' then
+    return 0
+  end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', tonumber(ARGV[2]))
+return 1
+"""
+
+# ARGV = status, updated_at, response JSON, meta JSON or '', ttl, allowed current statuses (comma separated) or ''
+_UPDATE = """
+local raw = redis.call('GET', KEYS[1])
+local entry = {}
+if raw then
+  local ok, decoded = pcall(cjson.decode, raw)
+  if ok and type(decoded) == 'table' then entry = decoded end
+end
+if ARGV[6] ~= '' then
+  local current = entry['status']
+  if type(current) ~= 'string' or not string.find(',' .. ARGV[6] .. ',', ',' .. current .. ',', 1, true) then
+    return 0
+  end
+end
+entry['status'] = ARGV[1]
+entry['updated_at'] = ARGV[2]
+entry['response'] = cjson.decode(ARGV[3])
+if ARGV[4] ~= '' then
+  if type(entry['meta']) ~= 'table' then entry['meta'] = {} end
+  for k, v in pairs(cjson.decode(ARGV[4])) do entry['meta'][k] = v end
+end
+redis.call('SET', KEYS[1], cjson.encode(entry), 'EX', tonumber(ARGV[5]))
+return 1
+"""
+
+
+class IdempotencyBackend:
+    """Storage for idempotency entries. Every method is one atomic operation."""
+
+    def reserve(self, key: str, entry: dict, ttl: int) -> bool:
+        """Store `entry` if `key` is free or its last attempt failed."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_many(self, keys) -> Dict[str, dict]:
+        """Return the entries that exist for `keys`."""
+        raise NotImplementedError
+
+    def update(self, key: str, status: str, updated_at: str, response, meta: Optional[dict], ttl: int,
+               only_if: Optional[tuple] = None) -> bool:
+        """Set status/response and merge `meta`, unless the current status is not in `only_if`."""
+        raise NotImplementedError
+
+
+class RedisBackend(IdempotencyBackend):
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        self._client = None
+        self._scripts = {}
+        self._lock = threading.Lock()
+
+    def _redis(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import redis
+                    client = redis.from_url(self.url, decode_responses=True)
+                    self._scripts = {
+                        'reclaim': client.register_script(_RECLAIM_FAILED),
+                        'update': client.register_script(_UPDATE),
+                    }
+                    self._client = client
+        return self._client
+
+    def reserve(self, key, entry, ttl):
+        client = self._redis()
+        value = json.dumps(entry)
+        if client.set(_redis_key(key), value, nx=True, ex=ttl):
+            return True
+        return bool(self._scripts['reclaim'](keys=[_redis_key(key)], args=[value, ttl]))
+
+    def get(self, key):
+        return _decode(self._redis().get(_redis_key(key)))
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._redis().mget([_redis_key(k) for k in keys])
+        found = {key: _decode(raw) for key, raw in zip(keys, values)}
+        return {key: entry for key, entry in found.items() if entry is not None}
+
+    def update(self, key, status, updated_at, response, meta, ttl, only_if=None):
+        self._redis()
+        args = [status, updated_at, json.dumps(response), json.dumps(meta) if meta else '', ttl,
+                ','.join(only_if or ())]
+        return bool(self._scripts['update'](keys=[_redis_key(key)], args=args))
+
+
+class MemoryBackend(IdempotencyBackend):
+    """Per-process store; entries expire lazily."""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= now:
+            del self._entries[key]
+            return None
+        return item[1]
+
+    def _store(self, key, entry, ttl, now):
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            for stale in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+                del self._entries[stale]
+            if len(self._entries) >= self.max_entries:
+                # Still full: drop the entry closest to expiry
+                del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+        self._entries[key] = (now + ttl, entry)
+
+    def reserve(self, key, entry, ttl):
+        now = time.monotonic()
+        with self._lock:
+            current = self._live(key, now)
+            if current is not None and current.get('status') != 'failed':
+                return False
+            self._store(key, json.loads(json.dumps(entry)), ttl, now)
+            return True
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return json.loads(json.dumps(entry)) if entry is not None else None
+
+    def get_many(self, keys):
+        found = {key: self.get(key) for key in keys}
+        return {key: entry for key, entry in found.items() if entry is not None}
+
+    def update(self, key, status, updated_at, response, meta, ttl, only_if=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now) or {}
+            if only_if and entry.get('status') not in only_if:
+                return False
+            entry = dict(entry, status=status, updated_at=updated_at, response=json.loads(json.dumps(response)))
+            if meta:
+                entry['meta'] = dict(entry.get('meta') or {}, **json.loads(json.dumps(meta)))
+            self._store(key, entry, ttl, now)
+            return True
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend_name() -> str:
+    """The configured backend, 'redis' or 'memory'."""
+    return os.environ.get('IDEMPOTENCY_BACKEND') or ('redis' if os.environ.get('REDIS_URL') else 'memory')
+
+
+def get_backend() -> IdempotencyBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = RedisBackend() if backend_name() == 'redis' else MemoryBackend()
+    return _backend
+
+
+def set_backend(backend: Optional[IdempotencyBackend]) -> None:
+    """Use `backend` from now on; None re-reads IDEMPOTENCY_BACKEND on next use."""
+    global _backend
+    _backend = backend
+
+
+def _decode(raw) -> Optional[dict]:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except Exception:
+        return None
 
-_redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-_r = redis.from_url(_redis_url, decode_responses=True)
 
 def _redis_key(key: str) -> str:
     return f"idemp:{key}"
@@ -49,12 +248,12 @@ def make_key_from_args(user_id: int, phone: str, amount: int, account_ref: str)
     payload = f"{user_id}:{phone}:{amount}:{account_ref}"
     return hashlib.sha256(payload.encode()).hexdigest()
 
-def reserve_key(key: str, meta: dict = None, ttl: int = 60 * 60 * 24) -> bool:
+def reserve_key(key: str, meta: dict = None, ttl: int = DEFAULT_TTL) -> bool:
     """Attempt to reserve an idempotency key. Returns True if reserver wins.
 
     If reserved, an entry with status 'pending' is created with provided meta.
+    A key whose previous attempt failed can be reserved again.
     """
-    rkey = _redis_key(key)
     now = datetime.now(timezone.utc).isoformat()
     value = {
         'status': 'pending',
@@ -63,16 +262,14 @@ def reserve_key(key: str, meta: dict = None, ttl: int = 60 * 60 * 24) -> bool:
         'response': None,
         'meta': meta or {}
     }
-    # setnx: only set if not exists
     try:
         _ensure_metrics()
         if IDEMP_REQUESTS:
             IDEMP_REQUESTS.inc()
     except Exception:
         pass
-    was_set = _r.setnx(rkey, json.dumps(value))
+    was_set = get_backend().reserve(key, value, ttl)
     if was_set:
-        _r.expire(rkey, ttl)
         try:
             if IDEMP_RESERVED:
                 IDEMP_RESERVED.inc()
@@ -89,40 +286,35 @@ def reserve_key(key: str, meta: dict = None, ttl: int = 60 * 60 * 24) -> bool:
     return was_set
 
 def get_key(key: str) -> Optional[dict]:
-    rkey = _redis_key(key)
-    raw = _r.get(rkey)
+    entry = get_backend().get(key)
     try:
         _ensure_metrics()
         if IDEMP_REQUESTS:
             IDEMP_REQUESTS.inc()
     except Exception:
         pass
-    if not raw:
-        return None
-    try:
-        return json.loads(raw)
-    except Exception:
-        return None
+    return entry
+
+def get_keys(keys) -> Dict[str, dict]:
+    """Fetch several entries in one round trip; missing keys are left out."""
+    return get_backend().get_many(keys)
 
-def update_key(key: str, *, status: str, response: Optional[Dict[str, Any]] = None, meta: Optional[Dict[str, Any]] = None, ttl: int = 60 * 60 * 24) -> None:
-    rkey = _redis_key(key)
+def update_key(key: str, *, status: str, response: Optional[Dict[str, Any]] = None, meta: Optional[Dict[str, Any]] = None,
+               ttl: int = DEFAULT_TTL, only_if: Optional[tuple] = None) -> bool:
+    """Record the outcome for `key`, merging `meta` into the stored meta.
+
+    With `only_if`, the update only applies while the current status is one
+    of those (e.g. `only_if=('pending',)`). Returns whether it applied.
+    """
     now = datetime.now(timezone.utc).isoformat()
-    entry = get_key(key) or {}
-    entry.update({
-        'status': status,
-        'updated_at': now,
-        'response': response,
-    })
-    if meta:
-        entry.setdefault('meta', {}).update(meta)
-    # overwrite
-    _r.set(rkey, json.dumps(entry), ex=ttl)
+    applied = get_backend().update(key, status, now, response, meta, ttl, only_if=only_if)
     # Update metrics
     try:
         _ensure_metrics()
-        if status == 'success' and IDEMP_SUCCESS:
+        if applied and status == 'success' and IDEMP_SUCCESS:
             IDEMP_SUCCESS.inc()
-        elif status == 'failed' and IDEMP_FAILED:
+        elif applied and status == 'failed' and IDEMP_FAILED:
             IDEMP_FAILED.inc()
     except Exception:
         pass
+    return applied
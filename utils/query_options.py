@@ -0,0 +1,87 @@
+"""Shared relationship-loading strategies for serialized list endpoints.
+
+Every list endpoint that serializes related rows declares here, keyed by its
+Flask endpoint name, how those relationships are loaded and how many SQL
+statements a single request may issue. Views apply the options with
+`with_load_options(query, 'blueprint.view')`; `tests/test_query_budgets.py`
+enforces the budgets so N+1 regressions fail the test suite.
+
+Building loader options configures every SQLAlchemy mapper, so the plans are
+declared on first use rather than when the blueprints are imported.
+"""
+import threading
+
+from sqlalchemy.orm import joinedload, selectinload
+
+
+# endpoint -> {'options': tuple of loader options, 'max_queries': int}
+LOAD_PLANS = {}
+_declared = False
+_declare_lock = threading.Lock()
+
+
+def register(endpoint: str, *options, max_queries: int):
+    """Declare the loader options and per-request statement budget for an endpoint."""
+    LOAD_PLANS[endpoint] = {'options': tuple(options), 'max_queries': max_queries}
+
+
+def _plan(endpoint: str):
+    global _declared
+    if not _declared:
+        with _declare_lock:
+            if not _declared:
+                _declare_load_plans()
+                _declared = True
+    return LOAD_PLANS.get(endpoint)
+
+
+def load_options(endpoint: str) -> tuple:
+    """Return the loader options declared for `endpoint` (empty if none)."""
+    plan = _plan(endpoint)
+    return plan['options'] if plan else ()
+
+
+def with_load_options(query, endpoint: str):
+    """Apply the declared loader options for `endpoint` to a query."""
+    options = load_options(endpoint)
+    return query.options(*options) if options else query
+
+
+def query_budget(endpoint: str):
+    """Return the max SQL statements allowed per request for `endpoint`, or None."""
+    plan = _plan(endpoint)
+    return plan['max_queries'] if plan else None
+
+
+def _declare_load_plans():
+    from models import BlogPost, EventParticipation, MediaGallery
+
+    # Budgets include the statements issued by authentication (session user
+    # lookup) so they can be asserted against a full request.
+
+    # Media galleries: items in one SELECT ... IN, the linked event in the main query
+    gallery_options = (selectinload(MediaGallery.items), joinedload(MediaGallery.event))
+    register('public_auth.api_list_media_galleries', *gallery_options, max_queries=2)
+    register('workstreams.get_gallery', selectinload(MediaGallery.items), max_queries=2)
+    register('workstreams.get_gallery_categories', selectinload(MediaGallery.items), max_queries=2)
+    register('workstreams.get_event_galleries', selectinload(MediaGallery.items), max_queries=3)
+    # Loaded through media_gallery_service.list_media_galleries (items selectinloaded there)
+    register('admin.list_media_galleries', max_queries=5)
+
+    # Blog posts and stories serialize the author's username
+    register('blog.list_posts', joinedload(BlogPost.author), max_queries=1)
+    register('workstreams.get_stories', joinedload(BlogPost.author), max_queries=1)
+
+    # Event participation lists serialize event (and champion) details per row
+    register(
+        'participation.list_participations',
+        joinedload(EventParticipation.event),
+        joinedload(EventParticipation.champion),
+        max_queries=2,
+    )
+    register('participation.get_champion_participation_history', joinedload(EventParticipation.event), max_queries=2)
+
+    # Admin event and podcast managers: the rows themselves have no per-row
+    # relationship access, so the budget guards the summary count queries.
+    register('admin.workstream_events', max_queries=6)
+    register('admin.podcasts', max_queries=8)
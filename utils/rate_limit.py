@@ -0,0 +1,99 @@
+"""Rate limit keys and storage configuration for `extensions.limiter`.
+
+Limits are counted per identity rather than per connection:
+
+- `user:<id>` for a logged-in session user;
+- `user:<sub>` for a request carrying a valid HS256 bearer JWT;
+- `ip:<address>` otherwise. ProxyFix (see `create_app`) makes this the
+  client address rather than the load balancer's.
+
+Counters live in Redis (`RATELIMIT_STORAGE_URL`, else `REDIS_URL`) so every
+gunicorn worker shares them. Without Redis, or while it is unreachable,
+Flask-Limiter keeps counting in process memory until the storage recovers.
+The default strategy is a moving window (`RATELIMIT_STRATEGY`), which does
+not allow the 2x burst a fixed window permits at the window boundary.
+"""
+import logging
+import os
+import time
+
+from flask import current_app, g, request
+from flask_limiter.util import get_remote_address
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STRATEGY = 'moving-window'
+
+# Fail fast to the in-memory fallback instead of holding requests on Redis
+_REDIS_OPTIONS = {'socket_timeout': 0.5, 'socket_connect_timeout': 0.5}
+
+
+def _bearer_subject():
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    payload = getattr(g, 'jwt_payload', None)
+    if not payload:
+        # Only a verified token may choose its bucket; forged subs fall back to the IP
+        try:
+            import jwt
+            secret = os.environ.get('SECRET_KEY') or current_app.config.get('SECRET_KEY')
+            payload = jwt.decode(auth.split(' ', 1)[1], secret, algorithms=['HS256'])
+        except Exception:
+            return None
+    sub = payload.get('sub') if isinstance(payload, dict) else None
+    return str(sub) if sub else None
+
+
+def rate_limit_key():
+    """Limiter key for the current request: user id, JWT sub, or client IP."""
+    cached = g.get('_rate_limit_key')
+    if cached:
+        return cached
+    key = None
+    try:
+        if current_user and current_user.is_authenticated:
+            key = f'user:{current_user.get_id()}'
+    except Exception:
+        logger.debug('Could not resolve session user for rate limiting', exc_info=True)
+    if key is None:
+        sub = _bearer_subject()
+        key = f'user:{sub}' if sub else f'ip:{get_remote_address()}'
+    g._rate_limit_key = key
+    return key
+
+
+def retry_after_seconds():
+    """Seconds until the limit breached by this request resets, or None."""
+    try:
+        from extensions import limiter
+        current = limiter.current_limit
+        if current is not None:
+            return max(int(current.reset_at - time.time()), 1)
+    except Exception:
+        logger.debug('Could not compute Retry-After for rate limited request', exc_info=True)
+    return None
+
+
+def on_rate_limit_breach(request_limit):
+    try:
+        from metrics import track_rate_limited
+        track_rate_limited(request.endpoint or 'unknown')
+    except Exception:
+        logger.debug('Failed to record rate limit metrics', exc_info=True)
+
+
+def configure_rate_limit_storage(app):
+    """Fill in the Flask-Limiter storage settings from app config and env."""
+    storage_url = (app.config.get('RATELIMIT_STORAGE_URL')
+                   or os.environ.get('RATELIMIT_STORAGE_URL')
+                   or os.environ.get('REDIS_URL')
+                   or 'memory://')
+    app.config['RATELIMIT_STORAGE_URL'] = storage_url
+    app.config.setdefault('RATELIMIT_STORAGE_URI', storage_url)
+    if app.config['RATELIMIT_STORAGE_URI'].startswith(('redis://', 'rediss://')):
+        app.config.setdefault('RATELIMIT_STORAGE_OPTIONS', dict(_REDIS_OPTIONS))
+    app.config.setdefault('RATELIMIT_STRATEGY', os.environ.get('RATELIMIT_STRATEGY', DEFAULT_STRATEGY))
+    app.config.setdefault('RATELIMIT_KEY_PREFIX', 'ratelimit')
+    app.config.setdefault('RATELIMIT_IN_MEMORY_FALLBACK_ENABLED', True)
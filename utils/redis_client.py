@@ -0,0 +1,52 @@
+"""Lazily connected Redis client for optional, best-effort caches.
+
+Callers that can fall back to local state (the payment status cache, the
+OAuth token cache, shared circuit breaker state) share this helper:
+
+    cache = LazyRedis('Payment status cache')
+    client = cache.get()
+    if client is not None:
+        try:
+            client.get(key)
+        except Exception:
+            cache.mark_down()
+
+`get()` returns None when no URL is configured or while Redis is marked
+down. `mark_down()` logs the current exception and skips Redis for
+`retry_after` seconds, so an outage costs one short timeout per process
+rather than one per call.
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRedis:
+    def __init__(self, name, url=None, retry_after=30, timeout=0.5):
+        self.name = name
+        self._url = url
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self.client = None
+        self.down_until = 0
+
+    @property
+    def url(self):
+        """The configured URL, or `REDIS_URL` at call time when none was given."""
+        return self._url if self._url is not None else os.environ.get('REDIS_URL')
+
+    def get(self):
+        url = self.url
+        if not url or time.monotonic() < self.down_until:
+            return None
+        if self.client is None:
+            import redis
+            self.client = redis.from_url(url, decode_responses=True,
+                                         socket_timeout=self.timeout, socket_connect_timeout=self.timeout)
+        return self.client
+
+    def mark_down(self):
+        logger.warning('%s could not reach Redis; retrying in %ss', self.name, self.retry_after, exc_info=True)
+        self.down_until = time.monotonic() + self.retry_after
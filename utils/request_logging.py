@@ -0,0 +1,129 @@
+"""Sampled, structured request logging.
+
+One after-request hook replaces the per-request INFO diagnostics that used to
+live in several `before_request` hooks. A request is logged when:
+
+- its status is 5xx, or 401/403 on `/api` (auth triage), at WARNING; or
+- it was sampled (`REQUEST_LOG_SAMPLE_RATE`, 0.0-1.0) at `REQUEST_LOG_LEVEL`.
+
+Nothing is collected or formatted unless the `unda.request` logger is
+enabled for the chosen level: the sampling decision is made first, the
+fields are gathered only for requests that will be logged, and the JSON
+message is rendered only when a handler actually emits the record. Handlers
+that want the raw fields can read `record.request_fields`.
+
+The one-time `SESSION_COOKIE_DOMAIN` mismatch warning is also checked here,
+once per request host instead of on every request.
+"""
+import json
+import logging
+import random
+import time
+
+from flask import g, request
+
+from utils.endpoint_registry import endpoint_meta
+
+request_logger = logging.getLogger('unda.request')
+
+# Distinct hosts checked against SESSION_COOKIE_DOMAIN before giving up caching
+_MAX_CHECKED_HOSTS = 100
+
+
+class StructuredMessage:
+    """Log message that renders its fields as JSON only when formatted."""
+
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, default=str, separators=(',', ':'))
+
+
+def _always_logged(status, path):
+    return status >= 500 or (status in (401, 403) and path.startswith('/api'))
+
+
+def _request_fields(app, response, duration):
+    from flask_login import current_user
+
+    endpoint = request.endpoint
+    meta = endpoint_meta(app, endpoint)
+    authenticated = bool(getattr(current_user, 'is_authenticated', False))
+    return {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 2),
+        'authenticated': authenticated,
+        'role': getattr(current_user, 'role', None) if authenticated else None,
+        'auth_header': 'Authorization' in request.headers,
+        'cookies': sorted(request.cookies.keys()),
+        'csrf_exempt': meta.csrf_exempt if meta else False,
+        'auth_mode': meta.auth if meta else None,
+    }
+
+
+def _cookie_domain_checker(app):
+    checked_hosts = set()
+
+    def check():
+        cookie_domain = app.config.get('SESSION_COOKIE_DOMAIN')
+        if not cookie_domain:
+            return
+        host = request.host.split(':')[0] if request.host else ''
+        if host in checked_hosts or len(checked_hosts) >= _MAX_CHECKED_HOSTS:
+            return
+        checked_hosts.add(host)
+        # Platform health checks don't use the primary cookie domain
+        if not host or host.endswith('.onrender.com'):
+            return
+        norm = cookie_domain[1:] if cookie_domain.startswith('.') else cookie_domain
+        if not (host == norm or host.endswith('.' + norm)):
+            app.logger.warning(
+                'SESSION_COOKIE_DOMAIN is set to "%s" but request host is "%s" - this may prevent browsers '
+                'from sending session cookies and cause CSRF/401 errors.', cookie_domain, host,
+            )
+
+    return check
+
+
+def init_request_logging(app):
+    """Install the sampled request logger on `app`."""
+    sample_rate = float(app.config.get('REQUEST_LOG_SAMPLE_RATE', 0.0))
+    level = logging.getLevelName(str(app.config.get('REQUEST_LOG_LEVEL', 'INFO')).upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    if request_logger.level == logging.NOTSET:
+        request_logger.setLevel(level)
+    check_cookie_domain = _cookie_domain_checker(app)
+
+    @app.before_request
+    def start_request_log():
+        check_cookie_domain()
+        g._request_log_started = time.perf_counter()
+        g._request_log_sampled = sample_rate > 0 and random.random() < sample_rate
+
+    @app.after_request
+    def emit_request_log(response):
+        started = g.pop('_request_log_started', None)
+        if started is None:
+            return response
+        if _always_logged(response.status_code, request.path):
+            record_level = logging.WARNING
+        elif g.pop('_request_log_sampled', False):
+            record_level = level
+        else:
+            return response
+        if not request_logger.isEnabledFor(record_level):
+            return response
+
+        try:
+            fields = _request_fields(app, response, time.perf_counter() - started)
+            request_logger.log(record_level, '%s', StructuredMessage(fields), extra={'request_fields': fields})
+        except Exception:
+            app.logger.exception('Failed to log request')
+        return response
@@ -0,0 +1,151 @@
+"""Per-request SQL instrumentation.
+
+Counts the statements a request issues, sums their execution time and keeps
+the slowest one. At the end of the request the figures are exported as
+Prometheus histograms labeled by endpoint, added as a `Server-Timing` header
+outside production, and statements slower than `SQL_SLOW_QUERY_MS` are
+written (sampled by `SQL_SLOW_QUERY_SAMPLE_RATE`) to the `sql.slow` logger
+with their normalized SQL and the application frame that issued them.
+"""
+import logging
+import os
+import random
+import re
+import time
+import traceback
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_logger = logging.getLogger('sql.slow')
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement: str) -> str:
+    """Collapse a statement to a stable shape for grouping slow-query logs.
+
+    Literals become `?`, IN lists become `IN (...)` and whitespace is folded,
+    so the same query with different arguments normalizes identically.
+    """
+    sql = _STRING_LITERAL.sub('?', statement)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def _call_site():
+    """Return `path:line in func` for the innermost application frame."""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename == _THIS_FILE or not filename.startswith(_PROJECT_ROOT):
+            continue
+        if 'site-packages' in filename:
+            continue
+        return f'{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    return g.get('_sql_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_sql_start_times', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('_sql_start_times')
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+
+    stats = _request_stats()
+    if stats is None:
+        return
+    stats['count'] += 1
+    stats['time'] += elapsed
+    if elapsed > stats['slowest']:
+        stats['slowest'] = elapsed
+
+    if elapsed * 1000 >= stats['slow_ms'] and random.random() < stats['sample_rate']:
+        slow_query_logger.warning(
+            'Slow query: endpoint=%s duration_ms=%.1f call_site=%s sql=%s',
+            request.endpoint, elapsed * 1000, _call_site(), normalize_sql(statement),
+        )
+
+
+def _handle_error(exception_context):
+    # A statement that raised never reaches after_cursor_execute; drop its
+    # start time so it is not paired with the connection's next statement
+    conn = exception_context.connection
+    if conn is None or exception_context.statement is None:
+        return
+    start_times = conn.info.get('_sql_start_times')
+    if start_times:
+        start_times.pop()
+
+
+def _register_engine_listeners():
+    # Listeners are attached to the Engine class once per process so every
+    # app instance (and engine) created by the factory is covered.
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+
+def init_sql_instrumentation(app):
+    """Wire per-request SQL statistics, metrics and headers into `app`."""
+    if not app.config.get('SQL_INSTRUMENTATION_ENABLED', True):
+        return
+
+    from metrics import track_request_timing
+
+    slow_ms = float(app.config.get('SQL_SLOW_QUERY_MS', 250))
+    sample_rate = float(app.config.get('SQL_SLOW_QUERY_SAMPLE_RATE', 0.1))
+    server_timing = app.config.get('SQL_SERVER_TIMING', os.environ.get('FLASK_ENV') != 'production')
+
+    _register_engine_listeners()
+
+    @app.before_request
+    def start_sql_stats():
+        g._request_started = time.perf_counter()
+        g._sql_stats = {
+            'count': 0, 'time': 0.0, 'slowest': 0.0,
+            'slow_ms': slow_ms, 'sample_rate': sample_rate,
+        }
+
+    @app.after_request
+    def record_sql_stats(response):
+        stats = g.pop('_sql_stats', None)
+        started = g.pop('_request_started', None)
+        if stats is None or started is None:
+            return response
+        duration = time.perf_counter() - started
+        endpoint = request.endpoint or 'unknown'
+        try:
+            track_request_timing(
+                endpoint, request.method, duration,
+                stats['count'], stats['time'], stats['slowest'],
+            )
+        except Exception:
+            app.logger.exception('Failed to record request timing metrics')
+
+        if server_timing:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={stats["time"] * 1000:.1f};desc="{stats["count"]} queries", '
+                f'db-slowest;dur={stats["slowest"] * 1000:.1f}, '
+                f'app;dur={duration * 1000:.1f}',
+            )
+        return response
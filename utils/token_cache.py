@@ -0,0 +1,191 @@
+"""Shared cache for short-lived OAuth access tokens.
+
+`TokenCache.get(name, fetch)` returns a cached token, calling `fetch()` only
+when none is cached or the cached one is within `refresh_margin` seconds of
+expiry. `fetch` returns `(token, expires_in_seconds)`.
+
+Tokens live in Redis (`REDIS_URL`) so every gunicorn worker and Celery
+process shares one, plus a per-process copy that saves the Redis round trip.
+Refreshes are single-flight: a process takes a short Redis lock before
+fetching. Others keep using the still-valid token, or wait briefly for the
+new one if theirs has already expired. Within a process a thread lock plays
+the same role.
+
+If Redis is unreachable the cache falls back to the per-process copy and
+retries Redis after `redis_retry_after` seconds.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+
+from utils.redis_client import LazyRedis
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    def __init__(self, redis_url=None, prefix='oauth_token', refresh_margin=300,
+                 lock_timeout=10, wait_timeout=5, redis_retry_after=30):
+        self.prefix = prefix
+        self.refresh_margin = refresh_margin
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self._local = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._redis = LazyRedis('Token cache', redis_url, retry_after=redis_retry_after)
+
+    # -- public API ------------------------------------------------------
+
+    def get(self, name, fetch):
+        """Return a valid token for `name`, refreshing it with `fetch` if needed."""
+        entry = self._local.get(name)
+        if self._fresh(entry):
+            return entry['token']
+
+        with self._lock_for(name):
+            # Another thread may have refreshed while we waited
+            entry = self._local.get(name)
+            if self._fresh(entry):
+                return entry['token']
+
+            shared = self._redis_get(name)
+            if self._fresh(shared):
+                self._local[name] = shared
+                return shared['token']
+            if self._valid(shared) and not self._valid(entry):
+                entry = shared
+
+            return self._refresh(name, fetch, entry)
+
+    def invalidate(self, name):
+        """Forget the token for `name`, e.g. after the API rejected it."""
+        self._local.pop(name, None)
+        client = self._client()
+        if client is None:
+            return
+        try:
+            client.delete(self._key(name))
+        except Exception:
+            self._mark_redis_down()
+
+    # -- refresh ---------------------------------------------------------
+
+    def _refresh(self, name, fetch, current):
+        client = self._client()
+        lock_id = None
+        if client is not None:
+            lock_id = self._acquire(client, name)
+            if lock_id is False:
+                lock_id = None
+                # Someone else is fetching
+                if self._valid(current):
+                    return current['token']
+                shared = self._wait_for_token(client, name)
+                if shared is not None:
+                    self._local[name] = shared
+                    return shared['token']
+                # Holder is slow or gone; fetch ourselves rather than fail
+
+        try:
+            try:
+                token, expires_in = fetch()
+            except Exception:
+                if self._valid(current):
+                    logger.warning('Token refresh for %s failed; using the current token until it expires', name,
+                                   exc_info=True)
+                    return current['token']
+                raise
+            entry = {'token': token, 'expires_at': time.time() + int(expires_in)}
+            self._local[name] = entry
+            self._redis_set(name, entry, int(expires_in))
+            return token
+        finally:
+            if lock_id is not None:
+                self._release(client, name, lock_id)
+
+    def _wait_for_token(self, client, name):
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            shared = self._redis_get(name)
+            if self._valid(shared):
+                return shared
+            try:
+                if not client.exists(self._lock_key(name)):
+                    # Holder gave up without storing a token
+                    return None
+            except Exception:
+                self._mark_redis_down()
+                return None
+        return None
+
+    # -- helpers ---------------------------------------------------------
+
+    def _fresh(self, entry):
+        return entry is not None and time.time() < entry['expires_at'] - self.refresh_margin
+
+    @staticmethod
+    def _valid(entry):
+        return entry is not None and time.time() < entry['expires_at']
+
+    def _lock_for(self, name):
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+
+    def _lock_key(self, name):
+        return f'{self.prefix}:{name}:lock'
+
+    def _client(self):
+        return self._redis.get()
+
+    def _mark_redis_down(self):
+        self._redis.mark_down()
+
+    def _redis_get(self, name):
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            raw = client.get(self._key(name))
+        except Exception:
+            self._mark_redis_down()
+            return None
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _redis_set(self, name, entry, expires_in):
+        client = self._client()
+        if client is None:
+            return
+        try:
+            client.set(self._key(name), json.dumps(entry), ex=max(expires_in, 1))
+        except Exception:
+            self._mark_redis_down()
+
+    def _acquire(self, client, name):
+        """Return a lock id, False if another process holds the lock, or None if Redis is down."""
+        lock_id = uuid.uuid4().hex
+        try:
+            if client.set(self._lock_key(name), lock_id, nx=True, ex=self.lock_timeout):
+                return lock_id
+        except Exception:
+            self._mark_redis_down()
+            return None
+        return False
+
+    def _release(self, client, name, lock_id):
+        try:
+            if client.get(self._lock_key(name)) == lock_id:
+                client.delete(self._lock_key(name))
+        except Exception:
+            self._mark_redis_down()